@@ -11,14 +11,23 @@ import datetime
 from typing import List, Optional, Dict, Any, AsyncGenerator
 from pydantic import BaseModel, Field
 from enum import Enum
-from google import genai
+from services.genai_service import generate_structured
+from services.scheduler import Lane, run_in_lane
+from services.tracing import tracer, traced
 
 from agents.plan_agent import StudyPlan
+from router import syllabus_catalog
+from services.syllabus_catalog import normalize as normalize_topic
 from agents.tutor_agent import stream_explanation, generate_explanation
 from agents.quiz_agent import generate_quiz, evaluate_answer, Question, DifficultyLevel
 from agents.misconception_agent import analyze_and_bust_misconception
 
 
+# UI pacing between steps so the frontend can render each one
+AUTOPILOT_LESSON_PAUSE_SECONDS = float(os.getenv("AUTOPILOT_LESSON_PAUSE_SECONDS", "0.5"))
+AUTOPILOT_TOPIC_PAUSE_SECONDS = float(os.getenv("AUTOPILOT_TOPIC_PAUSE_SECONDS", "1"))
+
+
 class AutopilotAction(str, Enum):
     """Types of actions the autopilot can take."""
     SESSION_STARTED = "session_started"
@@ -111,7 +120,6 @@ class AutopilotEngine:
     
     def __init__(self, session: AutopilotSession):
         self.session = session
-        self.client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
         self._running = False
         self._paused = False
         
@@ -119,6 +127,7 @@ class AutopilotEngine:
         self.waiting_event = asyncio.Event()
         self.user_answer_index: Optional[int] = None
 
+    @traced("autopilot.wait_for_answer")
     async def wait_for_answer(self, timeout_seconds: int = 60) -> int:
         """Pause execution until the user submits an answer or timeout."""
         self.session.awaiting_input = True
@@ -132,6 +141,7 @@ class AutopilotEngine:
             await asyncio.wait_for(self.waiting_event.wait(), timeout=timeout_seconds)
         except asyncio.TimeoutError:
             print("[AUTOPILOT] Answer timeout - skipping question")
+            tracer.current_span().set_attribute("app.timed_out", True)
             self.session.awaiting_input = False
             return -1  # -1 means timeout/skip
         
@@ -144,28 +154,6 @@ class AutopilotEngine:
         self.user_answer_index = answer_index
         self.waiting_event.set()
     
-    async def _retry_operation(self, operation, *args, **kwargs):
-        """Retry an async operation with exponential backoff."""
-        max_retries = 5
-        base_delay = 2
-        
-        for attempt in range(max_retries):
-            try:
-                return await operation(*args, **kwargs)
-            except Exception as e:
-                # Check for 503 or 429 errors (overloaded/rate limit)
-                error_str = str(e)
-                if "503" in error_str or "429" in error_str or "overloaded" in error_str:
-                    if attempt == max_retries - 1:
-                        raise e
-                    
-                    delay = base_delay * (2 ** attempt)
-                    print(f"[AUTOPILOT] Model overloaded. Retrying in {delay}s... (Attempt {attempt + 1}/{max_retries})")
-                    await asyncio.sleep(delay)
-                else:
-                    raise e
-
-    
     def log_step(
         self,
         action: AutopilotAction,
@@ -184,6 +172,7 @@ class AutopilotEngine:
         self.session.steps.append(step)
         return step
     
+    @traced("autopilot.select_next_topic")
     async def select_next_topic(self) -> Optional[str]:
         """Use AI to select the next topic based on mastery and plan."""
         if not self.session.study_plan:
@@ -200,6 +189,11 @@ class AutopilotEngine:
                         all_topics.append(t.get("name", str(t)))
                     else:
                         all_topics.append(str(t))
+        # Revisited topics appear once (first spelling wins)
+        unique: Dict[str, str] = {}
+        for t in all_topics:
+            unique.setdefault(normalize_topic(t), t)
+        all_topics = list(unique.values())
         
         if not all_topics:
             return None
@@ -232,25 +226,23 @@ Return your decision using the response schema.
         
         start_time = datetime.datetime.now()
         
-        async def _call_genai():
-            return await self.client.aio.models.generate_content(
-                model=os.getenv("GEMINI_MODEL", "gemini-3-flash-preview"),
-                contents=prompt,
-                config={
-                    "response_mime_type": "application/json",
-                    "response_schema": TopicSelection,
-                }
-            )
-
-        response = await self._retry_operation(_call_genai)
-        
-        selection = response.parsed
+        # Transient errors are retried (with backoff and a breaker) by the shared client
+        selection = await generate_structured(
+            prompt,
+            TopicSelection,
+            model=os.getenv("GEMINI_MODEL", "gemini-3-flash-preview"),
+            agent="autopilot.select_next_topic",
+            accept=lambda s: s.selected_topic in all_topics,
+            hedge=True,
+        )
         duration = int((datetime.datetime.now() - start_time).total_seconds() * 1000)
+        tracer.current_span().set_attributes({"app.topic": selection.selected_topic, "app.candidate_topics": len(all_topics)})
         
         self.log_step(
             action=AutopilotAction.TOPIC_SELECTED,
             data={
                 "topic": selection.selected_topic,
+                "syllabus_topic_id": self._syllabus_topic_id(selection.selected_topic),
                 "priority_score": selection.priority_score,
                 "difficulty": selection.estimated_difficulty
             },
@@ -260,9 +252,17 @@ Return your decision using the response schema.
         
         return selection.selected_topic
     
+    def _syllabus_topic_id(self, topic: str) -> Optional[str]:
+        """Catalog ID of the registry topic a plan topic belongs to, if recognised."""
+        scope = syllabus_catalog.resolve_scope(self.session.exam_type.lower())
+        match = syllabus_catalog.match(topic, scope) if scope else None
+        return match.id if match else None
+    
+    @traced("autopilot.teach_micro_lesson")
     async def teach_micro_lesson(self, topic: str, lesson_num: int) -> str:
         """Teach a focused micro-lesson on the topic."""
         self.session.current_phase = "teaching"
+        tracer.current_span().set_attributes({"app.topic": topic, "app.lesson_number": lesson_num})
         
         start_time = datetime.datetime.now()
         
@@ -275,10 +275,7 @@ Return your decision using the response schema.
         # Use the tutor agent
         context = f"Exam: {self.session.exam_type}. This is micro-lesson {lesson_num}/2."
         
-        async def _call_tutor():
-            return await generate_explanation(topic, context, "medium")
-
-        explanation = await self._retry_operation(_call_tutor)
+        explanation = await generate_explanation(topic, context, "medium")
         
         # Build rich content for UI display (not just intuition)
         if explanation:
@@ -316,9 +313,11 @@ Return your decision using the response schema.
         
         return explanation.intuition if explanation else ""
     
+    @traced("autopilot.run_quiz")
     async def run_quiz(self, topic: str) -> Dict[str, Any]:
         """Generate and run a quiz, returning results."""
         self.session.current_phase = "quizzing"
+        tracer.current_span().set_attribute("app.topic", topic)
         
         start_time = datetime.datetime.now()
         context = f"Exam: {self.session.exam_type}"
@@ -327,16 +326,13 @@ Return your decision using the response schema.
         mastery = self.session.topic_mastery.get(topic, TopicMastery(topic=topic))
         previous_mistakes = mastery.misconceptions[:3] if mastery.misconceptions else None
         
-        async def _call_quiz():
-            return await generate_quiz(
-                topic=topic,
-                context=context,
-                num_questions=3,
-                difficulty=DifficultyLevel.MEDIUM,
-                previous_mistakes=previous_mistakes
-            )
-
-        quiz = await self._retry_operation(_call_quiz)
+        quiz = await generate_quiz(
+            topic=topic,
+            context=context,
+            num_questions=3,
+            difficulty=DifficultyLevel.MEDIUM,
+            previous_mistakes=previous_mistakes
+        )
         
         duration = int((datetime.datetime.now() - start_time).total_seconds() * 1000)
         
@@ -357,6 +353,7 @@ Return your decision using the response schema.
             "questions": [q.model_dump() for q in quiz.questions] if quiz else []
         }
     
+    @traced("autopilot.analyze_quiz_results")
     async def analyze_quiz_results(
         self,
         topic: str,
@@ -365,6 +362,7 @@ Return your decision using the response schema.
     ) -> Dict[str, Any]:
         """Analyze quiz results and update mastery."""
         self.session.current_phase = "analyzing"
+        tracer.current_span().set_attributes({"app.topic": topic, "app.questions": len(questions)})
         
         correct = 0
         misconceptions_found = []
@@ -389,14 +387,11 @@ Return your decision using the response schema.
                 
                 # Use misconception agent
                 try:
-                    async def _call_misconception():
-                        return await analyze_and_bust_misconception(
-                            question=question,
-                            wrong_answer_index=answer,
-                            topic_context=f"Topic: {topic}. Exam: {self.session.exam_type}"
-                        )
-
-                    analysis = await self._retry_operation(_call_misconception)
+                    analysis = await analyze_and_bust_misconception(
+                        question=question,
+                        wrong_answer_index=answer,
+                        topic_context=f"Topic: {topic}. Exam: {self.session.exam_type}"
+                    )
                     
                     duration = int((datetime.datetime.now() - start_time).total_seconds() * 1000)
                     
@@ -516,7 +511,7 @@ Return your decision using the response schema.
                     break
                 await self.teach_micro_lesson(topic, lesson_num)
                 yield self.session.steps[-1]  # Yield the lesson completed step
-                await asyncio.sleep(0.5)  # Small delay for UI updates
+                await asyncio.sleep(AUTOPILOT_LESSON_PAUSE_SECONDS)  # Small delay for UI updates
             
             if not self._running or self._paused:
                 continue
@@ -549,7 +544,7 @@ Return your decision using the response schema.
             self.session.topics_completed += 1
             
             # Brief pause before next topic
-            await asyncio.sleep(1)
+            await asyncio.sleep(AUTOPILOT_TOPIC_PAUSE_SECONDS)
         
         # Session complete
         self.session.status = "completed"
@@ -625,18 +620,24 @@ async def start_autopilot(
     # where frontend gets "idle" and stops polling
     session.status = "running"
     
-    asyncio.create_task(_run_session_background(session_id, engine))
+    # Autopilot work is background load: every model call it makes queues behind interactive traffic
+    with run_in_lane(Lane.BACKGROUND):
+        asyncio.create_task(_run_session_background(session_id, engine))
     
     return session
 
 
 async def _run_session_background(session_id: str, engine: AutopilotEngine):
     """Run the session in background and store steps."""
+    # The task inherits the start request's context, so this span joins that request's trace
     try:
         print(f"[AUTOPILOT] Starting background session: {session_id}")
-        async for step in engine.run_session():
-            # Steps are automatically added to session.steps in the engine
-            print(f"[AUTOPILOT] Step: {step.action.value} - {step.reasoning[:50]}...")
+        with tracer.span("autopilot.session", {"app.session_id": session_id}) as span:
+            async for step in engine.run_session():
+                # Steps are automatically added to session.steps in the engine
+                print(f"[AUTOPILOT] Step: {step.action.value} - {step.reasoning[:50]}...")
+                span.add_event(step.action.value, duration_ms=step.duration_ms)
+            span.set_attribute("app.topics_completed", engine.session.topics_completed)
     except Exception as e:
         print(f"[AUTOPILOT] ERROR in session {session_id}: {e}")
         import traceback
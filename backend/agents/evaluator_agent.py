@@ -5,9 +5,9 @@ Provides personalized recommendations and tracks mastery progression.
 """
 
 import os
-from google import genai
 from pydantic import BaseModel, Field
 from typing import List, Optional
+from services.genai_service import generate_structured, generate_text
 
 
 # --- Schemas ---
@@ -72,8 +72,6 @@ async def analyze_performance(
     Returns:
         PerformanceAnalysis: Comprehensive analysis with recommendations
     """
-    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    
     # Format quiz results
     results_text = "\n".join([
         f"Q: {a.question_text}\n"
@@ -103,16 +101,13 @@ ANALYSIS REQUIREMENTS:
 5. Be encouraging - focus on growth mindset
 """
 
-    response = await client.aio.models.generate_content(
+    return await generate_structured(
+        prompt,
+        PerformanceAnalysis,
         model=os.getenv("GEMINI_MODEL", "gemini-2.5-pro-preview-05-06"),
-        contents=prompt,
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": PerformanceAnalysis,
-        }
+        agent="evaluator.analyze_performance",
+        cache=True,
     )
-    
-    return response.parsed
 
 
 # --- Progress Tracker ---
@@ -125,8 +120,6 @@ async def generate_progress_report(
     """
     Generate a comprehensive progress report across all sessions.
     """
-    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    
     # This would aggregate data from multiple sessions
     # For MVP, we'll return a simplified analysis
     
@@ -143,12 +136,13 @@ Include:
 4. Suggested focus for remaining days
 """
 
-    response = await client.aio.models.generate_content(
+    report = await generate_text(
+        prompt,
         model=os.getenv("GEMINI_MODEL", "gemini-2.5-pro-preview-05-06"),
-        contents=prompt
+        agent="evaluator.progress_report",
     )
     
-    return {"report": response.text}
+    return {"report": report}
 
 
 # --- Test ---
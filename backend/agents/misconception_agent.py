@@ -5,9 +5,9 @@ Triggered when a student gets a quiz question wrong to provide deep conceptual r
 """
 
 import os
-from google import genai
 from pydantic import BaseModel, Field
 from typing import List, Optional
+from services.genai_service import generate_structured
 from agents.quiz_agent import Question, DifficultyLevel, QuestionType
 
 class MisconceptionAnalysis(BaseModel):
@@ -26,8 +26,6 @@ async def analyze_and_bust_misconception(
     """
     Diagnose the reasoning for a wrong answer and provide a specific counter-example.
     """
-    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    
     student_choice = question.options[wrong_answer_index]
     correct_choice = question.options[question.correct_option_index]
     
@@ -51,13 +49,9 @@ TASK:
 Use the response schema for structured output.
 """
 
-    response = await client.aio.models.generate_content(
+    return await generate_structured(
+        prompt,
+        MisconceptionAnalysis,
         model=os.getenv("GEMINI_MODEL", "gemini-3-flash-preview"),
-        contents=prompt,
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": MisconceptionAnalysis,
-        }
+        agent="misconception.analyze_and_bust",
     )
-
-    return response.parsed
@@ -5,10 +5,50 @@ Uses Pydantic models to guarantee valid JSON output from the LLM.
 """
 
 import os
+import re
+import json
+import math
+import asyncio
+import hashlib
+import functools
 from pydantic import BaseModel, Field
-from typing import List, Optional, AsyncGenerator
-from services.genai_service import client
-from router import route_request, get_safe_syllabus
+from typing import AsyncIterator, Dict, FrozenSet, List, Optional, AsyncGenerator, Set, Tuple, Union
+from pydantic import ValidationError
+from services.genai_service import generate_structured, stream_text
+from services.json_stream import ArrayItemStream
+from services.plan_cache import plan_cache, make_plan_cache_key
+from services.speculation import Speculator, SpeculativeTask
+from services.event_jobs import EventJobRunner
+from services.metrics import metrics
+from router import RouteDecision, route_request, route_needs_model, get_safe_syllabus, syllabus_catalog
+from services.syllabus_catalog import CatalogTopic
+from agents.syllabus_agent import prepare_syllabus
+
+
+# Start the first draft from the caller's syllabus while the model router is still running
+PLAN_SPECULATIVE_DRAFT = os.getenv("PLAN_SPECULATIVE_DRAFT", "1") == "1"
+# Share of a registry subject's vocabulary a syllabus must contain to count as covering it
+PLAN_SPECULATION_MIN_OVERLAP = float(os.getenv("PLAN_SPECULATION_MIN_OVERLAP", "0.15"))
+
+draft_speculation = Speculator("plan_draft", enabled=PLAN_SPECULATIVE_DRAFT)
+
+# Streamed plan generations run as jobs, so clients can reconnect and resume
+plan_jobs = EventJobRunner("plan")
+
+# Fix loop: "patch" edits only the days the verifier flagged, "full" regenerates the whole plan
+PLAN_REPAIR_MODE = os.getenv("PLAN_REPAIR_MODE", "patch")
+# Repairs touching more days than this (or half the plan) regenerate the whole plan instead
+PLAN_REPAIR_MAX_DAYS = int(os.getenv("PLAN_REPAIR_MAX_DAYS", "6"))
+
+# Mechanical checks run before the model auditor; a plan failing them goes straight to the fix step
+PLAN_LOCAL_VERIFY = os.getenv("PLAN_LOCAL_VERIFY", "1") == "1"
+# "required": the model auditor still reviews plans that pass the local checks; "optional": it is skipped
+# unless the local checks could not find some registry topics by name
+PLAN_LLM_VERIFY = os.getenv("PLAN_LLM_VERIFY", "required")
+MAX_DAILY_HOURS = 8
+
+plan_verifications = metrics.counter(
+    "plan_verifications_total", "Plan verification passes by what decided them (local, model).", ("decided_by", "valid"))
 
 
 # --- Strict Output Schemas (Gemini 3 Structured Outputs) ---
@@ -34,6 +74,12 @@ class StudyPlan(BaseModel):
     critical_topics: List[str] = Field(description="Top 3-5 most important topics to focus on")
 
 
+class PlanPatch(BaseModel):
+    """Schema for a day-level repair: replacements for the days that change."""
+    updated_days: List[DailyPlan] = Field(description="Complete replacement for each editable day that changes, keeping its day number; omit unchanged days")
+    summary: str = Field(description="One or two sentences on what was changed")
+
+
 class PlanVerification(BaseModel):
     """Schema for the Plan Verifier's critique."""
     is_valid: bool = Field(description="True if the plan fulfills all syllabus requirements and constraints")
@@ -45,16 +91,8 @@ class PlanVerification(BaseModel):
 
 # --- The Plan Agent ---
 
-async def generate_study_plan(
-    syllabus_text: str,
-    exam_type: str,
-    goal: str,
-    days: int = 7
-) -> StudyPlan:
-    """Generate a structured study plan (Legacy/Draft version)."""
-    # client imported from services
-    
-    prompt = f"""
+def _draft_prompt(syllabus_text: str, exam_type: str, goal: str, days: int) -> str:
+    return f"""
 You are an expert exam strategist specializing in {exam_type} preparation.
 Create a {days}-day study plan optimized for this student's goal.
 
@@ -73,28 +111,182 @@ INSTRUCTIONS:
 6. Identify the 3-5 most critical topics that will have the highest impact
 """
 
+
+async def generate_study_plan(
+    syllabus_text: str,
+    exam_type: str,
+    goal: str,
+    days: int = 7
+) -> StudyPlan:
+    """Generate a structured study plan (Legacy/Draft version)."""
+    # client imported from services
+    
+    # Long syllabi are condensed to a topic tree instead of being cut at the prompt slice
+    syllabus_text = await prepare_syllabus(syllabus_text, exam_type)
+    prompt = _draft_prompt(syllabus_text, exam_type, goal, days)
+
     # Use aio for async generation
-    response = await client.aio.models.generate_content(
+    return await generate_structured(
+        prompt,
+        StudyPlan,
         model=os.getenv("GEMINI_MODEL", "gemini-3-pro-preview"),
-        contents=prompt,
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": StudyPlan,
-        }
+        agent="plan.generate_study_plan",
     )
-    
-    return response.parsed
+
+
+async def stream_study_plan(
+    syllabus_text: str,
+    exam_type: str,
+    goal: str,
+    days: int = 7
+) -> AsyncGenerator[Union[DailyPlan, StudyPlan], None]:
+    """
+    Draft a plan as a streamed JSON response.
+
+    Yields each DailyPlan as soon as its object is complete in the stream,
+    then the validated StudyPlan. If the streamed document does not
+    validate, the plan comes from a regular structured call instead.
+    """
+    syllabus_text = await prepare_syllabus(syllabus_text, exam_type)
+    prompt = _draft_prompt(syllabus_text, exam_type, goal, days)
+    parser = ArrayItemStream("schedule")
+    async for chunk in stream_text(
+        prompt,
+        model=os.getenv("GEMINI_MODEL", "gemini-3-pro-preview"),
+        agent="plan.stream_study_plan",
+        config={"response_mime_type": "application/json", "response_schema": StudyPlan},
+    ):
+        for item in parser.feed(chunk):
+            try:
+                yield DailyPlan.model_validate(item)
+            except ValidationError:
+                pass  # Reported by the full validation below
+
+    try:
+        yield StudyPlan.model_validate_json(parser.text)
+    except ValidationError as e:
+        print(f"⚠️ Streamed draft did not validate, falling back to a structured call: {e.error_count()} errors")
+        yield await generate_study_plan(syllabus_text, exam_type, goal, days)
+
+
+class _DraftStream:
+    """
+    Runs a streamed draft in the background and buffers its days, so the
+    endpoint can start following it later (a speculative draft) and still
+    see every day from the first.
+    """
+
+    def __init__(self, stream: AsyncIterator[Union[DailyPlan, StudyPlan]]):
+        self._stream = stream
+        self.days: List[DailyPlan] = []
+        self.plan: Optional[StudyPlan] = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        event, self._changed = self._changed, asyncio.Event()
+        event.set()
+
+    async def run(self) -> None:
+        try:
+            async for item in self._stream:
+                if isinstance(item, DailyPlan):
+                    self.days.append(item)
+                else:
+                    self.plan = item
+                self._notify()
+        except Exception as e:
+            # Kept for follow(); the task itself finishes cleanly
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    async def follow(self) -> AsyncGenerator[Union[DailyPlan, StudyPlan], None]:
+        """Yield the buffered days, then live ones, then the plan (or raise the draft's error)."""
+        index = 0
+        while True:
+            changed = self._changed
+            while index < len(self.days):
+                yield self.days[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                yield self.plan
+                return
+            await changed.wait()
+
+
+def _plan_outline(plan: StudyPlan) -> str:
+    """One line per day (hours, theme, topic names): enough context without the rationales."""
+    return "\n".join(
+        f"Day {d.day} ({d.estimated_hours}h) {d.theme}: " + "; ".join(t.name for t in d.topics)
+        for d in plan.schedule
+    )
+
+
+def _issues_text(verification: PlanVerification) -> str:
+    return f"""- Missing topics: {verification.missing_topics}
+- Overloaded days: {verification.overloaded_days}
+- Prerequisite issues: {verification.prerequisite_issues}"""
 
 
 async def verify_study_plan(
     plan: StudyPlan,
     syllabus_text: str,
-    exam_type: str
+    exam_type: str,
+    changed_days: Optional[List[int]] = None,
+    previous: Optional[PlanVerification] = None,
+    coverage_hints: Optional[List[str]] = None
 ) -> PlanVerification:
-    """Verify the study plan against the syllabus and pedagogical best practices."""
+    """Verify the study plan against the syllabus and pedagogical best practices.
+
+    After a day-level repair, pass the changed days and the previous verification
+    to check only whether those issues are fixed and the edited days are sound.
+    coverage_hints are syllabus topics the local checks could not find by name;
+    the full audit decides which of them are really missing.
+    """
     # client imported from services
 
-    prompt = f"""
+    if changed_days and previous is not None:
+        changed = [d.model_dump() for d in plan.schedule if d.day in changed_days]
+        prompt = f"""
+You are an expert Educational Auditor.
+A {exam_type} study plan failed verification, and only the days under CHANGED DAYS were edited to fix it.
+Re-verify it.
+
+PREVIOUS ISSUES:
+{_issues_text(previous)}
+- Critique: {previous.critique}
+
+PLAN OUTLINE (all days):
+{_plan_outline(plan)}
+
+CHANGED DAYS:
+{json.dumps(changed)}
+
+SYLLABUS:
+{syllabus_text[:5000]}
+
+CHECKLIST:
+1. RESOLVED: Is every previous issue fixed? Missing topics must now appear in the outline.
+2. FEASIBILITY: Is any changed day overloaded (>8 hours)?
+3. SEQUENCING: Do the changed days schedule anything before its prerequisites?
+
+Unchanged days passed every other check already. Report only issues that remain or were introduced by the edits.
+If anything is wrong, set is_valid to false and provide a detailed critique.
+"""
+    else:
+        hints = ""
+        if coverage_hints:
+            hints = f"""
+TOPICS NOT FOUND BY NAME (a keyword check found no match in the plan; they may be covered under other names,
+grouped with other topics, or reasonably left out of a plan this short, so report only the ones that are really missing):
+{json.dumps(coverage_hints)}
+"""
+        prompt = f"""
 You are an expert Educational Auditor. 
 Verify the following study plan for a {exam_type} exam against the provided syllabus.
 
@@ -103,7 +295,7 @@ STUDY PLAN:
 
 SYLLABUS:
 {syllabus_text[:5000]}
-
+{hints}
 CHECKLIST:
 1. COVERAGE: Are all major topics from the syllabus included?
 2. FEASIBILITY: Are any days overloaded (>8 hours)?
@@ -113,17 +305,18 @@ CHECKLIST:
 Be critical. If anything is wrong, set is_valid to false and provide a detailed critique.
 """
 
-    response = await client.aio.models.generate_content(
+    return await generate_structured(
+        prompt,
+        PlanVerification,
         model=os.getenv("GEMINI_MODEL", "gemini-3-pro-preview"),
-        contents=prompt,
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": PlanVerification,
-        }
+        agent="plan.verify_study_plan",
+        cache=True,
+        # A rejection with no reasons gives the fix loop nothing to work with
+        accept=lambda v: v.is_valid or bool(
+            v.missing_topics or v.overloaded_days or v.prerequisite_issues or v.critique.strip()
+        ),
     )
 
-    return response.parsed
-
 
 class PlanVersion(BaseModel):
     """A single version of the plan during the self-correction loop."""
@@ -131,6 +324,7 @@ class PlanVersion(BaseModel):
     plan: StudyPlan
     verification: Optional[PlanVerification] = None
     was_accepted: bool = False
+    changed_days: Optional[List[int]] = Field(default=None, description="Days edited by a day-level repair (None: full plan)")
 
 
 class PlanWithHistory(BaseModel):
@@ -140,6 +334,386 @@ class PlanWithHistory(BaseModel):
     total_iterations: int
     self_correction_applied: bool = Field(description="True if plan was modified from v1")
     verification_summary: dict = Field(description="Final verification metrics")
+    cache_key: Optional[str] = Field(default=None, description="plan_cache key this plan is stored under")
+    from_cache: bool = Field(default=False, description="True if served from the plan cache")
+
+
+def _scope_descriptor(route: Optional[RouteDecision], syllabus_text: str) -> str:
+    """Describe the syllabus scope a plan was built for (part of the plan cache key)."""
+    if route is None:
+        # Routing failed, so the caller-supplied syllabus defines the scope
+        return "syllabus:" + hashlib.sha256(syllabus_text.encode()).hexdigest()[:16]
+    return f"{route.exam.value}/{route.scope.subject}/{route.scope.sub_subject or ''}"
+
+
+async def _route_and_scope(goal: str, exam_type: str, syllabus_text: str) -> Tuple[Optional[RouteDecision], str, str]:
+    """Route the request and narrow goal and syllabus to its scope (unchanged inputs if routing fails)."""
+    # We use the 'goal' as the primary user input for intent/routing
+    try:
+        route = await route_request(goal, current_exam_context=exam_type)
+        print(f"🧭 Routed: Intent={route.intent}, Exam={route.exam}, Scope={route.scope.subject}")
+        
+        # Guard: Check if clarification is needed
+        if route.needs_clarification:
+            # For now, we log it. In a full implementation, we would return a clarification request.
+            print(f"⚠️ Router requested clarification: {route.clarifying_question}")
+
+        # Fetch Scoped Syllabus
+        scoped_syllabus_text = get_safe_syllabus(route)
+        
+        # Inject Scope Constraint into Goal (so we don't break function signatures)
+        if route.scope.subject and route.scope.subject.lower() not in ["all", "general"]:
+             scope_str = f"{route.scope.subject}"
+             if route.scope.sub_subject:
+                 scope_str += f" ({route.scope.sub_subject})"
+             
+             goal = f"""{goal}
+             
+             STRICT CONSTRAINT: Cover ONLY {scope_str}.
+             Do NOT include topics from other subjects outside of {scope_str}.
+             """
+             print(f"🔒 Scope Constraint Applied: {scope_str}")
+        
+        return route, goal, scoped_syllabus_text
+        
+    except Exception as e:
+        print(f"⚠️ Routing failed, falling back to legacy mode: {e}")
+        return None, goal, syllabus_text
+
+
+def _words(text: str) -> Set[str]:
+    return set(re.findall(r"[a-z]{4,}", text.lower()))
+
+
+@functools.lru_cache(maxsize=None)
+def _subject_vocab(exam: str, subject: str) -> FrozenSet[str]:
+    return frozenset(_words(syllabus_catalog.scope_text(exam, subject) or "") - {"syllabus", exam})
+
+
+def _covered_subjects(syllabus_text: str, exam: str) -> Set[str]:
+    """Registry subjects of `exam` that a free-form syllabus covers (by name or vocabulary)."""
+    words = _words(syllabus_text)
+    covered = set()
+    for subject in syllabus_catalog.subjects(exam):
+        vocab = _subject_vocab(exam, subject)
+        if subject in words or (vocab and len(words & vocab) / len(vocab) >= PLAN_SPECULATION_MIN_OVERLAP):
+            covered.add(subject)
+    return covered
+
+
+def _routed_subjects(exam: str, scoped_syllabus_text: str) -> Set[str]:
+    """Registry subjects get_safe_syllabus selected."""
+    scope = syllabus_catalog.scope_of(scoped_syllabus_text)
+    if scope is None or scope[0] != exam:
+        return set()
+    return {scope[1]} if scope[1] else set(syllabus_catalog.subjects(exam))
+
+
+def _speculation_matches(route: Optional[RouteDecision], caller_syllabus_text: str, scoped_syllabus_text: str) -> bool:
+    """
+    True if a draft built from the caller's syllabus also fits the routed scope.
+
+    The scope differs materially when the caller's syllabus covers different
+    subjects than the ones routing selected (e.g. a Physics + Chemistry
+    syllabus for a Physics-only request). Same subjects worded differently are
+    close enough: the verifier checks the draft against the scoped syllabus
+    and the fix loop adds anything missing.
+    """
+    if route is None:
+        return True  # Legacy mode drafts from exactly the caller's inputs
+    exam = route.exam.value
+    routed = _routed_subjects(exam, scoped_syllabus_text)
+    return bool(routed) and _covered_subjects(caller_syllabus_text, exam) == routed
+
+
+async def _draft_plan(
+    speculative: Optional[SpeculativeTask],
+    route: Optional[RouteDecision],
+    caller_syllabus_text: str,
+    syllabus_text: str,
+    exam_type: str,
+    goal: str,
+    days: int
+) -> StudyPlan:
+    """Take the speculative draft if it fits the routed scope, otherwise draft from the scoped inputs."""
+    if speculative is not None:
+        if _speculation_matches(route, caller_syllabus_text, syllabus_text):
+            print("⚡ Using speculative draft (routed scope matches the supplied syllabus)")
+            return await speculative.take()
+        print("🔁 Routed scope differs from the supplied syllabus, redrafting")
+        speculative.discard()
+    return await generate_study_plan(syllabus_text, exam_type, goal, days)
+
+
+# --- Local Plan Checks ---
+
+# Words that say nothing about which topic a registry line is
+_TOPIC_STOPWORDS = {"some", "with", "their", "simple", "applications", "principles", "general", "basic", "concepts"}
+
+
+class LocalPlanCheck(BaseModel):
+    """Result of the mechanical plan checks (no model call)."""
+    schedule_issues: List[str] = Field(default_factory=list)
+    overloaded_days: List[int] = Field(default_factory=list)
+    duplicate_topics: List[str] = Field(default_factory=list)
+    missing_topics: List[str] = Field(default_factory=list, description="Registry topics not found by name (hints for the auditor)")
+    registry_topics: int = Field(default=0, description="Registry topics checked for coverage (0: syllabus is not from the registry)")
+
+    @property
+    def passed(self) -> bool:
+        """No mechanical failure. Missing topics are only hints: a short plan may group or skip them."""
+        return not (self.schedule_issues or self.overloaded_days or self.duplicate_topics)
+
+    def to_verification(self) -> PlanVerification:
+        problems = self.schedule_issues + [
+            f"Day {day} is over {MAX_DAILY_HOURS} hours." for day in self.overloaded_days
+        ] + [
+            f"{name} is scheduled twice on the same day." for name in self.duplicate_topics
+        ]
+        return PlanVerification(
+            is_valid=self.passed,
+            missing_topics=[],
+            overloaded_days=self.overloaded_days,
+            prerequisite_issues=[],
+            critique=" ".join(problems) or "Plan passes the schedule, workload and repeat checks.",
+        )
+
+
+def _registry_topics(syllabus_text: str) -> Optional[List[CatalogTopic]]:
+    """Catalog topics when the syllabus is a registry subject or sub-subject chunk, else None."""
+    scope = syllabus_catalog.scope_of(syllabus_text)
+    # A whole-exam scope is too broad to expect full coverage from one plan
+    if scope is None or scope[1] is None:
+        return None
+    return syllabus_catalog.topics_in(scope)
+
+
+def _stems(text: str) -> Set[str]:
+    return {w[:6] for w in _words(text) - _TOPIC_STOPWORDS}
+
+
+def _check_day(check: LocalPlanCheck, day: DailyPlan) -> None:
+    """Checks that need only one day, so streamed drafts can run them as each day arrives."""
+    if day.estimated_hours > MAX_DAILY_HOURS:
+        check.overloaded_days.append(day.day)
+    names = [t.name.strip().lower() for t in day.topics]
+    check.duplicate_topics.extend(
+        t.name for i, t in enumerate(day.topics) if names.index(names[i]) != i
+    )
+
+
+def local_verify_plan(plan: StudyPlan, syllabus_text: str, days: int) -> LocalPlanCheck:
+    """Check what needs no judgement (schedule shape, daily hours, repeats) and list registry topics not found by name."""
+    check = LocalPlanCheck()
+
+    numbers = [d.day for d in plan.schedule]
+    if plan.total_days != days:
+        check.schedule_issues.append(f"Plan is {plan.total_days} days but {days} were requested.")
+    if len(plan.schedule) != plan.total_days:
+        check.schedule_issues.append(f"Schedule has {len(plan.schedule)} days but total_days is {plan.total_days}.")
+    if numbers != list(range(1, len(numbers) + 1)):
+        check.schedule_issues.append("Days are not numbered 1, 2, 3... in order.")
+
+    for d in plan.schedule:
+        _check_day(check, d)
+
+    topics = _registry_topics(syllabus_text)
+    if topics:
+        check.registry_topics = len(topics)
+        names = [d.theme for d in plan.schedule] + [t.name for d in plan.schedule for t in d.topics] + plan.critical_topics
+        scope = syllabus_catalog.scope_of(syllabus_text)
+        # Plan topics the catalog recognises ("Chemical Kinetics" -> Physical Chemistry)
+        matched = {m.id for m in (syllabus_catalog.match(n, scope) for n in names) if m}
+        covered = _stems(" ".join(names))
+        for topic in topics:
+            stems = _stems(topic.name)
+            # Otherwise most of a topic's distinctive words must appear somewhere in the plan
+            if topic.id not in matched and stems and len(stems & covered) * 2 < len(stems):
+                check.missing_topics.append(topic.name)
+    return check
+
+
+async def _verify_plan(
+    plan: StudyPlan,
+    syllabus_text: str,
+    exam_type: str,
+    days: int,
+    changed_days: Optional[List[int]],
+    previous: Optional[PlanVerification]
+) -> Tuple[PlanVerification, str]:
+    """
+    Local checks first; the model auditor only runs when they cannot decide on their own.
+
+    Only mechanical failures (schedule shape, hours, repeats) reject a plan
+    locally. Registry topics the local checks could not find are passed to the
+    model auditor as hints, since it can tell a topic that is covered under
+    another name, or fairly left out, from one that is missing.
+
+    Returns (verification, decided_by), where decided_by is "local" or "model".
+    `previous` must come from a model audit: only then have the days a repair
+    left unchanged been audited, so re-verifying just the changed days is safe.
+    """
+    hints: List[str] = []
+    if PLAN_LOCAL_VERIFY:
+        local = local_verify_plan(plan, syllabus_text, days)
+        if not local.passed:
+            print(f"📏 Local checks failed, skipping the model audit: {local.to_verification().critique}")
+            plan_verifications.inc(decided_by="local", valid="false")
+            return local.to_verification(), "local"
+        hints = local.missing_topics
+        if PLAN_LLM_VERIFY == "optional" and not hints:
+            print("📏 Local checks passed, model audit is optional")
+            plan_verifications.inc(decided_by="local", valid="true")
+            return local.to_verification(), "local"
+        if hints:
+            print(f"📏 {len(hints)} registry topics not found by name, asking the model auditor")
+
+    verification = await verify_study_plan(plan, syllabus_text, exam_type, changed_days, previous, hints)
+    plan_verifications.inc(decided_by="model", valid=str(verification.is_valid).lower())
+    return verification, "model"
+
+
+def _verification_summary(
+    final_verification: Optional[PlanVerification],
+    final_plan: StudyPlan,
+    syllabus_text: str,
+    days: int,
+    iterations: int
+) -> dict:
+    local = local_verify_plan(final_plan, syllabus_text, days)
+    return {
+        "coverage_percent": 100 - (len(final_verification.missing_topics) * 5) if final_verification else 100,
+        "overloaded_days_count": len(final_verification.overloaded_days) if final_verification else 0,
+        "prerequisite_issues_count": len(final_verification.prerequisite_issues) if final_verification else 0,
+        "is_valid": final_verification.is_valid if final_verification else True,
+        "iterations_used": iterations,
+        "local_checks": {"passed": local.passed, **local.model_dump()},
+    }
+
+
+def _repair_targets(plan: StudyPlan, verification: PlanVerification) -> Optional[List[int]]:
+    """
+    Days a day-level repair may edit, or None when the issues are not local.
+
+    Overloaded days and days holding topics named in a prerequisite issue
+    must change. Missing topics go to the lightest days. A critique with
+    no structured issues, or issues that cannot be tied to a day, needs the
+    whole plan.
+    """
+    days = {d.day for d in plan.schedule}
+    if not (verification.missing_topics or verification.overloaded_days or verification.prerequisite_issues):
+        return None
+    # Patches replace days; adding, removing or renumbering them needs the whole plan
+    if local_verify_plan(plan, "", plan.total_days).schedule_issues:
+        return None
+
+    targets = {day for day in verification.overloaded_days if day in days}
+    for issue in verification.prerequisite_issues:
+        mentioned = {d.day for d in plan.schedule if any(t.name.lower() in issue.lower() for t in d.topics)}
+        if not mentioned:
+            return None
+        targets |= mentioned
+    if verification.missing_topics:
+        lightest = sorted(
+            (d for d in plan.schedule if d.day not in verification.overloaded_days),
+            key=lambda d: d.estimated_hours,
+        )
+        targets |= {d.day for d in lightest[:max(1, math.ceil(len(verification.missing_topics) / 2))]}
+
+    if not targets or len(targets) > min(PLAN_REPAIR_MAX_DAYS, max(1, len(days) // 2)):
+        return None
+    return sorted(targets)
+
+
+def _apply_patch(plan: StudyPlan, patch: PlanPatch, editable: List[int]) -> Tuple[StudyPlan, List[int]]:
+    """Replace the edited days in a copy of the plan; returns it with the days that actually changed."""
+    current: Dict[int, DailyPlan] = {d.day: d for d in plan.schedule}
+    replacements = {
+        d.day: d for d in patch.updated_days
+        if d.day in editable and d.model_dump() != current[d.day].model_dump()
+    }
+    if not replacements:
+        return plan, []
+    schedule = [replacements.get(d.day, d) for d in plan.schedule]
+    return plan.model_copy(update={"schedule": schedule}), sorted(replacements)
+
+
+async def _repair_plan(
+    plan: StudyPlan,
+    verification: PlanVerification,
+    goal: str,
+    syllabus_text: str
+) -> Tuple[StudyPlan, Optional[List[int]]]:
+    """
+    Fix the plan after a failed verification.
+
+    Returns the new plan and the days that changed, or None for the days when
+    the whole plan was regenerated.
+    """
+    targets = _repair_targets(plan, verification) if PLAN_REPAIR_MODE == "patch" else None
+    if targets:
+        editable = [d.model_dump() for d in plan.schedule if d.day in targets]
+        repair_prompt = f"""
+You are an expert exam strategist. Repair the study plan by editing ONLY the days under EDITABLE DAYS.
+
+FIX CRITIQUE:
+{verification.critique}
+
+ISSUES TO FIX:
+{_issues_text(verification)}
+
+ORIGINAL GOAL: {goal}
+SYLLABUS: {syllabus_text[:5000]}
+
+PLAN OUTLINE (all days, for context):
+{_plan_outline(plan)}
+
+EDITABLE DAYS:
+{json.dumps(editable)}
+
+Return a complete replacement for each editable day you change, keeping its day number.
+Place every missing topic into an editable day. Keep every day <= 8 hours.
+Do not drop existing topics unless you move them to another editable day.
+"""
+        try:
+            patch = await generate_structured(
+                repair_prompt,
+                PlanPatch,
+                model=os.getenv("GEMINI_MODEL", "gemini-3-pro-preview"),
+                agent="plan.repair_study_plan",
+            )
+            patched, changed = _apply_patch(plan, patch, targets)
+            if changed:
+                print(f"🩹 Repaired days {changed} instead of regenerating the plan")
+                return patched, changed
+            print("⚠️ Day-level repair changed nothing, regenerating the full plan")
+        except Exception as e:
+            print(f"⚠️ Day-level repair failed, regenerating the full plan: {e}")
+
+    # Fix the plan (self-correction)
+    fix_prompt = f"""
+You are an expert exam strategist. Fix the draft study plan based on the auditor\'s critique.
+
+FIX CRITIQUE:
+{verification.critique}
+
+ISSUES TO FIX:
+{_issues_text(verification)}
+
+ORIGINAL GOAL: {goal}
+SYLLABUS: {syllabus_text[:5000]}
+CURRENT DRAFT: {plan.model_dump_json()}
+
+REGENERATE THE FULL STUDY PLAN INCORPORATING ALL FIXES.
+Do NOT skip any topics. Ensure all days have <= 8 hours.
+"""
+    regenerated = await generate_structured(
+        fix_prompt,
+        StudyPlan,
+        model=os.getenv("GEMINI_MODEL", "gemini-3-pro-preview"),
+        agent="plan.fix_study_plan",
+    )
+    return regenerated, None
 
 
 async def generate_verified_plan(
@@ -173,46 +747,40 @@ async def generate_verified_plan_with_history(
     This is the key "Action Era" feature that shows judges how the AI
     identifies problems and fixes them autonomously.
     """
-    # 1. Route First (The Router Layer)
-    # We use the 'goal' as the primary user input for intent/routing
+    original_goal = goal
+    caller_syllabus_text = syllabus_text
+
+    # 1. Speculative Draft: start drafting from the caller's syllabus while the model router runs.
+    # Local and memoized routes return at once, so the plan cache is checked before any draft.
+    speculative = None
+    if route_needs_model(goal, exam_type):
+        speculative = draft_speculation.start(lambda: generate_study_plan(syllabus_text, exam_type, goal, days))
     try:
-        route = await route_request(goal, current_exam_context=exam_type)
-        print(f"🧭 Routed: Intent={route.intent}, Exam={route.exam}, Scope={route.scope.subject}")
-        
-        # 2. Guard: Check if clarification is needed
-        if route.needs_clarification:
-            # For now, we log it. In a full implementation, we would return a clarification request.
-            print(f"⚠️ Router requested clarification: {route.clarifying_question}")
-            # raise ValueError(f"Clarification needed: {route.clarifying_question}") 
+        # 2. Route and Scope (The Router Layer)
+        route, goal, syllabus_text = await _route_and_scope(goal, exam_type, syllabus_text)
 
-        # 3. Fetch Scoped Syllabus
-        scoped_syllabus_text = get_safe_syllabus(route)
-        
-        # 4. Inject Scope Constraint into Goal (so we don't break function signatures)
-        if route.scope.subject and route.scope.subject.lower() not in ["all", "general"]:
-             scope_str = f"{route.scope.subject}"
-             if route.scope.sub_subject:
-                 scope_str += f" ({route.scope.sub_subject})"
-             
-             goal = f"""{goal}
-             
-             STRICT CONSTRAINT: Cover ONLY {scope_str}.
-             Do NOT include topics from other subjects outside of {scope_str}.
-             """
-             print(f"🔒 Scope Constraint Applied: {scope_str}")
-        
-        # Use the scoped syllabus!
-        syllabus_text = scoped_syllabus_text
-        
-    except Exception as e:
-        print(f"⚠️ Routing failed, falling back to legacy mode: {e}")
+        # 3. Plan Cache: reuse a previously accepted plan for the same request
+        cache_key = make_plan_cache_key(exam_type, _scope_descriptor(route, syllabus_text), days, original_goal)
+        cached = await plan_cache.get(cache_key)
+        if cached:
+            print(f"⚡ Plan cache hit ({cache_key})")
+            result = PlanWithHistory.model_validate(cached)
+            result.from_cache = True
+            return result
+
+        # Iteration 1: Draft
+        print(f"🔄 Generating draft plan for {exam_type}...")
+        # Verification and fixes see the same condensed syllabus as the draft (no-op for short ones)
+        condensed_syllabus_text = await prepare_syllabus(syllabus_text, exam_type)
+        current_plan = await _draft_plan(speculative, route, caller_syllabus_text, syllabus_text, exam_type, goal, days)
+        syllabus_text = condensed_syllabus_text
+    finally:
+        # Cache hits, routing errors and cancellations never use the speculative draft
+        if speculative is not None:
+            speculative.discard("skipped")
 
     versions: List[PlanVersion] = []
     
-    # Iteration 1: Draft
-    print(f"🔄 Generating draft plan for {exam_type}...")
-    current_plan = await generate_study_plan(syllabus_text, exam_type, goal, days)
-    
     # Store v1
     versions.append(PlanVersion(
         version=1,
@@ -222,10 +790,14 @@ async def generate_verified_plan_with_history(
     ))
     
     final_verification = None
+    decided_by = None
+    changed_days: Optional[List[int]] = None
     
     for i in range(max_iterations):
         print(f"🧐 Verifying plan (Iteration {i+1})...")
-        verification = await verify_study_plan(current_plan, syllabus_text, exam_type)
+        # A failure from the local checks never audited the unchanged days, so it gets the full audit
+        audited = final_verification if decided_by == "model" else None
+        verification, decided_by = await _verify_plan(current_plan, syllabus_text, exam_type, days, changed_days, audited)
         
         # Update the last version with its verification
         versions[-1].verification = verification
@@ -239,41 +811,16 @@ async def generate_verified_plan_with_history(
         print(f"❌ Verification failed: {verification.critique}")
         final_verification = verification
         
-        # Fix the plan (self-correction)
-        fix_prompt = f"""
-You are an expert exam strategist. Fix the draft study plan based on the auditor\'s critique.
-
-FIX CRITIQUE:
-{verification.critique}
-
-ISSUES TO FIX:
-- Missing topics: {verification.missing_topics}
-- Overloaded days: {verification.overloaded_days}
-- Prerequisite issues: {verification.prerequisite_issues}
-
-ORIGINAL GOAL: {goal}
-SYLLABUS: {syllabus_text[:5000]}
-CURRENT DRAFT: {current_plan.model_dump_json()}
-
-REGENERATE THE FULL STUDY PLAN INCORPORATING ALL FIXES.
-Do NOT skip any topics. Ensure all days have <= 8 hours.
-"""
-        response = await client.aio.models.generate_content(
-            model=os.getenv("GEMINI_MODEL", "gemini-3-pro-preview"),
-            contents=fix_prompt,
-            config={
-                "response_mime_type": "application/json",
-                "response_schema": StudyPlan,
-            }
-        )
-        current_plan = response.parsed
+        # Fix the plan (self-correction), editing only the flagged days when possible
+        current_plan, changed_days = await _repair_plan(current_plan, verification, goal, syllabus_text)
         
         # Store the new version
         versions.append(PlanVersion(
             version=i + 2,  # v2, v3, etc.
             plan=current_plan,
             verification=None,
-            was_accepted=False
+            was_accepted=False,
+            changed_days=changed_days
         ))
     
     # If we exited without finding a valid plan, mark the last as accepted anyway
@@ -282,22 +829,28 @@ Do NOT skip any topics. Ensure all days have <= 8 hours.
         print("⚠️ Max iterations reached. Returning latest version.")
     
     # Calculate verification summary
-    verification_summary = {
-        "coverage_percent": 100 - (len(final_verification.missing_topics) * 5) if final_verification else 100,
-        "overloaded_days_count": len(final_verification.overloaded_days) if final_verification else 0,
-        "prerequisite_issues_count": len(final_verification.prerequisite_issues) if final_verification else 0,
-        "is_valid": final_verification.is_valid if final_verification else True,
-        "iterations_used": len(versions),
-    }
+    verification_summary = _verification_summary(final_verification, current_plan, syllabus_text, days, len(versions))
     
-    return PlanWithHistory(
+    result = PlanWithHistory(
         final_plan=current_plan,
         versions=versions,
         total_iterations=len(versions),
         self_correction_applied=len(versions) > 1,
-        verification_summary=verification_summary
+        verification_summary=verification_summary,
+        cache_key=cache_key
     )
 
+    # Only plans that passed verification are worth serving to other students
+    if verification_summary["is_valid"]:
+        await plan_cache.set(cache_key, result.model_dump(mode="json"))
+
+    return result
+
+
+def plan_job_key(syllabus_text: str, exam_type: str, goal: str, days: int) -> str:
+    """Identical plan requests (e.g. the same plan open in two tabs) follow the same job."""
+    return hashlib.sha256(json.dumps([syllabus_text, exam_type, goal, days]).encode()).hexdigest()
+
 
 async def stream_verified_plan_with_history(
     syllabus_text: str,
@@ -316,38 +869,74 @@ async def stream_verified_plan_with_history(
     # client imported from services
     
     versions: List[PlanVersion] = []
+    original_goal = goal
+    caller_syllabus_text = syllabus_text
 
-    # 1. Route First (The Router Layer) - Streaming Version
+    # 1. Speculative Draft: start streaming a draft from the caller's syllabus while the model router runs.
+    # Local and memoized routes return at once, so the plan cache is checked before any draft.
+    speculative = None
+    if route_needs_model(goal, exam_type):
+        speculative_draft = _DraftStream(stream_study_plan(syllabus_text, exam_type, goal, days))
+        speculative = draft_speculation.start(speculative_draft.run)
     try:
-        route = await route_request(goal, current_exam_context=exam_type)
-        yield json.dumps({"type": "debug", "message": f"Routed to: {route.exam} - {route.scope.subject}"}) + "\n"
-        
-        # 3. Fetch Scoped Syllabus
-        scoped_syllabus_text = get_safe_syllabus(route)
-        
-        # 4. Inject Scope Constraint
-        if route.scope.subject and route.scope.subject.lower() not in ["all", "general"]:
-             scope_str = f"{route.scope.subject}"
-             if route.scope.sub_subject:
-                 scope_str += f" ({route.scope.sub_subject})"
-             
-             goal = f"""{goal}
-             
-             STRICT CONSTRAINT: Cover ONLY {scope_str}.
-             Do NOT include topics from other subjects outside of {scope_str}.
-             """
-        
-        # Use the scoped syllabus
-        syllabus_text = scoped_syllabus_text
-        
-    except Exception as e:
-        print(f"Streaming routing failed: {e}")
-    
-    # 1. Draft Phase
-    yield json.dumps({"type": "status", "message": f"Drafting initial plan for {exam_type}..."}) + "\n"
-    print(f"🔄 Generating draft plan for {exam_type}...")
-    
-    current_plan = await generate_study_plan(syllabus_text, exam_type, goal, days)
+        # 2. Route and Scope (The Router Layer) - Streaming Version
+        route, goal, syllabus_text = await _route_and_scope(goal, exam_type, syllabus_text)
+        if route is not None:
+            yield json.dumps({"type": "debug", "message": f"Routed to: {route.exam} - {route.scope.subject}"}) + "\n"
+
+        # 3. Plan Cache: replay a previously accepted plan instantly
+        cache_key = make_plan_cache_key(exam_type, _scope_descriptor(route, syllabus_text), days, original_goal)
+        cached = await plan_cache.get(cache_key)
+        if cached:
+            if speculative is not None:
+                speculative.discard("skipped")
+            cached_result = PlanWithHistory.model_validate(cached)
+            cached_result.from_cache = True
+            yield json.dumps({"type": "status", "message": "Loaded a previously verified plan"}) + "\n"
+            for v in cached_result.versions:
+                yield json.dumps({"type": "draft", "version": v.version, "plan": v.plan.model_dump()}) + "\n"
+                if v.verification:
+                    yield json.dumps({
+                        "type": "verification",
+                        "version": v.version,
+                        "result": v.verification.model_dump()
+                    }) + "\n"
+            yield json.dumps({"type": "complete", "final_result": cached_result.model_dump()}) + "\n"
+            return
+
+        # 4. Draft Phase: each day is sent (with its local checks) as soon as it is generated
+        yield json.dumps({"type": "status", "message": f"Drafting initial plan for {exam_type}..."}) + "\n"
+        print(f"🔄 Generating draft plan for {exam_type}...")
+        # Verification and fixes see the same condensed syllabus as the draft (no-op for short ones)
+        condensed_syllabus_text = await prepare_syllabus(syllabus_text, exam_type)
+
+        if speculative is not None and _speculation_matches(route, caller_syllabus_text, syllabus_text):
+            print("⚡ Using speculative draft (routed scope matches the supplied syllabus)")
+            speculative.claim()
+            draft_items = speculative_draft.follow()
+        else:
+            if speculative is not None:
+                print("🔁 Routed scope differs from the supplied syllabus, redrafting")
+                speculative.discard()
+            draft_items = stream_study_plan(syllabus_text, exam_type, goal, days)
+
+        async for item in draft_items:
+            if isinstance(item, DailyPlan):
+                day_check = LocalPlanCheck()
+                _check_day(day_check, item)
+                yield json.dumps({
+                    "type": "day",
+                    "version": 1,
+                    "day": item.model_dump(),
+                    "checks": {"overloaded": bool(day_check.overloaded_days), "duplicate_topics": day_check.duplicate_topics}
+                }) + "\n"
+            else:
+                current_plan = item
+        syllabus_text = condensed_syllabus_text
+    finally:
+        # Cache hits, disconnects and errors never use the speculative draft
+        if speculative is not None:
+            speculative.discard("skipped")
     
     versions.append(PlanVersion(
         version=1,
@@ -363,6 +952,8 @@ async def stream_verified_plan_with_history(
     }) + "\n"
     
     final_verification = None
+    decided_by = None
+    changed_days: Optional[List[int]] = None
     
     # 2. Verification Loop
     for i in range(max_iterations):
@@ -372,7 +963,9 @@ async def stream_verified_plan_with_history(
         }) + "\n"
         print(f"🧐 Verifying plan (Iteration {i+1})...")
         
-        verification = await verify_study_plan(current_plan, syllabus_text, exam_type)
+        # A failure from the local checks never audited the unchanged days, so it gets the full audit
+        audited = final_verification if decided_by == "model" else None
+        verification, decided_by = await _verify_plan(current_plan, syllabus_text, exam_type, days, changed_days, audited)
         versions[-1].verification = verification
         
         yield json.dumps({
@@ -400,46 +993,22 @@ async def stream_verified_plan_with_history(
             "message": f"Fixing issues found in v{i+1}..."
         }) + "\n"
         
-        # Fix the plan (self-correction)
-        fix_prompt = f"""
-You are an expert exam strategist. Fix the draft study plan based on the auditor\'s critique.
-
-FIX CRITIQUE:
-{verification.critique}
-
-ISSUES TO FIX:
-- Missing topics: {verification.missing_topics}
-- Overloaded days: {verification.overloaded_days}
-- Prerequisite issues: {verification.prerequisite_issues}
-
-ORIGINAL GOAL: {goal}
-SYLLABUS: {syllabus_text[:5000]}
-CURRENT DRAFT: {current_plan.model_dump_json()}
-
-REGENERATE THE FULL STUDY PLAN INCORPORATING ALL FIXES.
-Do NOT skip any topics. Ensure all days have <= 8 hours.
-"""
-        response = await client.aio.models.generate_content(
-            model=os.getenv("GEMINI_MODEL", "gemini-3-pro-preview"),
-            contents=fix_prompt,
-            config={
-                "response_mime_type": "application/json",
-                "response_schema": StudyPlan,
-            }
-        )
-        current_plan = response.parsed
+        # Fix the plan (self-correction), editing only the flagged days when possible
+        current_plan, changed_days = await _repair_plan(current_plan, verification, goal, syllabus_text)
         
         versions.append(PlanVersion(
             version=i + 2,
             plan=current_plan,
             verification=None,
-            was_accepted=False
+            was_accepted=False,
+            changed_days=changed_days
         ))
         
         yield json.dumps({
             "type": "draft", 
             "version": i + 2, 
-            "plan": current_plan.model_dump()
+            "plan": current_plan.model_dump(),
+            "changed_days": changed_days
         }) + "\n"
         
     # If we exited without finding a valid plan, mark the last as accepted anyway
@@ -448,21 +1017,19 @@ Do NOT skip any topics. Ensure all days have <= 8 hours.
         print("⚠️ Max iterations reached. Returning latest version.")
 
     # Calculate verification summary
-    verification_summary = {
-        "coverage_percent": 100 - (len(final_verification.missing_topics) * 5) if final_verification else 100,
-        "overloaded_days_count": len(final_verification.overloaded_days) if final_verification else 0,
-        "prerequisite_issues_count": len(final_verification.prerequisite_issues) if final_verification else 0,
-        "is_valid": final_verification.is_valid if final_verification else True,
-        "iterations_used": len(versions),
-    }
+    verification_summary = _verification_summary(final_verification, current_plan, syllabus_text, days, len(versions))
 
     final_result = PlanWithHistory(
         final_plan=current_plan,
         versions=versions,
         total_iterations=len(versions),
         self_correction_applied=len(versions) > 1,
-        verification_summary=verification_summary
+        verification_summary=verification_summary,
+        cache_key=cache_key
     )
+
+    if verification_summary["is_valid"]:
+        await plan_cache.set(cache_key, final_result.model_dump(mode="json"))
     
     yield json.dumps({
         "type": "complete",
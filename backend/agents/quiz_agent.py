@@ -9,6 +9,7 @@ from google import genai
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from enum import Enum
+from services.genai_service import generate_structured
 
 
 # --- Enums and Schemas ---
@@ -70,8 +71,6 @@ async def generate_quiz(
     Returns:
         Quiz: A validated quiz with questions
     """
-    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    
     mistakes_instruction = ""
     if previous_mistakes:
         mistakes_instruction = f"""
@@ -99,16 +98,13 @@ REQUIREMENTS:
 5. Each question should test a specific concept
 """
 
-    response = await client.aio.models.generate_content(
+    # Not cached: a retake or the next autopilot round must get new questions
+    return await generate_structured(
+        prompt,
+        Quiz,
         model=os.getenv("GEMINI_MODEL", "gemini-2.5-pro-preview-05-06"),
-        contents=prompt,
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": Quiz,
-        }
+        agent="quiz.generate_quiz",
     )
-    
-    return response.parsed
 
 
 # --- Multimodal Quiz Generator (Action Era Feature) ---
@@ -159,8 +155,6 @@ async def generate_quiz_from_image(
     Returns:
         ImageQuiz: Quiz with visually-grounded questions
     """
-    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    
     prompt = f"""
 You are an expert exam question writer with strong visual analysis skills.
 Analyze this diagram about "{topic}" and create {num_questions} quiz questions.
@@ -186,19 +180,15 @@ Generate questions that PROVE multimodal reasoning is happening.
 A text-only model could NOT answer these questions.
 """
 
-    response = await client.aio.models.generate_content(
-        model=os.getenv("GEMINI_MODEL", "gemini-3-flash-preview"),
-        contents=[
+    return await generate_structured(
+        [
             prompt,
             genai.types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
         ],
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": ImageQuiz,
-        }
+        ImageQuiz,
+        model=os.getenv("GEMINI_MODEL", "gemini-3-flash-preview"),
+        agent="quiz.generate_quiz_from_image",
     )
-    
-    return response.parsed
 
 
 # --- Answer Evaluator ---
@@ -211,8 +201,6 @@ async def evaluate_answer(
     """
     Evaluate a student's answer and identify potential misconceptions.
     """
-    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    
     is_correct = student_answer_index == question.correct_option_index
     student_answer = question.options[student_answer_index]
     correct_answer = question.options[question.correct_option_index]
@@ -234,16 +222,15 @@ Provide:
 3. A tip for approaching similar questions in the future
 """
 
-    response = await client.aio.models.generate_content(
+    return await generate_structured(
+        prompt,
+        AnswerEvaluation,
         model=os.getenv("GEMINI_MODEL", "gemini-2.5-pro-preview-05-06"),
-        contents=prompt,
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": AnswerEvaluation,
-        }
+        agent="quiz.evaluate_answer",
+        # Correctness is known up front; feedback that contradicts it came from a confused model
+        accept=lambda e: e.is_correct == is_correct,
+        hedge=True,
     )
-    
-    return response.parsed
 
 
 # --- Test ---
@@ -10,6 +10,7 @@ from typing import Optional, List, Dict, Any
 from pydantic import BaseModel
 import os
 from supabase import create_client, Client
+from services.tracing import trace_supabase
 import json
 import datetime
 
@@ -57,7 +58,7 @@ class StateMachine:
         supabase_url = os.getenv("SUPABASE_URL")
         supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_ANON_KEY")
         if supabase_url and supabase_key:
-            self.supabase: Optional[Client] = create_client(supabase_url, supabase_key)
+            self.supabase: Optional[Client] = trace_supabase(create_client(supabase_url, supabase_key))
         else:
             self.supabase = None
             print("⚠️ Warning: Supabase credentials missing. Persistence disabled.")
@@ -0,0 +1,214 @@
+"""
+Syllabus Agent - Condenses long syllabi into a compact topic tree for planning.
+
+Plan prompts only have room for a slice of the syllabus (10,000 characters
+for drafting, 5,000 for verification and fixes), so a long university or
+coaching-institute syllabus used to lose most of its topics. Large syllabi
+are now map-reduced instead:
+
+1. Split on line boundaries into chunks of SYLLABUS_CHUNK_CHARS
+2. Extract units and topics from the chunks concurrently (bounded)
+3. Merge and dedupe them into one topic tree
+4. Render the tree to fit SYLLABUS_COMPACT_CHARS, trimming topic lists
+   evenly if needed, and use that text in every plan prompt
+
+Syllabi up to SYLLABUS_INGEST_THRESHOLD_CHARS (the drafting slice) are passed
+through unchanged.
+"""
+
+import os
+import re
+import asyncio
+import hashlib
+from pydantic import BaseModel, Field
+from typing import Dict, List
+from services.genai_service import generate_structured
+from services.tracing import tracer
+
+
+# Syllabi longer than this are condensed. Shorter ones go in as they are: the
+# draft sees all of them, verification and fixes their first 5,000 characters.
+SYLLABUS_INGEST_THRESHOLD_CHARS = int(os.getenv("SYLLABUS_INGEST_THRESHOLD_CHARS", "10000"))
+SYLLABUS_CHUNK_CHARS = int(os.getenv("SYLLABUS_CHUNK_CHARS", "8000"))
+# Extraction calls in flight per syllabus (the scheduler still bounds the total)
+SYLLABUS_MAX_PARALLEL = int(os.getenv("SYLLABUS_MAX_PARALLEL", "4"))
+# Larger inputs are cut here rather than fanning out without limit
+SYLLABUS_MAX_CHUNKS = int(os.getenv("SYLLABUS_MAX_CHUNKS", "64"))
+# Size of the rendered topic tree; matches the smallest syllabus slice used by plan prompts
+SYLLABUS_COMPACT_CHARS = int(os.getenv("SYLLABUS_COMPACT_CHARS", "5000"))
+# Condensed syllabi kept in memory, keyed by a hash of the text
+SYLLABUS_PREPARED_MAX = int(os.getenv("SYLLABUS_PREPARED_MAX", "32"))
+
+_prepared: Dict[str, "asyncio.Future[str]"] = {}
+
+
+class SyllabusUnit(BaseModel):
+    name: str = Field(description="Unit or chapter name as written in the syllabus")
+    topics: List[str] = Field(description="Short topic names (2-8 words each) in this unit")
+
+
+class SyllabusExtract(BaseModel):
+    """Schema for the topics found in one chunk of a syllabus."""
+    units: List[SyllabusUnit]
+
+
+class TopicTree(BaseModel):
+    """Merged, deduplicated units and topics of a whole syllabus."""
+    units: List[SyllabusUnit]
+    source_chars: int
+    chunks: int
+
+    @property
+    def topic_count(self) -> int:
+        return sum(len(u.topics) for u in self.units)
+
+    def render(self, max_chars: int = SYLLABUS_COMPACT_CHARS) -> str:
+        """One '- Unit: topic; topic' line per unit, trimming every unit's topics evenly to fit."""
+        header = f"Syllabus topic tree ({len(self.units)} units, {self.topic_count} topics):"
+        longest = max((len(u.topics) for u in self.units), default=0)
+        for keep in range(longest, -1, -1):
+            lines = [header]
+            for unit in self.units:
+                shown = unit.topics[:keep]
+                more = len(unit.topics) - len(shown)
+                line = f"- {unit.name}: " + "; ".join(shown) if shown else f"- {unit.name}"
+                if more:
+                    line += f" (+{more} more)"
+                lines.append(line)
+            text = "\n".join(lines)
+            if len(text) <= max_chars:
+                return text
+        # Even one line per unit is too long: list the unit names inline, as many as fit
+        text = header + "\nUnits: "
+        for index, unit in enumerate(self.units):
+            rest = f" (+{len(self.units) - index} more units)"
+            entry = ("; " if index else "") + unit.name
+            if len(text) + len(entry) + len(rest) > max_chars:
+                return text + rest
+            text += entry
+        return text
+
+
+def split_syllabus(syllabus_text: str, chunk_chars: int = SYLLABUS_CHUNK_CHARS) -> List[str]:
+    """Split on line boundaries, preferring blank lines, into chunks of at most chunk_chars."""
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for block in re.split(r"\n\s*\n", syllabus_text):
+        for line in block.splitlines() + [""]:
+            # Lines longer than a chunk (e.g. a PDF export without line breaks) are cut
+            pieces = [line[i:i + chunk_chars] for i in range(0, len(line), chunk_chars)] or [line]
+            for piece in pieces:
+                if size + len(piece) + 1 > chunk_chars and current:
+                    chunks.append("\n".join(current).strip())
+                    current, size = [], 0
+                current.append(piece)
+                size += len(piece) + 1
+    if current:
+        chunks.append("\n".join(current).strip())
+    return [c for c in chunks if c]
+
+
+async def extract_syllabus_topics(chunk: str, exam_type: str, part: int, parts: int) -> SyllabusExtract:
+    """Extract units and topics from one chunk of a syllabus."""
+    prompt = f"""
+You are a curriculum analyst. Extract the structure of this excerpt from a {exam_type} syllabus (part {part} of {parts}).
+
+SYLLABUS EXCERPT:
+{chunk}
+
+INSTRUCTIONS:
+1. Return each unit or chapter heading as a unit, with the topics listed under it.
+2. Use short topic names (2-8 words). Drop page numbers, marks, hours, reading lists and administrative text.
+3. If the excerpt starts in the middle of a unit, put those topics under a unit named "Continued".
+4. Do not invent topics that are not in the excerpt.
+"""
+
+    # Extraction is a pure function of the chunk, so repeated syllabi hit the response cache
+    return await generate_structured(
+        prompt,
+        SyllabusExtract,
+        model=os.getenv("GEMINI_MODEL", "gemini-3-pro-preview"),
+        agent="syllabus.extract_topics",
+        cache=True,
+    )
+
+
+def _norm(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", name.lower()).strip()
+
+
+def merge_extracts(extracts: List[SyllabusExtract]) -> List[SyllabusUnit]:
+    """Merge units by name and drop repeated topics, keeping the syllabus order."""
+    units: Dict[str, SyllabusUnit] = {}
+    seen_topics = set()
+    last_key = None
+    for extract in extracts:
+        for unit in extract.units:
+            key = _norm(unit.name)
+            # A unit cut by a chunk boundary continues the previous chunk's last unit
+            if key in ("continued", "") and last_key is not None:
+                key = last_key
+            if key not in units:
+                units[key] = SyllabusUnit(name=unit.name.strip() or "General", topics=[])
+            for topic in unit.topics:
+                topic_key = _norm(topic)
+                if topic_key and topic_key not in seen_topics:
+                    seen_topics.add(topic_key)
+                    units[key].topics.append(topic.strip())
+            last_key = key
+    return [u for u in units.values() if u.topics]
+
+
+async def ingest_syllabus(syllabus_text: str, exam_type: str) -> TopicTree:
+    """Map-reduce a syllabus into a TopicTree."""
+    chunks = split_syllabus(syllabus_text)
+    if len(chunks) > SYLLABUS_MAX_CHUNKS:
+        print(f"⚠️ Syllabus has {len(chunks)} chunks, using the first {SYLLABUS_MAX_CHUNKS}")
+        chunks = chunks[:SYLLABUS_MAX_CHUNKS]
+    semaphore = asyncio.Semaphore(SYLLABUS_MAX_PARALLEL)
+
+    async def _extract(index: int, chunk: str) -> SyllabusExtract:
+        async with semaphore:
+            try:
+                return await extract_syllabus_topics(chunk, exam_type, index + 1, len(chunks))
+            except Exception as e:
+                # One unreadable chunk should not sink the whole plan
+                print(f"⚠️ Syllabus chunk {index + 1}/{len(chunks)} extraction failed: {e}")
+                return SyllabusExtract(units=[])
+
+    with tracer.span("syllabus.ingest", {"app.syllabus_chars": len(syllabus_text), "app.chunks": len(chunks)}) as span:
+        extracts = await asyncio.gather(*[_extract(i, c) for i, c in enumerate(chunks)])
+        tree = TopicTree(units=merge_extracts(extracts), source_chars=len(syllabus_text), chunks=len(chunks))
+        span.set_attributes({"app.units": len(tree.units), "app.topics": tree.topic_count})
+    return tree
+
+
+async def prepare_syllabus(syllabus_text: str, exam_type: str) -> str:
+    """The syllabus text to put in plan prompts: as-is if short, else its compact topic tree."""
+    if len(syllabus_text) <= SYLLABUS_INGEST_THRESHOLD_CHARS:
+        return syllabus_text
+    # One request condenses the same syllabus from several places (speculative
+    # draft, drafting, verification), so they share one ingestion
+    key = hashlib.sha256(f"{exam_type}\n{syllabus_text}".encode()).hexdigest()
+    task = _prepared.get(key)
+    if task is None or (task.done() and (task.cancelled() or task.exception())):
+        task = asyncio.ensure_future(_condense(syllabus_text, exam_type))
+        _prepared[key] = task
+        while len(_prepared) > SYLLABUS_PREPARED_MAX:
+            _prepared.pop(next(iter(_prepared)))
+    # Shielded so a caller that is cancelled does not cancel the others' ingestion
+    return await asyncio.shield(task)
+
+
+async def _condense(syllabus_text: str, exam_type: str) -> str:
+    tree = await ingest_syllabus(syllabus_text, exam_type)
+    if not tree.units:
+        print("⚠️ Syllabus ingestion found no topics, using the raw syllabus")
+        return syllabus_text
+    compact = tree.render()
+    print(
+        f"📚 Condensed syllabus: {tree.source_chars} chars in {tree.chunks} chunks -> "
+        f"{len(tree.units)} units / {tree.topic_count} topics ({len(compact)} chars)"
+    )
+    return compact
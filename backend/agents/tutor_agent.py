@@ -5,10 +5,14 @@ Uses the Feynman Technique for intuitive explanations.
 """
 
 import os
+import json
+import hashlib
 from typing import AsyncGenerator
 from google import genai
 from pydantic import BaseModel, Field
 from typing import List, Optional
+from services.genai_service import generate_structured, generate_text, stream_text
+from services.stream_fanout import StreamMultiplexer
 
 
 # --- Structured Output for Complete Explanations ---
@@ -68,8 +72,6 @@ async def stream_explanation(
     Yields:
         str: Chunks of the explanation text
     """
-    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    
     depth_instruction = {
         "easy": "Use simple language, many analogies, avoid jargon",
         "medium": "Balance depth with clarity, include some technical terms",
@@ -117,13 +119,49 @@ If the question is a follow-up (like "explain more"), use the history to provide
 """
 
     # Enable streaming for live UI feedback
-    response = await client.aio.models.generate_content_stream(
+    async for chunk in stream_text(
+        prompt,
         model=os.getenv("GEMINI_MODEL", "gemini-2.5-pro-preview-05-06"),
-        contents=prompt
-    )
-    async for chunk in response:
-        if chunk.text:
-            yield chunk.text
+        agent="tutor.stream_explanation",
+    ):
+        yield chunk
+
+
+# One upstream stream per unique question; late joiners replay the buffered prefix
+tutor_stream_fanout = StreamMultiplexer()
+
+
+async def stream_explanation_shared(
+    topic: str,
+    context: str,
+    difficulty: str = "medium",
+    history: Optional[List[dict]] = None,
+    attached_context: Optional[str] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Same as stream_explanation, but identical first-turn questions share a
+    single upstream Gemini stream via the fan-out multiplexer.
+
+    Follow-ups with conversation history are personal and always stream directly.
+    """
+    if history:
+        async for chunk in stream_explanation(topic, context, difficulty, history, attached_context):
+            yield chunk
+        return
+
+    key = hashlib.sha256(json.dumps([
+        os.getenv("GEMINI_MODEL", "gemini-2.5-pro-preview-05-06"),
+        topic,
+        context,
+        difficulty,
+        attached_context or "",
+    ]).encode()).hexdigest()
+
+    async for chunk in tutor_stream_fanout.subscribe(
+        key,
+        lambda: stream_explanation(topic, context, difficulty, None, attached_context),
+    ):
+        yield chunk
 
 
 # --- Structured Explanation (Non-streaming, complete response) ---
@@ -140,8 +178,6 @@ async def generate_explanation(
     
     Returns a validated Pydantic model with all explanation components.
     """
-    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    
     history_text = ""
     if history:
         history_text = "\nPREVIOUS CONVERSATION:\n"
@@ -174,16 +210,13 @@ Create a complete explanation with:
 - Practice question
 """
 
-    response = await client.aio.models.generate_content(
+    return await generate_structured(
+        prompt,
+        TutorExplanation,
         model=os.getenv("GEMINI_MODEL", "gemini-3-flash-preview"),
-        contents=prompt,
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": TutorExplanation,
-        }
+        agent="tutor.generate_explanation",
+        cache=True,
     )
-    
-    return response.parsed
 
 
 async def explain_image(
@@ -194,8 +227,6 @@ async def explain_image(
     """
     Explain a concept using a diagram/image with visual grounding.
     """
-    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-
     prompt = f"""
 You are an expert tutor specializing in visual learning.
 Explain the concept "{topic}" based on this diagram/image.
@@ -207,20 +238,16 @@ INSTRUCTIONS:
 4. End with a practice question focused on the visual details.
 """
 
-    response = await client.aio.models.generate_content(
-        model=os.getenv("GEMINI_MODEL", "gemini-3-flash-preview"),
-        contents=[
+    return await generate_structured(
+        [
             prompt,
             genai.types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
         ],
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": MultimodalExplanation,
-        }
+        MultimodalExplanation,
+        model=os.getenv("GEMINI_MODEL", "gemini-3-flash-preview"),
+        agent="tutor.explain_image",
     )
 
-    return response.parsed
-
 
 async def describe_image_for_context(
     image_bytes: bytes,
@@ -231,19 +258,19 @@ async def describe_image_for_context(
     Use this for any uploaded image (documents, certificates, diagrams, notes) so the
     tutor can reference what the user actually uploaded, not a topic-based explanation.
     """
-    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
     prompt = """Describe the contents of this image in detail so it can be used as study material or reference context.
 Include: type of document or image (e.g. birth certificate, diagram, handwritten notes), any text you can read,
 and key visual elements. Be factual and neutral. Do not explain a specific academic topic—just describe what is in the image."""
-    response = await client.aio.models.generate_content(
-        model=os.getenv("GEMINI_MODEL", "gemini-2.5-pro-preview-05-06"),
-        contents=[
+    text = await generate_text(
+        [
             prompt,
             genai.types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
         ],
+        model=os.getenv("GEMINI_MODEL", "gemini-2.5-pro-preview-05-06"),
+        agent="tutor.describe_image",
     )
-    if response.text:
-        return response.text.strip()[:8000]
+    if text:
+        return text.strip()[:8000]
     return "(Could not describe image.)"
 
 
@@ -5,26 +5,58 @@ Main API server with endpoints for all agents.
 Supports streaming responses for real-time UI feedback.
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import os
+import asyncio
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from supabase import create_client, Client
+from services.genai_service import gemini, single_flight
+from services.scheduler import scheduler
+from services.model_policy import model_telemetry
+from services.hedging import hedger
+from services.resilience import resilience, classify_error, is_transient, retry_after_seconds, ErrorKind
+from services.response_cache import response_cache
+from services.plan_cache import plan_cache
+from services.job_queue import job_queue, JobRecord, JobState, QueueFullError
+from services.metrics import metrics, MetricsMiddleware
+from services.stream_timing import stream_timing, note_source
+from services.tracing import tracer, TracingMiddleware, trace_supabase
 
 load_dotenv()
 
 url: str = os.getenv("SUPABASE_URL")
 key: str = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
+supabase: Client = trace_supabase(create_client(url, key))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background services on startup and tear them down on shutdown."""
+    try:
+        warmed = await gemini.warm_up()
+        print(f"🔥 Gemini connection pool warmed ({warmed} connections)")
+    except Exception as e:
+        print(f"⚠️ Gemini pool warm-up skipped: {e}")
+    plan_cache_sweeper = asyncio.create_task(plan_cache.run_sweeper())
+    job_queue_sweeper = asyncio.create_task(job_queue.run_sweeper())
+    yield
+    plan_cache_sweeper.cancel()
+    job_queue_sweeper.cancel()
+    await job_queue.close()
+    await gemini.aclose()
+    tracer.close()
 
 
 app = FastAPI(
     title="ExamMentor AI",
     description="Multi-Agent Study Coach powered by Gemini 3",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # CORS for frontend
@@ -34,7 +66,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Plan-Job-Id"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 
 
 # --- Request/Response Models ---
@@ -115,6 +150,27 @@ class QuizPersistenceRequest(BaseModel):
     questions: List[dict]
 
 
+# --- Error Mapping ---
+
+def agent_error(e: Exception) -> HTTPException:
+    """
+    Translate an agent failure into an HTTP error.
+
+    Upstream rate limits become 429 and other transient model failures
+    (overload, timeouts, open breaker) become 503, both with Retry-After,
+    so clients back off instead of treating them as server bugs.
+    """
+    if not is_transient(e):
+        return HTTPException(status_code=500, detail=str(e))
+    status_code = 429 if classify_error(e) == ErrorKind.RATE_LIMITED else 503
+    retry_after = retry_after_seconds(e) or 5
+    return HTTPException(
+        status_code=status_code,
+        detail=str(e),
+        headers={"Retry-After": str(int(retry_after + 0.999))},
+    )
+
+
 # --- Health Check ---
 
 @app.get("/health")
@@ -123,6 +179,72 @@ async def health():
     return {"ok": True, "service": "exammentor-ai", "version": "0.1.0"}
 
 
+@app.get("/api/system/stats")
+async def system_stats():
+    """Runtime statistics for the shared model client and caches."""
+    from agents.tutor_agent import tutor_stream_fanout
+    from agents.plan_agent import draft_speculation, plan_jobs
+    from router import route_stats, syllabus_catalog
+
+    return {
+        "genai_pool": gemini.pool_stats(),
+        "scheduler": scheduler.stats(),
+        "single_flight": single_flight.stats(),
+        "resilience": resilience.stats(),
+        "model_policy": model_telemetry.stats(),
+        "hedging": hedger.stats(),
+        "response_cache": response_cache.stats(),
+        "plan_cache": plan_cache.stats(),
+        "tutor_stream_fanout": tutor_stream_fanout.stats(),
+        "plan_draft_speculation": draft_speculation.stats(),
+        "plan_jobs": plan_jobs.stats(),
+        "job_queue": job_queue.stats(),
+        "routing": route_stats(),
+        "syllabus_catalog": syllabus_catalog.stats(),
+        "stream_timing": stream_timing.stats(),
+        "tracing": tracer.stats(),
+    }
+
+
+@metrics.collector
+def _service_metrics():
+    """Counters the caches, scheduler and autopilot already keep, read at scrape time."""
+    from agents.autopilot_agent import _active_sessions
+
+    for agent, s in response_cache.stats()["by_agent"].items():
+        for result, field in (("hit", "hits"), ("miss", "misses")):
+            yield ("response_cache_lookups_total", "counter", "Response cache lookups by agent and result.",
+                   {"agent": agent, "result": result}, s[field])
+    cache = response_cache.stats()
+    yield ("response_cache_hit_ratio", "gauge", "Response cache hit ratio since start.", {}, cache["hit_ratio"])
+    yield ("response_cache_bytes", "gauge", "Bytes held in the in-memory response cache.", {}, cache["bytes"])
+
+    plans = plan_cache.stats()
+    for result, field in (("hit", "hits"), ("miss", "misses")):
+        yield ("plan_cache_lookups_total", "counter", "Plan cache lookups by result.", {"result": result}, plans[field])
+    yield ("plan_cache_hit_ratio", "gauge", "Plan cache hit ratio since start.", {}, plans["hit_ratio"])
+
+    flights = single_flight.stats()
+    yield ("single_flight_coalesced_total", "counter", "Model calls served by joining an identical in-flight call.",
+           {}, flights["coalesced_calls"])
+
+    for model, s in scheduler.stats()["models"].items():
+        yield ("gemini_scheduler_in_flight", "gauge", "Admitted upstream calls per model.", {"model": model}, s["in_flight"])
+        yield ("gemini_scheduler_queued", "gauge", "Calls waiting for admission per model.", {"model": model}, s["queued"])
+
+    by_status = {}
+    for session in list(_active_sessions.values()):
+        by_status[session.status] = by_status.get(session.status, 0) + 1
+    for status in ("running", "paused", "completed", "error", "idle"):
+        yield ("autopilot_sessions", "gauge", "Autopilot sessions in memory by status.", {"status": status}, by_status.get(status, 0))
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # --- Plan Agent Routes ---
 
 @app.post("/api/plan/generate")
@@ -139,49 +261,41 @@ async def generate_plan(request: PlanRequest):
         )
         return plan.model_dump()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise agent_error(e)
 
 
-@app.post("/api/plan/generate-verified")
-async def generate_verified_plan_endpoint(request: PlanRequest):
-    """Generate a verified study plan using iterative loops."""
-    from agents.plan_agent import generate_verified_plan
-    
-    try:
-        plan = await generate_verified_plan(
-            syllabus_text=request.syllabus_text,
-            exam_type=request.exam_type,
-            goal=request.goal,
-            days=request.days
-        )
-        return plan.model_dump()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+def _verified_plan_job(request: PlanRequest):
+    async def run() -> dict:
+        from agents.plan_agent import generate_verified_plan
 
+        try:
+            plan = await generate_verified_plan(
+                syllabus_text=request.syllabus_text,
+                exam_type=request.exam_type,
+                goal=request.goal,
+                days=request.days
+            )
+            return plan.model_dump()
+        except Exception as e:
+            raise agent_error(e)
+
+    return run
+
+
+def _verified_plan_with_history_job(request: PlanRequest):
+    async def run() -> dict:
+        from agents.plan_agent import generate_verified_plan_with_history
+
+        try:
+            result = await generate_verified_plan_with_history(
+                syllabus_text=request.syllabus_text,
+                exam_type=request.exam_type,
+                goal=request.goal,
+                days=request.days
+            )
+        except Exception as e:
+            raise agent_error(e)
 
-@app.post("/api/plan/generate-verified-with-history")
-async def generate_verified_plan_with_history_endpoint(request: PlanRequest):
-    """
-    Generate a verified study plan with full self-correction history.
-    
-    This endpoint returns:
-    - The final plan
-    - All versions (v1, v2, v3...) during self-correction
-    - Verification details for each version
-    - Summary metrics (coverage %, overloaded days, etc.)
-    
-    This is the key "Action Era" feature showing AI self-correction.
-    """
-    from agents.plan_agent import generate_verified_plan_with_history
-    
-    try:
-        result = await generate_verified_plan_with_history(
-            syllabus_text=request.syllabus_text,
-            exam_type=request.exam_type,
-            goal=request.goal,
-            days=request.days
-        )
-        
         # Serialize the full history
         return {
             "final_plan": result.final_plan.model_dump(),
@@ -196,30 +310,203 @@ async def generate_verified_plan_with_history_endpoint(request: PlanRequest):
             ],
             "total_iterations": result.total_iterations,
             "self_correction_applied": result.self_correction_applied,
-            "verification_summary": result.verification_summary
+            "verification_summary": result.verification_summary,
+            "cache_key": result.cache_key,
+            "from_cache": result.from_cache
         }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+
+    return run
+
+
+async def _submit_job(kind: str, factory) -> JobRecord:
+    try:
+        return await job_queue.submit(kind, factory)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=f"Job queue is full: {e}", headers={"Retry-After": "30"})
+
+
+def _job_result(record: JobRecord):
+    """The result of a finished job, or its error as the HTTP error the endpoint would have raised."""
+    if record.state == JobState.SUCCEEDED:
+        return record.result
+    if record.state == JobState.CANCELLED:
+        raise HTTPException(status_code=409, detail="Job was cancelled")
+    raise HTTPException(
+        status_code=record.error["status_code"],
+        detail=record.error["detail"],
+        headers=record.error.get("headers"),
+    )
+
+
+async def _wait_for_job(record: JobRecord):
+    """Wait for a job run on behalf of this request; a client disconnect cancels it."""
+    try:
+        return _job_result(await job_queue.wait(record.job_id))
+    except asyncio.CancelledError:
+        await job_queue.cancel(record.job_id)
+        raise
+
+
+@app.post("/api/plan/generate-verified")
+async def generate_verified_plan_endpoint(request: PlanRequest):
+    """
+    Generate a verified study plan using iterative loops.
+
+    Runs on the job queue pool and waits for the result; use
+    POST /api/jobs/plan/generate-verified to submit and poll instead.
+    """
+    record = await _submit_job("plan.generate_verified", _verified_plan_job(request))
+    return await _wait_for_job(record)
+
+
+@app.post("/api/plan/generate-verified-with-history")
+async def generate_verified_plan_with_history_endpoint(request: PlanRequest):
+    """
+    Generate a verified study plan with full self-correction history.
+    
+    This endpoint returns:
+    - The final plan
+    - All versions (v1, v2, v3...) during self-correction
+    - Verification details for each version
+    - Summary metrics (coverage %, overloaded days, etc.)
+    
+    This is the key "Action Era" feature showing AI self-correction.
+    Runs on the job queue pool and waits for the result; use
+    POST /api/jobs/plan/generate-verified-with-history to submit and poll instead.
+    """
+    record = await _submit_job("plan.generate_verified_with_history", _verified_plan_with_history_job(request))
+    return await _wait_for_job(record)
+
+
+# --- Job Queue Routes ---
+
+@app.post("/api/jobs/plan/generate-verified", status_code=202)
+async def submit_verified_plan_job(request: PlanRequest):
+    """Queue a verified plan; poll /api/jobs/{job_id} and fetch /api/jobs/{job_id}/result."""
+    record = await _submit_job("plan.generate_verified", _verified_plan_job(request))
+    return job_queue.describe(record)
+
+
+@app.post("/api/jobs/plan/generate-verified-with-history", status_code=202)
+async def submit_verified_plan_with_history_job(request: PlanRequest):
+    """Queue a verified plan with its self-correction history."""
+    record = await _submit_job("plan.generate_verified_with_history", _verified_plan_with_history_job(request))
+    return job_queue.describe(record)
+
+
+async def _queued_job(job_id: str) -> JobRecord:
+    record = await job_queue.get(job_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return record
+
+
+@app.get("/api/jobs/{job_id}")
+async def job_status(job_id: str):
+    """State of a queued job, with its queue position while it waits."""
+    return job_queue.describe(await _queued_job(job_id))
+
+
+@app.get("/api/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    """The job's result once finished (202 with its status until then)."""
+    record = await _queued_job(job_id)
+    if not record.finished:
+        return JSONResponse(status_code=202, content=job_queue.describe(record))
+    return _job_result(record)
+
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job."""
+    record = await job_queue.cancel(job_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job_queue.describe(record)
 
 
 @app.post("/api/plan/stream-verified")
-async def stream_verified_plan_endpoint(request: PlanRequest):
+async def stream_verified_plan_endpoint(request: PlanRequest, last_event_id: Optional[str] = Header(default=None)):
     """
     Stream the plan generation process with self-correction events.
     Returns a stream of newline-delimited JSON chunks.
+
+    Generation runs as a job (id in the X-Plan-Job-Id header and in every
+    event). Repeating the request with a Last-Event-ID header, or reading
+    /api/plan/jobs/{job_id}/events, resumes it without starting over. An
+    identical request without one joins the job while it runs, and starts
+    a fresh one once it has finished.
     """
-    from agents.plan_agent import stream_verified_plan_with_history
-    
-    async def generate():
-        async for chunk in stream_verified_plan_with_history(
+    from agents.plan_agent import stream_verified_plan_with_history, plan_jobs, plan_job_key
+
+    job, started, after = plan_jobs.attach(
+        plan_job_key(request.syllabus_text, request.exam_type, request.goal, request.days),
+        lambda: stream_verified_plan_with_history(
             syllabus_text=request.syllabus_text,
             exam_type=request.exam_type,
             goal=request.goal,
             days=request.days
-        ):
-            yield chunk
-            
-    return StreamingResponse(generate(), media_type="application/x-ndjson")
+        ),
+        last_event_id,
+    )
+    source = plan_jobs.join_source(job, started, after)
+
+    async def generate():
+        note_source(source)
+        async for _, line in plan_jobs.follow(job, after):
+            yield line
+
+    return StreamingResponse(
+        stream_timing.instrument("/api/plan/stream-verified", generate()),
+        media_type="application/x-ndjson",
+        headers={"X-Plan-Job-Id": job.id},
+    )
+
+
+def _plan_job(job_id: str):
+    from agents.plan_agent import plan_jobs
+
+    job = plan_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Plan job not found or expired")
+    return job
+
+
+@app.get("/api/plan/jobs/{job_id}")
+async def plan_job_status(job_id: str):
+    """State of a plan generation job."""
+    return _plan_job(job_id).status()
+
+
+@app.get("/api/plan/jobs/{job_id}/events")
+async def plan_job_events(
+    job_id: str,
+    after: Optional[str] = None,
+    format: str = "sse",
+    last_event_id: Optional[str] = Header(default=None),
+):
+    """
+    Follow a plan job's events after `after` (or the Last-Event-ID header):
+    Server-Sent Events by default, so EventSource reconnects resume on their
+    own, or the same NDJSON lines as /api/plan/stream-verified with
+    format=ndjson. A finished job is replayed from its log.
+    """
+    from agents.plan_agent import plan_jobs
+
+    job = _plan_job(job_id)
+    start_after = plan_jobs.resume_point(job, last_event_id or after)
+    source = plan_jobs.join_source(job, False, start_after)
+
+    async def generate():
+        note_source(source)
+        async for event_id, line in plan_jobs.follow(job, start_after):
+            yield line if format == "ndjson" else f"id: {event_id}\ndata: {line.rstrip()}\n\n"
+
+    return StreamingResponse(
+        stream_timing.instrument("/api/plan/jobs/events", generate()),
+        media_type="application/x-ndjson" if format == "ndjson" else "text/event-stream",
+        headers={"X-Plan-Job-Id": job.id},
+    )
 
 
 # --- Tutor Agent Routes ---
@@ -239,16 +526,16 @@ async def explain_topic(request: TutorRequest):
         )
         return explanation.model_dump()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise agent_error(e)
 
 
 @app.post("/api/tutor/stream")
 async def stream_topic_explanation(request: TutorRequest):
     """Stream an explanation for real-time UI."""
-    from agents.tutor_agent import stream_explanation
+    from agents.tutor_agent import stream_explanation_shared
     
     async def generate():
-        async for chunk in stream_explanation(
+        async for chunk in stream_explanation_shared(
             topic=request.topic,
             context=request.context,
             difficulty=request.difficulty,
@@ -257,7 +544,10 @@ async def stream_topic_explanation(request: TutorRequest):
         ):
             yield chunk
     
-    return StreamingResponse(generate(), media_type="application/x-ndjson")
+    return StreamingResponse(
+        stream_timing.instrument("/api/tutor/stream", generate()),
+        media_type="application/x-ndjson",
+    )
 
 
 class ExtractPdfRequest(BaseModel):
@@ -299,7 +589,7 @@ async def explain_image_endpoint(request: ImageTutorRequest):
         )
         return explanation.model_dump()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise agent_error(e)
 
 
 class DescribeImageRequest(BaseModel):
@@ -321,7 +611,7 @@ async def describe_image_endpoint(request: DescribeImageRequest):
         )
         return {"description": description}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise agent_error(e)
 
 
 # --- Quiz Agent Routes ---
@@ -342,7 +632,7 @@ async def generate_quiz_endpoint(request: QuizRequest):
         )
         return quiz.model_dump()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise agent_error(e)
 
 
 class ImageQuizRequest(BaseModel):
@@ -397,7 +687,7 @@ async def generate_quiz_from_image_endpoint(request: ImageQuizRequest):
             ]
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise agent_error(e)
 
 
 @app.post("/api/quiz/evaluate")
@@ -425,7 +715,7 @@ async def evaluate_answer_endpoint(request: AnswerRequest):
         )
         return evaluation.model_dump()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise agent_error(e)
 
 
 # --- Evaluator Agent Routes ---
@@ -459,7 +749,7 @@ async def analyze_performance_endpoint(request: AnalysisRequest):
                 print(f"⚠️ Failed to persist misconceptions: {ex}")
         return analysis.model_dump()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise agent_error(e)
 
 
 @app.post("/api/quiz/misconception")
@@ -510,7 +800,7 @@ async def bust_misconception_endpoint(request: MisconceptionRequest):
         
         return analysis.model_dump()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise agent_error(e)
 
 
 # --- Session Management Routes ---
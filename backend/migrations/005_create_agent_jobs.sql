@@ -0,0 +1,12 @@
+-- Migration 005: Job records for the async job queue (JOB_QUEUE_STORE=supabase)
+
+CREATE TABLE IF NOT EXISTS agent_jobs (
+  job_id text PRIMARY KEY,
+  kind text NOT NULL,
+  state text NOT NULL,          -- queued, running, succeeded, failed, cancelled
+  record jsonb NOT NULL,        -- Full JobRecord, including the result or error
+  created_at timestamp with time zone DEFAULT now(),
+  expires_at timestamp with time zone NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_agent_jobs_expires_at ON agent_jobs(expires_at);
@@ -1,8 +1,26 @@
 from enum import Enum
 import os
-from typing import List, Optional
+import re
+import math
+import random
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel
-from services.genai_service import client  # Centralized client
+from services.genai_service import generate_structured  # Centralized client
+from services.metrics import metrics
+from services.tracing import tracer
+from services.syllabus_catalog import SyllabusCatalog
+
+# Local decisions at or above this confidence skip the model router
+ROUTER_LOCAL_ENABLED = os.getenv("ROUTER_LOCAL_ENABLED", "1") == "1"
+ROUTER_LOCAL_MIN_CONFIDENCE = float(os.getenv("ROUTER_LOCAL_MIN_CONFIDENCE", "0.8"))
+# Model routing results, keyed by normalized goal text and exam context
+ROUTER_MEMO_MAX_ENTRIES = int(os.getenv("ROUTER_MEMO_MAX_ENTRIES", "2048"))
+ROUTER_MEMO_TTL_SECONDS = float(os.getenv("ROUTER_MEMO_TTL_SECONDS", "86400"))
+
+route_decisions = metrics.counter(
+    "route_decisions_total", "Routing decisions by source (local, memo, model, fallback).", ("source",))
 
 # --- 1. Define the World (Schemas) ---
 class Intent(str, Enum):
@@ -61,8 +79,297 @@ SYLLABI_REGISTRY = {
     }
 }
 
-# --- 3. The Router Agent ---
+# --- 3. The Local Classifier (Fast Path) ---
+# Most goals name their exam and subject outright ("NEET biology 7 days"), so
+# aliases plus a linear model trained on the registry resolve them without a model call.
+# Anything ambiguous (several subjects, conflicting exams, vague topics) scores
+# below ROUTER_LOCAL_MIN_CONFIDENCE and goes to the model router.
+EXAM_ALIASES = {
+    "neet": ["neet", "neet ug", "aipmt", "medical entrance", "mbbs"],
+    "jee": ["jee", "jee main", "jee mains", "jee advanced", "iit jee", "iit", "engineering entrance"],
+    "upsc": ["upsc", "ias", "civil services", "cse", "upsc cse"],
+    "cat": ["cat", "iim", "mba entrance"],
+}
+
+SUBJECT_ALIASES = {
+    "biology": ["biology", "bio", "botany", "zoology"],
+    "physics": ["physics", "phy"],
+    "chemistry": ["chemistry", "chem"],
+    "math": ["math", "maths", "mathematics"],
+    "history": ["history", "art and culture"],
+    "geography": ["geography", "geo"],
+    "polity": ["polity", "constitution", "governance"],
+    "economy": ["economy", "economics", "indian economy"],
+    "quant": ["quant", "quants", "quantitative aptitude", "qa"],
+    "verbal": ["verbal", "varc", "verbal ability", "reading comprehension", "rc"],
+    "dilr": ["dilr", "lrdi", "di lr", "data interpretation", "logical reasoning"],
+}
+
+# "physical" alone only names a branch once chemistry is known
+SUB_SUBJECT_ALIASES = {
+    "inorganic": ["inorganic", "inorganic chemistry"],
+    "organic": ["organic", "organic chemistry"],
+    "physical": ["physical chemistry", "physical chem"],
+}
+
+INTENT_KEYWORDS = [
+    (Intent.AUTOPILOT, ["autopilot", "auto mode"]),
+    (Intent.QUIZ, ["quiz", "test me", "mcq", "mcqs", "practice questions"]),
+    (Intent.EXPLAIN, ["explain", "what is", "how does", "teach me"]),
+]
+
+# Registry words that say nothing about the subject
+_GENERIC_WORDS = {
+    "syllabus", "some", "basic", "general", "life", "world", "everyday", "applications",
+    "principles", "concepts", "properties", "system", "systems", "their", "with", "from",
+    "into", "various", "models", "issues", "simple", "containing",
+}
+
+
+# Goal words that name no topic ("Crack JEE Advanced in 90 days"), as _terms() stems them
+_FILLER_WORDS = {
+    "want", "need", "help", "plan", "study", "prepare", "preparation", "revise", "revision",
+    "crack", "clear", "pass", "score", "mark", "rank", "percentile", "master", "improve", "better", "boost",
+    "exam", "test", "advanced", "main", "prelim", "full", "complete", "entire", "whole",
+    "hour", "day", "week", "month", "year", "daily", "weekly", "attempt", "first", "next",
+    "this", "that", "make", "give", "change", "start", "schedule", "strategy", "please",
+}
+
+
+# Aliases that are also everyday words or abbreviations ("cat", "qa testing", "an IIT professor").
+# They only count next to an exam-prep cue or another alias that places them.
+_AMBIGUOUS_ALIASES = {"cat", "iit", "iim", "cse", "ias", "qa", "rc", "phy", "geo", "bio", "chem"}
+
+_PREP_CUES = [
+    "exam", "exams", "prep", "prepare", "preparing", "preparation", "practice", "entrance", "syllabus", "mock", "mocks", "percentile",
+    "prelims", "mains", "aspirant", "attempt", "crack", "score", "rank", "revise", "revision", "study plan",
+]
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def _has_alias(padded: str, aliases: List[str], in_context: bool = True) -> bool:
+    """Whole-word match of any alias; ambiguous aliases need `in_context`."""
+    return any(f" {alias} " in padded for alias in aliases if in_context or alias not in _AMBIGUOUS_ALIASES)
+
+
+def _terms(text: str) -> List[str]:
+    words = re.findall(r"[a-z]{4,}", text.lower())
+    # Light stemming so "reactions" matches "reaction"
+    return [w[:-1] if w.endswith("s") and not w.endswith("ss") else w for w in words if w not in _GENERIC_WORDS]
+
+
+def _names_whole_exam(padded: str) -> bool:
+    """True if a goal names no subject of any exam and has no topic words beyond exam names and filler."""
+    if any(_has_alias(padded, aliases) for aliases in SUBJECT_ALIASES.values()):
+        return False
+    for aliases in list(EXAM_ALIASES.values()) + [words for _, words in INTENT_KEYWORDS]:
+        for alias in aliases:
+            padded = padded.replace(f" {alias} ", " ")
+    return not [t for t in _terms(padded) if t not in _FILLER_WORDS]
+
+
+class LocalRouteClassifier:
+    """Alias tables plus a TF-IDF softmax regression trained on the syllabus registry (no network)."""
+
+    # A topic-only goal is placed when one label gets at least this probability
+    MIN_PROBABILITY = 0.6
+
+    def __init__(self):
+        self._idf: Dict[str, float] = {}
+        # exam -> label -> term weights; no intercept, so a longer syllabus is not a likelier label
+        self._weights: Dict[str, Dict[Tuple[str, str, Optional[str]], Dict[str, float]]] = {}
+        self._vocabulary: Dict[str, set] = {}
+
+    def fit(
+        self,
+        samples: List[Tuple[Tuple[str, str, Optional[str]], str]],
+        epochs: int = 40,
+        learning_rate: float = 0.5,
+        l2: float = 1e-3,
+    ) -> None:
+        """Train one softmax regression per exam on (label, text) samples with seeded SGD."""
+        counted = [(label, Counter(_terms(text))) for label, text in samples]
+        counted = [(label, c) for label, c in counted if c]
+        df = Counter(term for _, c in counted for term in c)
+        n = len(counted)
+        self._idf = {term: math.log((1 + n) / (1 + d)) + 1.0 for term, d in df.items()}
+        by_exam: Dict[str, list] = {}
+        for label, c in counted:
+            by_exam.setdefault(label[0], []).append((label, self._vector(c)))
+
+        rng = random.Random(0)
+        self._weights, self._vocabulary = {}, {}
+        for exam, rows in by_exam.items():
+            weights = {label: {} for label, _ in rows}
+            for _ in range(epochs):
+                rng.shuffle(rows)
+                for label, x in rows:
+                    probs = self._softmax(weights, x)
+                    for k, w in weights.items():
+                        gradient = probs[k] - (1.0 if k == label else 0.0)
+                        for t, v in x.items():
+                            old = w.get(t, 0.0)
+                            w[t] = old - learning_rate * (gradient * v + l2 * old)
+            self._weights[exam] = weights
+            self._vocabulary[exam] = {t for _, x in rows for t in x}
+
+    def fit_registry(self, registry: dict) -> None:
+        """One sample per syllabus topic phrase, plus the subject and branch aliases."""
+        samples = []
+        for exam, subjects in registry.items():
+            for subject, value in subjects.items():
+                branches = value.items() if isinstance(value, dict) else [(None, value)]
+                for sub, text in branches:
+                    label = (exam, subject, sub)
+                    # Drop the "NEET Biology Syllabus:" header line
+                    body = text.split("\n", 1)[-1]
+                    samples += [(label, phrase) for phrase in re.split(r"[\n,:;.]", body)]
+                    samples.append((label, " ".join(SUBJECT_ALIASES.get(subject, []) + SUB_SUBJECT_ALIASES.get(sub, []))))
+        self.fit(samples)
+
+    def _vector(self, counts: Counter) -> Dict[str, float]:
+        vector = {t: c * self._idf[t] for t, c in counts.items() if t in self._idf}
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        return {t: v / norm for t, v in vector.items()} if norm else {}
+
+    @staticmethod
+    def _softmax(weights: dict, x: Dict[str, float]) -> dict:
+        scores = {k: sum(w.get(t, 0.0) * v for t, v in x.items()) for k, w in weights.items()}
+        top = max(scores.values())
+        exps = {k: math.exp(s - top) for k, s in scores.items()}
+        total = sum(exps.values())
+        return {k: e / total for k, e in exps.items()}
+
+    def known_terms(self, text: str, exam: str) -> List[str]:
+        """Terms of `text` that the model for `exam` was trained on."""
+        vocabulary = self._vocabulary.get(exam, set())
+        return [t for t in _terms(text) if t in vocabulary]
+
+    def probabilities(self, text: str, exam: str) -> List[Tuple[float, Tuple[str, str, Optional[str]]]]:
+        """Label probabilities of `text` among the labels of `exam`, best first."""
+        known = self.known_terms(text, exam)
+        if not known:
+            return []
+        probs = self._softmax(self._weights[exam], self._vector(Counter(known)))
+        return sorted(((p, label) for label, p in probs.items()), key=lambda s: s[0], reverse=True)
+
+    def classify(self, user_text: str, current_exam_context: Optional[str] = None) -> RouteDecision:
+        """A RouteDecision whose confidence says whether the model router is still needed."""
+        padded = f" {_normalize(user_text)} "
+        intent = next((i for i, words in INTENT_KEYWORDS if _has_alias(padded, words)), Intent.PLAN)
+        context = _normalize(current_exam_context or "")
+
+        cued = _has_alias(padded, _PREP_CUES)
+        exams = [
+            e for e, aliases in EXAM_ALIASES.items()
+            if _has_alias(padded, aliases, cued or any(
+                _has_alias(padded, SUBJECT_ALIASES.get(s, [s]), False) for s in SYLLABI_REGISTRY[e]
+            ))
+        ]
+        if len(exams) == 1:
+            exam = exams[0]
+            # The goal naming a different exam than the one picked in the UI needs a closer look
+            exam_confidence = 1.0 if context in (exam, "") or context not in SYLLABI_REGISTRY else 0.6
+        elif context in SYLLABI_REGISTRY and (not exams or context in exams):
+            exam, exam_confidence = context, 0.95 if not exams else 0.85
+        else:
+            return self._unsure(intent)
+
+        subjects = SYLLABI_REGISTRY[exam]
+        # An exam named outright also places a short subject alias ("CAT qa")
+        named = [s for s in subjects if _has_alias(padded, SUBJECT_ALIASES.get(s, [s]), cued or bool(exams))]
+        sub = next((b for b, aliases in SUB_SUBJECT_ALIASES.items() if _has_alias(padded, aliases)), None)
+        if sub and "chemistry" in subjects and "chemistry" not in named:
+            named.append("chemistry")
+        if "chemistry" in named and sub is None and _has_alias(padded, ["physical"]):
+            sub = "physical"
+
+        if len(named) == 1:
+            subject, subject_confidence = named[0], 1.0
+        elif named:
+            # Several subjects: the model decides how to scope a mixed plan
+            return self._unsure(intent, exam)
+        else:
+            ranked = self.probabilities(user_text, exam)
+            if not ranked and _names_whole_exam(padded):
+                # Only the exam and plan wording: the whole exam
+                subject, subject_confidence = "general", 0.9
+            elif ranked and ranked[0][0] >= self.MIN_PROBABILITY:
+                (_, subject, sub), subject_confidence = ranked[0][1], 0.8
+            else:
+                return self._unsure(intent, exam)
+
+        if subject != "chemistry":
+            sub = None
+        return RouteDecision(
+            intent=intent,
+            exam=ExamType(exam),
+            scope=SubjectScope(subject=subject.capitalize(), sub_subject=sub.capitalize() if sub else None),
+            confidence=round(min(exam_confidence, subject_confidence), 2),
+            needs_clarification=False,
+        )
+
+    @staticmethod
+    def _unsure(intent: Intent, exam: Optional[str] = None) -> RouteDecision:
+        return RouteDecision(
+            intent=intent,
+            exam=ExamType(exam) if exam else ExamType.NONE,
+            scope=SubjectScope(subject="General"),
+            confidence=0.0,
+            needs_clarification=False,
+        )
+
+
+local_classifier = LocalRouteClassifier()
+local_classifier.fit_registry(SYLLABI_REGISTRY)
+
+
+# --- 4. The Router Agent ---
+_route_memo: "OrderedDict[str, Tuple[float, RouteDecision]]" = OrderedDict()
+_route_stats = {"local": 0, "memo": 0, "model": 0, "fallback": 0}
+
+
+def _record_route(source: str) -> None:
+    _route_stats[source] += 1
+    route_decisions.inc(source=source)
+    tracer.current_span().set_attribute("app.route_source", source)
+
+
+def _memo_key(user_text: str, current_exam_context: Optional[str]) -> str:
+    return f"{_normalize(current_exam_context or '')}|{_normalize(user_text)}"
+
+
+def _route_without_model(user_text: str, current_exam_context: Optional[str]) -> Optional[Tuple[str, RouteDecision]]:
+    """(source, decision) from the local classifier or the route memo, or None if the model is needed."""
+    if ROUTER_LOCAL_ENABLED:
+        decision = local_classifier.classify(user_text, current_exam_context)
+        if decision.confidence >= ROUTER_LOCAL_MIN_CONFIDENCE:
+            return "local", decision
+    cached = _route_memo.get(_memo_key(user_text, current_exam_context))
+    if cached and time.monotonic() - cached[0] < ROUTER_MEMO_TTL_SECONDS:
+        return "memo", cached[1]
+    return None
+
+
+def route_needs_model(user_text: str, current_exam_context: str = None) -> bool:
+    """True if route_request will call the model router for this input (nothing is recorded)."""
+    return _route_without_model(user_text, current_exam_context) is None
+
+
 async def route_request(user_text: str, current_exam_context: str = None) -> RouteDecision:
+    memo_key = _memo_key(user_text, current_exam_context)
+    known = _route_without_model(user_text, current_exam_context)
+    if known is not None:
+        source, decision = known
+        _record_route(source)
+        if source == "memo":
+            _route_memo.move_to_end(memo_key)
+            return decision.model_copy(deep=True)
+        return decision
+
     prompt = f"""
     Analyze the user's request for an exam prep app.
     Current Context Exam: {current_exam_context}
@@ -77,53 +384,50 @@ async def route_request(user_text: str, current_exam_context: str = None) -> Rou
     Output JSON conforming to the RouteDecision schema.
     """
     
-    # Using client.aio for async call as per plan_agent.py pattern
-    response = await client.aio.models.generate_content(
-        model=os.getenv("GEMINI_MODEL", "gemini-3-pro-preview"), # Using configured model
-        contents=prompt,
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": RouteDecision,
-        }
+    # Routing is a pure function of the prompt, so identical goals hit the response cache
+    decision = await generate_structured(
+        prompt,
+        RouteDecision,
+        model=os.getenv("GEMINI_MODEL", "gemini-3-pro-preview"),
+        agent="router.route_request",
+        cache=True,
+        hedge=True,
     )
-    return response.parsed
+    if decision is None:
+        # No usable model answer: keep the local guess (a whole-exam scope at worst), but don't memoize it
+        print(f"⚠️ Model router returned nothing, using the local route for {user_text!r}")
+        _record_route("fallback")
+        return local_classifier.classify(user_text, current_exam_context)
+    _record_route("model")
+    _route_memo[memo_key] = (time.monotonic(), decision.model_copy(deep=True))
+    _route_memo.move_to_end(memo_key)
+    while len(_route_memo) > ROUTER_MEMO_MAX_ENTRIES:
+        _route_memo.popitem(last=False)
+    return decision
+
+
+def route_stats() -> dict:
+    total = sum(_route_stats.values())
+    return {
+        "local_enabled": ROUTER_LOCAL_ENABLED,
+        "min_confidence": ROUTER_LOCAL_MIN_CONFIDENCE,
+        **_route_stats,
+        "local_ratio": round(_route_stats["local"] / total, 3) if total else None,
+        "memo_entries": len(_route_memo),
+    }
+
+# --- 5. The Scope Guard (The Fix) ---
+# Compiled once: per-scope syllabus texts and a topic index (see services/syllabus_catalog.py)
+syllabus_catalog = SyllabusCatalog(SYLLABI_REGISTRY, subject_aliases=SUBJECT_ALIASES)
+
 
-# --- 4. The Scope Guard (The Fix) ---
 def get_safe_syllabus(decision: RouteDecision) -> str:
     """Returns the SPECIFIC syllabus chunk based on scope."""
-    exam = decision.exam.value
-    subject = decision.scope.subject.lower()
-    sub = decision.scope.sub_subject.lower() if decision.scope.sub_subject else None
-    
-    # Safety Check: If user asks for "History" in "NEET", error out.
-    # Note: dictionary keys are lowercase in SYLLABI_REGISTRY
-    
-    exam_registry = SYLLABI_REGISTRY.get(exam, {})
-    
-    # 1. Handle UPSC/CAT (Flat subjects) - and simple subjects in others
-    if exam in ["upsc", "cat"]:
-        if subject in exam_registry:
-            return exam_registry[subject]
-        # Basic partial match search if exact match fails
-        for key in exam_registry:
-            if key in subject or subject in key:
-                 return exam_registry[key]
-            
-    # 2. Handle NEET/JEE (Nested Chemistry)
-    if exam in ["neet", "jee"]:
-        if subject == "chemistry":
-            if isinstance(exam_registry.get("chemistry"), dict):
-                 if sub and sub in exam_registry["chemistry"]:
-                     return exam_registry["chemistry"][sub]
-                 else:
-                     # Return all chemistry if sub not found or generic
-                     return str(exam_registry["chemistry"])
-            else:
-                 return exam_registry.get("chemistry")
-        
-        if subject in exam_registry:
-            return exam_registry[subject]
-
-    # Fallback: Return FULL syllabus if scope is generic
-    # But warn the plan agent to filter.
-    return str(SYLLABI_REGISTRY.get(exam, "Standard Syllabus"))
+    # Safety Check: a subject the exam does not have (e.g. "History" in "NEET")
+    # resolves to the whole exam, and the plan agent is told to filter.
+    scope = syllabus_catalog.resolve_scope(
+        decision.exam.value, decision.scope.subject, decision.scope.sub_subject
+    )
+    if scope is None:
+        return "Standard Syllabus"
+    return syllabus_catalog.scope_text(*scope)
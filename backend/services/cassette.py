@@ -0,0 +1,344 @@
+"""
+Cassettes - Record real Gemini sessions and replay them offline.
+
+GEMINI_BACKEND=record wraps the live client. Every generate_content and
+generate_content_stream call is appended to the cassette file. An entry
+holds the prompt, the schema name, the structured or text response, the
+token usage, and the timing: time to response (first chunk for streams)
+plus the gap before each later chunk. Upstream errors are recorded too,
+so fault patterns replay as well.
+
+GEMINI_BACKEND=replay serves responses from the cassette instead of the
+network. Calls are matched on (kind, model, prompt, schema). Repeats of
+the same call come back in recorded order, cycling when exhausted. When a
+prompt was never recorded, GEMINI_REPLAY_ON_MISS decides what happens:
+"nearest" serves a recording of the same kind, model and schema (picked
+deterministically from the prompt hash, stepping on for repeats), and
+"error" raises.
+GEMINI_REPLAY_SPEED scales the recorded timing: 1 keeps the original
+timing, 0.5 is twice as fast, and 0 drops all delays.
+
+File format: JSON lines, gzip-compressed when the path ends in .gz. The
+first line is a header, then one entry per call:
+    {"kind": "structured", "key": "...", "model": "...", "schema": "Quiz",
+     "prompt": "...", "latency": 1.84, "parsed": {...}, "usage": [812, 430]}
+    {"kind": "stream", ..., "latency": 0.61, "chunks": [[0.0, "..."], [0.08, "..."]]}
+    {"kind": "text", ..., "error": {"code": 503, "status": "UNAVAILABLE", "message": "..."}}
+"""
+
+import os
+import gzip
+import json
+import time
+import asyncio
+import hashlib
+import datetime
+from typing import Any, AsyncIterator, Dict, IO, List, Optional, Tuple
+
+from google.genai import errors as genai_errors
+from pydantic import BaseModel
+
+from services.fake_gemini import FakeResponse, FakeUsage
+from services.prompt_contents import prompt_text, render_contents
+
+
+GEMINI_CASSETTE = os.getenv("GEMINI_CASSETTE", "cassettes/gemini.jsonl.gz")
+GEMINI_REPLAY_SPEED = float(os.getenv("GEMINI_REPLAY_SPEED", "1"))
+GEMINI_REPLAY_ON_MISS = os.getenv("GEMINI_REPLAY_ON_MISS", "nearest")  # "nearest" or "error"
+# Set to 0 to keep prompts out of recordings (matching still works off the key)
+GEMINI_CASSETTE_PROMPTS = os.getenv("GEMINI_CASSETTE_PROMPTS", "1") == "1"
+
+CASSETTE_VERSION = 1
+
+
+def _schema_of(config: Any) -> Optional[type]:
+    schema = config.get("response_schema") if isinstance(config, dict) else getattr(config, "response_schema", None)
+    return schema if isinstance(schema, type) and issubclass(schema, BaseModel) else None
+
+
+def call_key(kind: str, model: str, contents: Any, schema: Optional[type]) -> str:
+    """Hash identifying one call shape; images are included in full via the rendered contents."""
+    h = hashlib.sha256()
+    for part in (kind, model, schema.__name__ if schema else "", render_contents(contents)):
+        h.update(part.encode())
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def _open(path: str, mode: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _usage(response: Any) -> Optional[List[int]]:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    return [getattr(usage, "prompt_token_count", None) or 0, getattr(usage, "candidates_token_count", None) or 0]
+
+
+def _error_dict(exc: Exception) -> Optional[Dict[str, Any]]:
+    if isinstance(exc, genai_errors.APIError):
+        return {"code": exc.code, "status": exc.status, "message": exc.message}
+    return None
+
+
+def _raise_recorded(error: Dict[str, Any]) -> None:
+    body = {"error": error}
+    if error["code"] >= 500:
+        raise genai_errors.ServerError(error["code"], body)
+    raise genai_errors.ClientError(error["code"], body)
+
+
+# --- Recording ---
+
+class CassetteWriter:
+    """Appends entries to a cassette file, flushing after each so a crash loses at most one call."""
+
+    def __init__(self, path: str = GEMINI_CASSETTE, store_prompts: bool = GEMINI_CASSETTE_PROMPTS):
+        self.path = path
+        self.store_prompts = store_prompts
+        self.entries = 0
+        self._file: Optional[IO[str]] = None
+
+    def write(self, entry: Dict[str, Any]) -> None:
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            new_file = not os.path.exists(self.path)
+            # Appending to a .gz adds a new gzip member; readers see one stream
+            self._file = _open(self.path, "a")
+            if new_file:
+                self._write_line({"cassette": CASSETTE_VERSION, "created": datetime.datetime.now(datetime.timezone.utc).isoformat()})
+        self._write_line(entry)
+        self.entries += 1
+
+    def _write_line(self, entry: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class RecordingModels:
+    """Wraps live `client.aio.models`, recording each call as it completes."""
+
+    def __init__(self, inner: Any, writer: CassetteWriter):
+        self.inner = inner
+        self.writer = writer
+
+    def _entry(self, kind: str, model: str, contents: Any, schema: Optional[type]) -> Dict[str, Any]:
+        entry = {
+            "kind": kind,
+            "key": call_key(kind, model, contents, schema),
+            "model": model,
+            "schema": schema.__name__ if schema else None,
+        }
+        if self.writer.store_prompts:
+            entry["prompt"] = prompt_text(contents)
+        return entry
+
+    async def generate_content(self, model: str, contents: Any, config: Any = None) -> Any:
+        schema = _schema_of(config)
+        entry = self._entry("structured" if schema else "text", model, contents, schema)
+        started = time.monotonic()
+        try:
+            response = await self.inner.generate_content(model=model, contents=contents, config=config)
+        except Exception as e:
+            error = _error_dict(e)
+            if error is not None:
+                self.writer.write({**entry, "latency": round(time.monotonic() - started, 4), "error": error})
+            raise
+        entry["latency"] = round(time.monotonic() - started, 4)
+        parsed = getattr(response, "parsed", None)
+        if schema and isinstance(parsed, BaseModel):
+            entry["parsed"] = parsed.model_dump(mode="json")
+        else:
+            entry["text"] = response.text
+        entry["usage"] = _usage(response)
+        self.writer.write(entry)
+        return response
+
+    async def generate_content_stream(self, model: str, contents: Any, config: Any = None) -> AsyncIterator[Any]:
+        entry = self._entry("stream", model, contents, _schema_of(config))
+        started = time.monotonic()
+        try:
+            stream = await self.inner.generate_content_stream(model=model, contents=contents, config=config)
+        except Exception as e:
+            error = _error_dict(e)
+            if error is not None:
+                self.writer.write({**entry, "latency": round(time.monotonic() - started, 4), "error": error})
+            raise
+
+        async def _recorded() -> AsyncIterator[Any]:
+            chunks: List[Tuple[float, str]] = []
+            usage = None
+            last = None
+            try:
+                async for chunk in stream:
+                    now = time.monotonic()
+                    if last is None:
+                        entry["latency"] = round(now - started, 4)
+                    chunks.append((round(now - last, 4) if last is not None else 0.0, chunk.text or ""))
+                    last = now
+                    usage = _usage(chunk) or usage
+                    yield chunk
+            except Exception as e:
+                error = _error_dict(e)
+                if error is not None:
+                    entry.setdefault("latency", round(time.monotonic() - started, 4))
+                    self.writer.write({**entry, "chunks": chunks, "usage": usage, "error": error})
+                raise
+            # Streams abandoned by the caller (client disconnect) never get here and aren't recorded
+            entry.setdefault("latency", round(time.monotonic() - started, 4))
+            self.writer.write({**entry, "chunks": chunks, "usage": usage})
+
+        return _recorded()
+
+
+# --- Replay ---
+
+class Cassette:
+    """Recorded entries indexed by exact call key and by (kind, model, schema)."""
+
+    def __init__(self, entries: List[Dict[str, Any]]):
+        self.entries = entries
+        self._by_key: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_shape: Dict[Tuple[str, str, Optional[str]], List[Dict[str, Any]]] = {}
+        for entry in entries:
+            self._by_key.setdefault(entry["key"], []).append(entry)
+            self._by_shape.setdefault((entry["kind"], entry["model"], entry["schema"]), []).append(entry)
+
+    @classmethod
+    def load(cls, path: str = GEMINI_CASSETTE) -> "Cassette":
+        entries = []
+        with _open(path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    if "kind" in record:  # Skip headers (one per appended session)
+                        entries.append(record)
+        return cls(entries)
+
+    def exact(self, key: str, occurrence: int = 0) -> Optional[Dict[str, Any]]:
+        """The `occurrence`-th recording of this exact call, cycling through repeats."""
+        matches = self._by_key.get(key)
+        if not matches:
+            return None
+        return matches[occurrence % len(matches)]
+
+    def nearest(self, key: str, kind: str, model: str, schema: Optional[str], occurrence: int = 0) -> Optional[Dict[str, Any]]:
+        """A recording of the same shape; repeats (e.g. retries) step through the candidates."""
+        candidates = self._by_shape.get((kind, model, schema))
+        if not candidates:
+            # Same call recorded on another model (e.g. before a model policy change)
+            candidates = [e for (k, _, s), group in self._by_shape.items() if k == kind and s == schema for e in group]
+        if not candidates:
+            return None
+        return candidates[(int(key[:8], 16) + occurrence) % len(candidates)]
+
+    def summary(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for entry in self.entries:
+            name = entry["schema"] or entry["kind"]
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
+
+class ReplayMiss(LookupError):
+    """A call with no recording to serve (GEMINI_REPLAY_ON_MISS=error, or nothing of its shape)."""
+
+
+class ReplayModels:
+    """Implements `client.aio.models` from a Cassette."""
+
+    def __init__(self, cassette: Cassette, speed: float = GEMINI_REPLAY_SPEED, on_miss: str = GEMINI_REPLAY_ON_MISS):
+        self.cassette = cassette
+        self.speed = max(0.0, speed)
+        self.on_miss = on_miss
+        self.stats = {"calls": 0, "exact": 0, "nearest": 0, "misses": 0, "errors_replayed": 0}
+        self._occurrences: Dict[str, int] = {}  # Per replay, so each client starts from the top
+
+    def _lookup(self, kind: str, model: str, contents: Any, schema: Optional[type]) -> Dict[str, Any]:
+        self.stats["calls"] += 1
+        key = call_key(kind, model, contents, schema)
+        occurrence = self._occurrences.get(key, 0)
+        self._occurrences[key] = occurrence + 1
+        entry = self.cassette.exact(key, occurrence)
+        if entry is not None:
+            self.stats["exact"] += 1
+            return entry
+        if self.on_miss == "nearest":
+            entry = self.cassette.nearest(key, kind, model, schema.__name__ if schema else None, occurrence)
+            if entry is not None:
+                self.stats["nearest"] += 1
+                return entry
+        self.stats["misses"] += 1
+        raise ReplayMiss(f"No recorded {kind} call for {model} ({schema.__name__ if schema else 'text'})")
+
+    async def _sleep(self, seconds: float) -> None:
+        if seconds > 0 and self.speed > 0:
+            await asyncio.sleep(seconds * self.speed)
+
+    def _usage(self, entry: Dict[str, Any]) -> Optional[FakeUsage]:
+        usage = entry.get("usage")
+        return FakeUsage(usage[0], usage[1]) if usage else None
+
+    async def generate_content(self, model: str, contents: Any, config: Any = None) -> FakeResponse:
+        schema = _schema_of(config)
+        entry = self._lookup("structured" if schema else "text", model, contents, schema)
+        await self._sleep(entry["latency"])
+        if entry.get("error"):
+            self.stats["errors_replayed"] += 1
+            _raise_recorded(entry["error"])
+        if schema is not None:
+            parsed = schema.model_validate(entry["parsed"]) if entry.get("parsed") is not None else None
+            text = parsed.model_dump_json() if parsed is not None else ""
+            return FakeResponse(text, parsed, self._usage(entry))
+        return FakeResponse(entry.get("text") or "", None, self._usage(entry))
+
+    async def generate_content_stream(self, model: str, contents: Any, config: Any = None) -> AsyncIterator[FakeResponse]:
+        entry = self._lookup("stream", model, contents, _schema_of(config))
+        chunks = entry.get("chunks") or []
+        if not chunks and entry.get("error"):
+            await self._sleep(entry["latency"])
+            self.stats["errors_replayed"] += 1
+            _raise_recorded(entry["error"])
+
+        async def _replayed() -> AsyncIterator[FakeResponse]:
+            await self._sleep(entry["latency"])
+            for index, (gap, text) in enumerate(chunks):
+                await self._sleep(gap)
+                usage = self._usage(entry) if index == len(chunks) - 1 else None
+                yield FakeResponse(text, None, usage)
+            if entry.get("error"):
+                self.stats["errors_replayed"] += 1
+                _raise_recorded(entry["error"])
+
+        return _replayed()
+
+
+class _CassetteAio:
+    def __init__(self, models: Any):
+        self.models = models
+
+
+class RecordingClient:
+    """Drop-in for genai.Client that records through to the live client."""
+
+    def __init__(self, inner: Any, writer: CassetteWriter):
+        self.inner = inner
+        self.writer = writer
+        self.aio = _CassetteAio(RecordingModels(inner.aio.models, writer))
+
+
+class ReplayClient:
+    """Drop-in for genai.Client that serves calls from a cassette."""
+
+    def __init__(self, cassette: Cassette, speed: float = GEMINI_REPLAY_SPEED, on_miss: str = GEMINI_REPLAY_ON_MISS):
+        self.cassette = cassette
+        self.aio = _CassetteAio(ReplayModels(cassette, speed, on_miss))
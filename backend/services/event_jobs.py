@@ -0,0 +1,227 @@
+"""
+Event Jobs - Run a streaming pipeline as a server-side job with a replayable event log.
+
+A streamed endpoint used to run its pipeline inside the HTTP response, so a
+dropped connection threw the work away and a reconnect started over. A job
+runs the pipeline in a background task and appends every event it yields
+to the job's log, with IDs "<job_id>:<n>" numbered from 1. Clients follow
+the log instead:
+
+- a reconnecting client resumes after its last event ID (Last-Event-ID),
+  which names the job, so it never skips events of another job
+- identical requests (e.g. a second tab) follow the same running job; once
+  it has finished, a new request starts a fresh job
+- a finished job is replayed from its log, with no model calls, to readers
+  that name it, until it expires after EVENT_JOB_RETAIN_SECONDS
+
+Disconnecting does not cancel a job: the pipeline is bounded and its
+result is what the reconnecting client is waiting for. Jobs live in this
+process's memory.
+
+The pipeline runs outside any response, so each job is timed as a stream
+of its own under the endpoint "job:<name>": its queue wait, upstream first
+chunk and gaps, and the events it appends. Response streams only time the
+delivery of the log.
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from services.metrics import metrics
+from services.stream_timing import stream_timing
+
+
+EVENT_JOB_RETAIN_SECONDS = float(os.getenv("EVENT_JOB_RETAIN_SECONDS", "3600"))
+# Finished jobs kept for replay; running jobs are never evicted
+EVENT_JOB_MAX_RETAINED = int(os.getenv("EVENT_JOB_MAX_RETAINED", "500"))
+
+event_job_follows = metrics.counter(
+    "event_job_follows_total", "Job event log readers by how they joined (started, live_join, resume, replay).",
+    ("name", "source"))
+
+
+def parse_event_id(value: Optional[str]) -> Tuple[Optional[str], int]:
+    """'<job_id>:<n>' (or a bare '<n>') as (job_id, n); (None, 0) if missing or malformed."""
+    if not value:
+        return None, 0
+    job_id, _, number = value.rpartition(":")
+    try:
+        return job_id or None, max(0, int(number))
+    except ValueError:
+        return None, 0
+
+
+class EventJob:
+    """One pipeline run and its event log."""
+
+    def __init__(self, key: str):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.events: List[str] = []  # JSON lines, each with "event_id" ("<job_id>:<n>") and "job_id"
+        self.done = False
+        self.error: Optional[str] = None
+        self.subscribers = 0
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None  # time.monotonic(), for expiry
+        self.changed = asyncio.Event()
+        self.task: Optional["asyncio.Task"] = None
+
+    def notify(self) -> None:
+        event, self.changed = self.changed, asyncio.Event()
+        event.set()
+
+    def event_id(self, number: int) -> str:
+        return f"{self.id}:{number}"
+
+    def append(self, event: Dict[str, Any]) -> None:
+        self.events.append(json.dumps({"event_id": self.event_id(len(self.events) + 1), "job_id": self.id, **event}) + "\n")
+        self.notify()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "state": "failed" if self.error else "complete" if self.done else "running",
+            "events": len(self.events),
+            "subscribers": self.subscribers,
+            "created_at": self.created_at,
+            "error": self.error,
+        }
+
+
+class EventJobRunner:
+    """Starts jobs for one endpoint, keyed by request, and serves their event logs."""
+
+    def __init__(self, name: str, retain_seconds: float = EVENT_JOB_RETAIN_SECONDS, max_retained: int = EVENT_JOB_MAX_RETAINED):
+        self.name = name
+        self.retain_seconds = retain_seconds
+        self.max_retained = max_retained
+        self._jobs: Dict[str, EventJob] = {}
+        self._by_key: Dict[str, str] = {}
+        self._stats = {"started": 0, "completed": 0, "failed": 0, "live_joins": 0, "resumes": 0, "replays": 0}
+
+    def _purge_expired(self) -> None:
+        now = time.monotonic()
+        finished = sorted(
+            (j for j in self._jobs.values() if j.done),
+            key=lambda j: j.finished_at,
+        )
+        overflow = len(finished) - self.max_retained
+        for index, job in enumerate(finished):
+            if index < overflow or now - job.finished_at > self.retain_seconds:
+                del self._jobs[job.id]
+                if self._by_key.get(job.key) == job.id:
+                    del self._by_key[job.key]
+
+    async def _pump(self, job: EventJob, factory: Callable[[], AsyncIterator[str]]) -> None:
+        try:
+            # The task has its own context, so the job's trace only sees the pipeline's model calls
+            async for line in stream_timing.instrument(f"job:{self.name}", factory()):
+                job.append(json.loads(line))
+            self._stats["completed"] += 1
+        except asyncio.CancelledError:
+            job.error = "cancelled"
+            job.append({"type": "error", "message": "Job was cancelled"})
+            raise
+        except Exception as e:
+            print(f"⚠️ {self.name} job {job.id} failed: {e}")
+            job.error = str(e)
+            job.append({"type": "error", "message": str(e)})
+        finally:
+            if job.error is not None:
+                self._stats["failed"] += 1
+                # A retry of the same request starts a fresh job; this log stays readable by ID
+                if self._by_key.get(job.key) == job.id:
+                    del self._by_key[job.key]
+            job.done = True
+            job.finished_at = time.monotonic()
+            job.notify()
+
+    def start(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> Tuple[EventJob, bool]:
+        """
+        The running job for `key`, or a new one running `factory()` (an async
+        iterator of JSON lines). Finished jobs are only reachable by ID.
+        Returns (job, started).
+        """
+        self._purge_expired()
+        job_id = self._by_key.get(key)
+        if job_id is not None and not self._jobs[job_id].done:
+            return self._jobs[job_id], False
+        job = EventJob(key)
+        self._jobs[job.id] = job
+        self._by_key[key] = job.id
+        job.task = asyncio.create_task(self._pump(job, factory))
+        self._stats["started"] += 1
+        return job, True
+
+    def get(self, job_id: str) -> Optional[EventJob]:
+        self._purge_expired()
+        return self._jobs.get(job_id)
+
+    def attach(
+        self, key: str, factory: Callable[[], AsyncIterator[str]], last_event_id: Optional[str] = None
+    ) -> Tuple[EventJob, bool, int]:
+        """
+        The job a request should follow: (job, started, events to skip).
+
+        A Last-Event-ID from a retained job for the same request resumes that
+        job, even if it has finished. Anything else follows the running job for
+        `key`, or a new one, from its first event.
+        """
+        job_id, after = parse_event_id(last_event_id)
+        job = self.get(job_id) if job_id else None
+        if job is not None and job.key == key:
+            return job, False, after
+        job, started = self.start(key, factory)
+        return job, started, 0
+
+    @staticmethod
+    def resume_point(job: EventJob, last_event_id: Optional[str]) -> int:
+        """Events of `job` to skip for a reader that last saw `last_event_id` (0 if it names another job)."""
+        job_id, after = parse_event_id(last_event_id)
+        return after if job_id in (None, job.id) else 0
+
+    def join_source(self, job: EventJob, started: bool, after: int) -> str:
+        """How a reader joined: started, live_join, resume or replay (also counted)."""
+        if started:
+            source = "started"
+        elif after > 0:
+            source = "resume"
+            self._stats["resumes"] += 1
+        elif job.done:
+            source = "replay"
+            self._stats["replays"] += 1
+        else:
+            source = "live_join"
+            self._stats["live_joins"] += 1
+        event_job_follows.inc(name=self.name, source=source)
+        return source
+
+    async def follow(self, job: EventJob, after: int = 0) -> AsyncIterator[Tuple[str, str]]:
+        """Yield (event_id, JSON line) for events after number `after`, then live ones until the job ends."""
+        job.subscribers += 1
+        position = max(0, after)
+        try:
+            while True:
+                if position < len(job.events):
+                    position += 1
+                    yield job.event_id(position), job.events[position - 1]
+                    continue
+                if job.done:
+                    return
+                await job.changed.wait()
+        finally:
+            job.subscribers -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        running = [j for j in self._jobs.values() if not j.done]
+        return {
+            "running_jobs": len(running),
+            "retained_jobs": len(self._jobs) - len(running),
+            "subscribers": sum(j.subscribers for j in self._jobs.values()),
+            "retained_events": sum(len(j.events) for j in self._jobs.values()),
+            **self._stats,
+        }
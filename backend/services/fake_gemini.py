@@ -0,0 +1,506 @@
+"""
+Fake Gemini - Deterministic local stand-in for the Gemini API.
+
+Selected with GEMINI_BACKEND=fake. It replaces the genai.Client built in
+genai_service, so every agent runs unchanged (scheduler, retries, caches
+and all) without network access or an API key.
+
+- Structured calls return schema-valid objects for every agent schema,
+  derived from a hash of (model, prompt, schema), so identical requests
+  always get identical answers. Known schemas are shaped from the prompt
+  (day counts, question counts, topic lists) so agent logic downstream
+  behaves as it does against the real model.
+- Streaming splits a deterministic text into fixed-size chunks.
+- Latency and inter-chunk delay follow configurable distributions, and
+  429/503 errors can be injected at a fixed rate. These draw from a seeded
+  RNG, so a given call order replays exactly.
+
+Latency specs: "fixed:S", "uniform:A,B", "normal:MEAN,STD",
+"lognormal:MEDIAN,SIGMA", "exp:MEAN" (all in seconds).
+"""
+
+import os
+import re
+import json
+import math
+import random
+import asyncio
+import hashlib
+import typing
+from enum import Enum
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from google.genai import errors as genai_errors
+from pydantic import BaseModel
+
+from services.prompt_contents import prompt_text
+
+
+GEMINI_BACKEND = os.getenv("GEMINI_BACKEND", "live")  # "fake" selects this module; see cassette.py for record/replay
+FAKE_GEMINI_SEED = int(os.getenv("FAKE_GEMINI_SEED", "0"))
+FAKE_GEMINI_LATENCY = os.getenv("FAKE_GEMINI_LATENCY", "fixed:0")
+# Per-model latency overrides, e.g. {"gemini-3-pro-preview": "lognormal:2.0,0.5"}
+FAKE_GEMINI_MODEL_LATENCY: Dict[str, str] = json.loads(os.getenv("FAKE_GEMINI_MODEL_LATENCY", "{}"))
+FAKE_GEMINI_CHUNK_LATENCY = os.getenv("FAKE_GEMINI_CHUNK_LATENCY", "fixed:0")
+FAKE_GEMINI_STREAM_CHUNK_CHARS = int(os.getenv("FAKE_GEMINI_STREAM_CHUNK_CHARS", "48"))
+FAKE_GEMINI_TEXT_CHARS = int(os.getenv("FAKE_GEMINI_TEXT_CHARS", "1200"))
+FAKE_GEMINI_429_RATE = float(os.getenv("FAKE_GEMINI_429_RATE", "0"))
+FAKE_GEMINI_503_RATE = float(os.getenv("FAKE_GEMINI_503_RATE", "0"))
+# Fraction of plan verifications that come back invalid (exercises the fix loop)
+FAKE_GEMINI_PLAN_INVALID_RATE = float(os.getenv("FAKE_GEMINI_PLAN_INVALID_RATE", "0"))
+
+_WORDS = (
+    "concept energy cell force reaction balance structure system process rate "
+    "equilibrium function pattern model principle cycle transfer field law "
+    "evidence analysis example structure variable constant relation method"
+).split()
+
+
+# --- Latency Distributions ---
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Turn a latency spec string into a sampler returning seconds (never negative)."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()] if args else []
+    kind = kind.strip().lower()
+    if kind == "fixed":
+        seconds = values[0] if values else 0.0
+        return lambda rng: seconds
+    if kind == "uniform":
+        low, high = values
+        return lambda rng: rng.uniform(low, high)
+    if kind == "normal":
+        mean, std = values
+        return lambda rng: max(0.0, rng.gauss(mean, std))
+    if kind == "lognormal":
+        median, sigma = values
+        mu = math.log(median) if median > 0 else 0.0
+        return lambda rng: rng.lognormvariate(mu, sigma)
+    if kind == "exp":
+        mean = values[0]
+        return lambda rng: rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+    raise ValueError(f"Unknown latency spec: {spec!r}")
+
+
+# --- Response Objects (the subset of the SDK surface the agents use) ---
+
+class FakeUsage:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class FakeResponse:
+    def __init__(self, text: str, parsed: Optional[BaseModel] = None, usage: Optional[FakeUsage] = None):
+        self.text = text
+        self.parsed = parsed
+        self.usage_metadata = usage
+
+
+# --- Prompt Helpers ---
+
+def _find_int(pattern: str, text: str, default: int) -> int:
+    match = re.search(pattern, text, re.IGNORECASE)
+    return int(match.group(1)) if match else default
+
+
+def _find_str(pattern: str, text: str, default: str) -> str:
+    match = re.search(pattern, text, re.IGNORECASE)
+    return match.group(1).strip() if match else default
+
+
+def _bullets(text: str, header: Optional[str] = None) -> List[str]:
+    """Lines of the form '- item' (optionally only those after `header`)."""
+    if header is not None:
+        index = text.find(header)
+        if index < 0:
+            return []
+        text = text[index + len(header):]
+        # Stop at the first blank line after the list starts
+        text = re.split(r"\n\s*\n", text.lstrip("\n"), maxsplit=1)[0]
+    return [m.strip() for m in re.findall(r"^\s*-\s+(.+)$", text, re.MULTILINE)]
+
+
+# --- Generic Schema Synthesis ---
+
+def _sentence(rng: random.Random, words: int = 8) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _synthesize(annotation: Any, name: str, rng: random.Random) -> Any:
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+
+    if origin is typing.Union:
+        non_null = [a for a in args if a is not type(None)]
+        return _synthesize(non_null[0], name, rng) if non_null else None
+    if origin in (list, List):
+        item = args[0] if args else str
+        return [_synthesize(item, name, rng) for _ in range(3)]
+    if origin in (dict, Dict) or annotation is dict:
+        return {}
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return {
+            field_name: _synthesize(field.annotation, field_name, rng)
+            for field_name, field in annotation.model_fields.items()
+        }
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        return list(annotation)[0].value
+    if annotation is bool:
+        return True
+    if annotation is int:
+        if "index" in name:
+            return 0
+        if "score" in name:
+            return rng.randint(40, 95)
+        return rng.randint(1, 10)
+    if annotation is float:
+        if "confidence" in name or "priority" in name:
+            return round(rng.uniform(0.75, 0.98), 2)
+        return round(rng.uniform(1, 6), 1)
+    return f"{name.replace('_', ' ').capitalize()}: {_sentence(rng)}"
+
+
+def _question(rng: random.Random, topic: str, number: int, difficulty: str, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    question = {
+        "id": f"q{number}",
+        "text": f"Question {number} on {topic}: which statement about the {rng.choice(_WORDS)} is correct?",
+        "question_type": "multiple_choice",
+        "options": [f"Option {c}: {_sentence(rng, 4)}" for c in "ABCD"],
+        "correct_option_index": rng.randrange(4),
+        "explanation": _sentence(rng, 12),
+        "difficulty": difficulty if difficulty in ("easy", "medium", "hard") else "medium",
+        "concept_tested": f"{topic} {rng.choice(_WORDS)}",
+    }
+    question.update(extra or {})
+    return question
+
+
+# --- Schema Shapers (prompt-aware) ---
+
+def _shape_study_plan(data: Dict[str, Any], prompt: str, rng: random.Random, config: "FakeGeminiConfig") -> Dict[str, Any]:
+    days = _find_int(r"(\d+)-day", prompt, 7)
+    topics = _bullets(prompt) or [f"Topic {i + 1}" for i in range(days * 2)]
+    schedule = []
+    for day in range(1, days + 1):
+        names = [topics[(day - 1 + i) % len(topics)] for i in range(rng.randint(1, 3))]
+        schedule.append({
+            "day": day,
+            "theme": f"Day {day}: {names[0]}",
+            "topics": [
+                {"name": n, "difficulty": rng.choice(["easy", "medium", "hard"]), "rationale": _sentence(rng)}
+                for n in dict.fromkeys(names)
+            ],
+            "estimated_hours": float(rng.randint(4, 7)),
+        })
+    data.update({
+        "exam_name": _find_str(r"specializing in (.+?) preparation", prompt, "Exam"),
+        "total_days": days,
+        "schedule": schedule,
+        "critical_topics": topics[: min(5, max(3, len(topics)))],
+    })
+    return data
+
+
+def _shape_plan_verification(data: Dict[str, Any], prompt: str, rng: random.Random, config: "FakeGeminiConfig") -> Dict[str, Any]:
+    invalid = rng.random() < config.plan_invalid_rate
+    data.update({
+        "is_valid": not invalid,
+        "missing_topics": [_bullets(prompt)[0]] if invalid and _bullets(prompt) else [],
+        "overloaded_days": [],
+        "prerequisite_issues": [],
+        "critique": "Cover the missing syllabus topic." if invalid else "Plan covers the syllabus.",
+    })
+    return data
+
+
+def _shape_plan_patch(data: Dict[str, Any], prompt: str, rng: random.Random, config: "FakeGeminiConfig") -> Dict[str, Any]:
+    match = re.search(r"EDITABLE DAYS:\s*(\[.*\])\s*$", prompt, re.MULTILINE)
+    days = json.loads(match.group(1)) if match else []
+    missing = re.findall(r"'([^']+)'", _find_str(r"Missing topics:\s*(\[.*\])", prompt, "[]"))
+    for i, topic in enumerate(missing):
+        if days:
+            days[i % len(days)]["topics"].append({"name": topic, "difficulty": "medium", "rationale": _sentence(rng)})
+    for day in days:
+        day["estimated_hours"] = min(float(day["estimated_hours"]), 7.0)
+    data.update({"updated_days": days, "summary": "Moved the flagged topics into the editable days."})
+    return data
+
+
+def _shape_syllabus_extract(data: Dict[str, Any], prompt: str, rng: random.Random, config: "FakeGeminiConfig") -> Dict[str, Any]:
+    match = re.search(r"SYLLABUS EXCERPT:\n(.*?)\nINSTRUCTIONS:", prompt, re.DOTALL)
+    excerpt = match.group(1) if match else ""
+    units: List[Dict[str, Any]] = []
+    for line in excerpt.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.endswith(":") or line.startswith("#"):
+            units.append({"name": line.strip("#: "), "topics": []})
+        else:
+            if not units:
+                units.append({"name": "Continued", "topics": []})
+            units[-1]["topics"].append(re.sub(r"^(?:[-*]|\d+[.)])\s*", "", line))
+    data["units"] = units
+    return data
+
+
+def _shape_quiz(data: Dict[str, Any], prompt: str, rng: random.Random, config: "FakeGeminiConfig") -> Dict[str, Any]:
+    count = _find_int(r"Create a (\d+)-question quiz", prompt, 5)
+    topic = _find_str(r'quiz on "([^"]+)"', prompt, data.get("topic", "Topic"))
+    difficulty = _find_str(r"DIFFICULTY:\s*(\w+)", prompt, "medium").lower()
+    data.update({
+        "topic": topic,
+        "questions": [_question(rng, topic, i + 1, difficulty) for i in range(count)],
+        "time_estimate_minutes": count * 2,
+    })
+    return data
+
+
+def _shape_image_quiz(data: Dict[str, Any], prompt: str, rng: random.Random, config: "FakeGeminiConfig") -> Dict[str, Any]:
+    count = _find_int(r"create (\d+) quiz questions", prompt, 5)
+    topic = _find_str(r'diagram about "([^"]+)"', prompt, data.get("topic", "Diagram"))
+    difficulty = _find_str(r"DIFFICULTY:\s*(\w+)", prompt, "medium").lower()
+    regions = ["top-left", "top-right", "center", "bottom-left", "bottom-right"]
+    questions = [
+        _question(rng, topic, i + 1, difficulty, {"visual_reference": f"In the {regions[i % len(regions)]} section..."})
+        for i in range(count)
+    ]
+    data.update({
+        "topic": topic,
+        "questions": questions,
+        "visual_elements_used": [q["visual_reference"] for q in questions],
+        "time_estimate_minutes": count * 2,
+    })
+    return data
+
+
+def _shape_tutor_explanation(data: Dict[str, Any], prompt: str, rng: random.Random, config: "FakeGeminiConfig") -> Dict[str, Any]:
+    topic = _find_str(r'"([^"]+)"', prompt, data.get("topic", "Topic"))
+    data["topic"] = topic
+    data["steps"] = [
+        {"step_number": i + 1, "title": f"Step {i + 1}", "content": _sentence(rng, 20), "analogy": _sentence(rng)}
+        for i in range(rng.randint(3, 5))
+    ]
+    return data
+
+
+def _shape_multimodal(data: Dict[str, Any], prompt: str, rng: random.Random, config: "FakeGeminiConfig") -> Dict[str, Any]:
+    data["topic"] = _find_str(r'concept "([^"]+)"', prompt, data.get("topic", "Diagram"))
+    regions = ["top-left", "center", "bottom-right"]
+    for highlight, region in zip(data.get("visual_references", []), regions):
+        highlight["region"] = region
+    return data
+
+
+def _shape_misconception(data: Dict[str, Any], prompt: str, rng: random.Random, config: "FakeGeminiConfig") -> Dict[str, Any]:
+    data["wrong_option_chosen"] = _find_str(r"STUDENT CHOSE:\s*(.+)", prompt, "Option A")
+    data["redemption_question"] = _question(rng, "redemption", 1, "medium")
+    return data
+
+
+def _shape_performance(data: Dict[str, Any], prompt: str, rng: random.Random, config: "FakeGeminiConfig") -> Dict[str, Any]:
+    match = re.search(r"\((\d+)/(\d+) correct\)", prompt)
+    score = int(int(match.group(1)) * 100 / int(match.group(2))) if match and int(match.group(2)) else 50
+    data["overall_score"] = score
+    for i, mastery in enumerate(data.get("topic_mastery", [])):
+        mastery["score"] = max(0, min(100, score + rng.randint(-15, 15)))
+        mastery["status"] = ["mastered", "learning", "weak"][i % 3]
+    for i, rec in enumerate(data.get("recommendations", [])):
+        rec["priority"] = i + 1
+    return data
+
+
+def _shape_route_decision(data: Dict[str, Any], prompt: str, rng: random.Random, config: "FakeGeminiConfig") -> Dict[str, Any]:
+    from router import SYLLABI_REGISTRY
+
+    # Only look at what the user said, not the instructions listing every exam and intent
+    text = " ".join([
+        _find_str(r"User Input:\s*(.+)", prompt, prompt),
+        _find_str(r"Current Context Exam:\s*(.+)", prompt, ""),
+    ]).lower()
+    exam = next((e for e in SYLLABI_REGISTRY if re.search(rf"\b{e}\b", text)), None)
+    subject, sub_subject = "General", None
+    if exam:
+        for name, value in SYLLABI_REGISTRY[exam].items():
+            if name in text:
+                subject = name.capitalize()
+                if isinstance(value, dict):
+                    sub_subject = next((s.capitalize() for s in value if s in text), None)
+                break
+    intent = next((i for i in ("quiz", "explain", "autopilot") if i in text), "plan")
+    data.update({
+        "intent": intent,
+        "exam": exam or "none",
+        "scope": {"subject": subject, "sub_subject": sub_subject, "topics": []},
+        "confidence": 0.9 if exam else 0.5,
+        "needs_clarification": exam is None,
+        "clarifying_question": None if exam else "Which exam are you preparing for?",
+    })
+    return data
+
+
+def _shape_topic_selection(data: Dict[str, Any], prompt: str, rng: random.Random, config: "FakeGeminiConfig") -> Dict[str, Any]:
+    scored = []
+    for line in _bullets(prompt, "AVAILABLE TOPICS:"):
+        match = re.match(r"(.+):\s*(\d+(?:\.\d+)?)%", line)
+        if match:
+            scored.append((float(match.group(2)), match.group(1).strip()))
+    if scored:
+        data["selected_topic"] = min(scored)[1]  # Lowest mastery first, ties by name
+    data["prerequisites_met"] = True
+    data["estimated_difficulty"] = "medium"
+    return data
+
+
+def _shape_answer_evaluation(data: Dict[str, Any], prompt: str, rng: random.Random, config: "FakeGeminiConfig") -> Dict[str, Any]:
+    correct = "STUDENT WAS: CORRECT" in prompt
+    data["is_correct"] = correct
+    if correct:
+        data["misconception"] = None
+    return data
+
+
+SHAPERS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "StudyPlan": _shape_study_plan,
+    "PlanVerification": _shape_plan_verification,
+    "PlanPatch": _shape_plan_patch,
+    "SyllabusExtract": _shape_syllabus_extract,
+    "Quiz": _shape_quiz,
+    "ImageQuiz": _shape_image_quiz,
+    "TutorExplanation": _shape_tutor_explanation,
+    "MultimodalExplanation": _shape_multimodal,
+    "MisconceptionAnalysis": _shape_misconception,
+    "PerformanceAnalysis": _shape_performance,
+    "RouteDecision": _shape_route_decision,
+    "TopicSelection": _shape_topic_selection,
+    "AnswerEvaluation": _shape_answer_evaluation,
+}
+
+
+# --- Fake Client ---
+
+class FakeGeminiConfig:
+    """Knobs for the fake backend; defaults come from the FAKE_GEMINI_* env vars."""
+
+    def __init__(
+        self,
+        seed: int = FAKE_GEMINI_SEED,
+        latency: str = FAKE_GEMINI_LATENCY,
+        model_latency: Optional[Dict[str, str]] = None,
+        chunk_latency: str = FAKE_GEMINI_CHUNK_LATENCY,
+        chunk_chars: int = FAKE_GEMINI_STREAM_CHUNK_CHARS,
+        text_chars: int = FAKE_GEMINI_TEXT_CHARS,
+        rate_429: float = FAKE_GEMINI_429_RATE,
+        rate_503: float = FAKE_GEMINI_503_RATE,
+        plan_invalid_rate: float = FAKE_GEMINI_PLAN_INVALID_RATE,
+    ):
+        self.seed = seed
+        self.latency = parse_latency(latency)
+        self.model_latency = {
+            model: parse_latency(spec)
+            for model, spec in (FAKE_GEMINI_MODEL_LATENCY if model_latency is None else model_latency).items()
+        }
+        self.chunk_latency = parse_latency(chunk_latency)
+        self.chunk_chars = max(1, chunk_chars)
+        self.text_chars = text_chars
+        self.rate_429 = rate_429
+        self.rate_503 = rate_503
+        self.plan_invalid_rate = plan_invalid_rate
+
+
+class FakeModels:
+    """Implements the async `client.aio.models` methods the agents call."""
+
+    def __init__(self, config: FakeGeminiConfig):
+        self.config = config
+        self._rng = random.Random(config.seed)  # Latency and faults
+        self.stats = {"calls": 0, "streams": 0, "injected_429": 0, "injected_503": 0}
+
+    def _content_rng(self, model: str, prompt: str, salt: str) -> random.Random:
+        digest = hashlib.sha256(f"{self.config.seed}|{model}|{salt}|{prompt}".encode()).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    async def _delay_and_maybe_fail(self, model: str) -> None:
+        sampler = self.config.model_latency.get(model, self.config.latency)
+        delay = sampler(self._rng)
+        roll = self._rng.random()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if roll < self.config.rate_429:
+            self.stats["injected_429"] += 1
+            raise genai_errors.ClientError(429, {"error": {
+                "code": 429, "message": "Resource has been exhausted (fake)", "status": "RESOURCE_EXHAUSTED",
+            }})
+        if roll < self.config.rate_429 + self.config.rate_503:
+            self.stats["injected_503"] += 1
+            raise genai_errors.ServerError(503, {"error": {
+                "code": 503, "message": "The model is overloaded (fake)", "status": "UNAVAILABLE",
+            }})
+
+    def _text(self, model: str, prompt: str) -> str:
+        rng = self._content_rng(model, prompt, "text")
+        paragraphs, length = [], 0
+        while length < self.config.text_chars:
+            paragraph = " ".join(_sentence(rng, rng.randint(8, 16)) for _ in range(3))
+            paragraphs.append(paragraph)
+            length += len(paragraph) + 2
+        return "\n\n".join(paragraphs)[: self.config.text_chars]
+
+    def _structured(self, model: str, prompt: str, schema: type) -> BaseModel:
+        rng = self._content_rng(model, prompt, schema.__name__)
+        data = _synthesize(schema, schema.__name__, rng)
+        shaper = SHAPERS.get(schema.__name__)
+        if shaper is not None:
+            data = shaper(data, prompt, rng, self.config)
+        return schema.model_validate(data)
+
+    async def generate_content(self, model: str, contents: Any, config: Any = None) -> FakeResponse:
+        self.stats["calls"] += 1
+        await self._delay_and_maybe_fail(model)
+        prompt = prompt_text(contents)
+        schema = (config or {}).get("response_schema") if isinstance(config, dict) else getattr(config, "response_schema", None)
+        if isinstance(schema, type) and issubclass(schema, BaseModel):
+            parsed = self._structured(model, prompt, schema)
+            text = parsed.model_dump_json()
+        else:
+            parsed, text = None, self._text(model, prompt)
+        return FakeResponse(text, parsed, FakeUsage(len(prompt) // 4, len(text) // 4))
+
+    async def generate_content_stream(self, model: str, contents: Any, config: Any = None) -> AsyncIterator[FakeResponse]:
+        self.stats["streams"] += 1
+        await self._delay_and_maybe_fail(model)
+        prompt = prompt_text(contents)
+        schema = (config or {}).get("response_schema") if isinstance(config, dict) else getattr(config, "response_schema", None)
+        if isinstance(schema, type) and issubclass(schema, BaseModel):
+            # Structured streams arrive as slices of the JSON document
+            text = self._structured(model, prompt, schema).model_dump_json()
+        else:
+            text = self._text(model, prompt)
+        size = self.config.chunk_chars
+
+        async def _chunks() -> AsyncIterator[FakeResponse]:
+            pieces = [text[i:i + size] for i in range(0, len(text), size)]
+            for index, piece in enumerate(pieces):
+                if index:
+                    delay = self.config.chunk_latency(self._rng)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                usage = FakeUsage(len(prompt) // 4, len(text) // 4) if index == len(pieces) - 1 else None
+                yield FakeResponse(piece, None, usage)
+
+        return _chunks()
+
+
+class _FakeAio:
+    def __init__(self, models: FakeModels):
+        self.models = models
+
+
+class FakeGeminiClient:
+    """Drop-in for genai.Client as used by genai_service (only `.aio.models`)."""
+
+    def __init__(self, config: Optional[FakeGeminiConfig] = None):
+        self.config = config or FakeGeminiConfig()
+        self.aio = _FakeAio(FakeModels(self.config))
@@ -1,9 +1,528 @@
+"""
+GenAI Service - Process-wide Gemini client shared by every agent.
+
+All agents go through get_client() so that every model call reuses one
+keep-alive HTTP connection pool instead of paying a fresh TCP + TLS
+handshake per request.
+"""
+
 import os
+import time
+import asyncio
+from typing import Optional, Dict, Any, Type, TypeVar, Tuple, Callable, Awaitable, AsyncGenerator
+
+import httpx
 from google import genai
+from google.genai import types
+from pydantic import BaseModel
 from dotenv import load_dotenv
 
+from services.response_cache import response_cache, make_cache_key
+from services.scheduler import scheduler
+from services.resilience import resilience, classify_error
+from services.model_policy import models_for, rejection_reason, model_telemetry
+from services.hedging import hedger
+from services.fake_gemini import GEMINI_BACKEND, FakeGeminiClient
+from services.metrics import (
+    agent_call_seconds, agent_errors, gemini_request_seconds, record_usage,
+)
+from services.stream_timing import note_admitted, note_upstream
+from services.tracing import tracer
+from services.cassette import GEMINI_CASSETTE, Cassette, CassetteWriter, RecordingClient, ReplayClient
+
 load_dotenv()
 
-# Initialize the Gemini client
-# Using the standard client which exposes .aio for async operations
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+
+# --- Pool Configuration (tunable via env) ---
+
+POOL_MAX_CONNECTIONS = int(os.getenv("GEMINI_POOL_MAX_CONNECTIONS", "100"))
+POOL_MAX_KEEPALIVE = int(os.getenv("GEMINI_POOL_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("GEMINI_POOL_KEEPALIVE_EXPIRY", "120"))
+POOL_WARMUP_CONNECTIONS = int(os.getenv("GEMINI_POOL_WARMUP_CONNECTIONS", "4"))
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/"
+
+
+class GeminiClientManager:
+    """
+    Owns the single genai.Client for the process.
+
+    The client is built lazily on first use with an httpx.AsyncClient whose
+    pool limits come from the GEMINI_POOL_* env vars. A trace hook counts
+    connection setups so we can see how often the pool is actually reused.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = POOL_MAX_CONNECTIONS,
+        max_keepalive: int = POOL_MAX_KEEPALIVE,
+        keepalive_expiry: float = POOL_KEEPALIVE_EXPIRY,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._client: Optional[genai.Client] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._tcp_connects = 0
+        self._tls_handshakes = 0
+        self._requests = 0
+
+    @property
+    def client(self) -> genai.Client:
+        if self._client is None:
+            self._client = self._build_client()
+        return self._client
+
+    def install(self, client: Any) -> None:
+        """Replace the shared client, e.g. with a FakeGeminiClient in benchmarks and load tests."""
+        self._client = client
+
+    def _build_client(self) -> genai.Client:
+        if GEMINI_BACKEND == "fake":
+            print("🧪 Using the local fake Gemini backend (GEMINI_BACKEND=fake)")
+            return FakeGeminiClient()
+        if GEMINI_BACKEND == "replay":
+            cassette = Cassette.load(GEMINI_CASSETTE)
+            print(f"📼 Replaying {len(cassette.entries)} recorded Gemini calls from {GEMINI_CASSETTE}")
+            return ReplayClient(cassette)
+        self._http = httpx.AsyncClient(
+            limits=self.limits,
+            follow_redirects=True,
+            event_hooks={"request": [self._on_request]},
+        )
+        client = genai.Client(
+            api_key=os.getenv("GEMINI_API_KEY"),
+            http_options=types.HttpOptions(httpx_async_client=self._http),
+        )
+        if GEMINI_BACKEND == "record":
+            print(f"⏺️ Recording Gemini calls to {GEMINI_CASSETTE}")
+            return RecordingClient(client, CassetteWriter(GEMINI_CASSETTE))
+        return client
+
+    async def _on_request(self, request: httpx.Request) -> None:
+        self._requests += 1
+        request.extensions["trace"] = self._trace
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self._tcp_connects += 1
+        elif event_name == "connection.start_tls.complete":
+            self._tls_handshakes += 1
+
+    async def warm_up(self, connections: int = POOL_WARMUP_CONNECTIONS) -> int:
+        """
+        Open `connections` keep-alive connections to the Gemini endpoint
+        so the first real requests after startup skip the handshake.
+
+        Returns the number of warm-up requests that reached the server.
+        """
+        if connections <= 0 or GEMINI_BACKEND in ("fake", "replay"):
+            return 0
+        if self._client is None:
+            self._client = self._build_client()
+
+        async def _touch() -> bool:
+            try:
+                await self._http.head(GEMINI_BASE_URL, timeout=10)
+                return True
+            except httpx.HTTPError as e:
+                print(f"⚠️ Gemini pool warm-up request failed: {e}")
+                return False
+
+        results = await asyncio.gather(*[_touch() for _ in range(connections)])
+        return sum(results)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Snapshot of the connection pool: in-use/idle connections and handshake counts."""
+        in_use = idle = 0
+        pool = getattr(getattr(self._http, "_transport", None), "_pool", None)
+        for conn in getattr(pool, "connections", []):
+            if conn.is_idle():
+                idle += 1
+            elif not conn.is_closed():
+                in_use += 1
+        return {
+            "initialized": self._client is not None,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "in_use": in_use,
+            "idle": idle,
+            "requests": self._requests,
+            "tcp_connects": self._tcp_connects,
+            "tls_handshakes": self._tls_handshakes,
+        }
+
+    async def aclose(self) -> None:
+        if isinstance(self._client, RecordingClient):
+            self._client.writer.close()
+        if self._http is not None:
+            await self._http.aclose()
+        self._client = None
+        self._http = None
+
+
+# Process-wide manager - import get_client() rather than building genai.Client per call
+gemini = GeminiClientManager()
+
+
+def get_client() -> genai.Client:
+    """Return the shared Gemini client."""
+    return gemini.client
+
+
+# --- Single-Flight Coalescing ---
+
+class _Flight:
+    """One in-progress upstream call and the number of callers awaiting it."""
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapses concurrent identical calls into one upstream call.
+
+    The first caller for a key starts the call as a background task; every
+    caller (including the first) awaits it through asyncio.shield, so a
+    waiter that is cancelled (e.g. a client disconnect) leaves the shared
+    call running for everyone else. When the last waiter goes away the call
+    is cancelled, since nobody is left to use its result.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._leaders = 0
+        self._coalesced = 0
+        self._abandoned = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run `fn` once per concurrent `key`.
+
+        Returns (result, shared) where `shared` is True if this caller joined
+        a call started by someone else.
+        """
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._finish(key, flight))
+            self._leaders += 1
+        else:
+            self._coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Detached first so a new caller starts a fresh call instead of joining this one
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+                self._abandoned += 1
+
+    def _finish(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Mark the exception as retrieved even if every waiter went away
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "waiters": {key[:12]: f.waiters for key, f in self._flights.items()},
+            "upstream_calls": self._leaders,
+            "coalesced_calls": self._coalesced,
+            "abandoned_calls": self._abandoned,
+        }
+
+
+single_flight = SingleFlight()
+
+
+# --- Upstream Calls (admission-controlled) ---
+
+# Rough character-equivalent of one inline image for token estimates (~258 tokens)
+_IMAGE_PART_CHARS = 1032
+
+
+def _prompt_chars(contents: Any) -> int:
+    if isinstance(contents, str):
+        return len(contents)
+    if isinstance(contents, (list, tuple)):
+        return sum(_prompt_chars(c) for c in contents)
+    return _IMAGE_PART_CHARS
+
+
+def _total_tokens(response: Any) -> Optional[int]:
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) if usage is not None else None
+
+
+async def _generate_content(
+    model: str,
+    contents: Any,
+    agent: str,
+    config: Optional[dict] = None,
+    record_latency: bool = False,
+) -> Any:
+    """
+    Single generate_content call, admitted through the scheduler and retried on transient errors.
+
+    With record_latency, each successful upstream request (not the slot wait
+    or retry backoff) is sampled for the hedge delay and model policy windows.
+    """
+    prompt_chars = _prompt_chars(contents)
+    attempts = 0
+
+    async def _attempt() -> Any:
+        nonlocal attempts
+        attempts += 1
+        queued = time.monotonic()
+        async with scheduler.slot(model, agent, prompt_chars) as slot:
+            started = time.monotonic()
+            note_admitted(model, started - queued)
+            span.add_event("admitted", attempt=attempts, queue_wait_ms=round((started - queued) * 1000, 1))
+            response = await get_client().aio.models.generate_content(
+                model=model,
+                contents=contents,
+                config=config,
+            )
+            elapsed = time.monotonic() - started
+            gemini_request_seconds.observe(elapsed, model=model, kind="generate")
+            if record_latency:
+                model_telemetry.record_latency(agent, model, elapsed)
+            slot.actual_tokens = _total_tokens(response)
+            record_usage(agent, model, prompt_chars, response)
+            note_upstream(model, len(response.text or ""))
+            _set_usage_attributes(span, response)
+            return response
+
+    with tracer.span(f"generate_content {model}", _call_attributes(model, agent, prompt_chars), kind="client") as span:
+        try:
+            return await resilience.call(model, agent, _attempt)
+        finally:
+            span.set_attributes({"app.attempts": attempts, "app.retry_count": max(0, attempts - 1)})
+
+
+def _call_attributes(model: str, agent: str, prompt_chars: int) -> Dict[str, Any]:
+    return {
+        "gen_ai.system": "gemini",
+        "gen_ai.request.model": model,
+        "app.agent": agent,
+        "app.prompt_chars": prompt_chars,
+    }
+
+
+def _set_usage_attributes(span: Any, response: Any) -> None:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        span.set_attributes({
+            "gen_ai.usage.input_tokens": getattr(usage, "prompt_token_count", None),
+            "gen_ai.usage.output_tokens": getattr(usage, "candidates_token_count", None),
+        })
+
+
+async def generate_text(contents: Any, *, model: str, agent: str) -> str:
+    """Plain-text generation. Returns an empty string if the model returned no text."""
+    started = time.monotonic()
+    try:
+        response = await _generate_content(model, contents, agent)
+    except Exception as e:
+        agent_errors.inc(agent=agent, kind=classify_error(e).value)
+        raise
+    finally:
+        agent_call_seconds.observe(time.monotonic() - started, agent=agent, kind="text")
+    return response.text or ""
+
+
+async def stream_text(contents: Any, *, model: str, agent: str, config: Optional[dict] = None) -> AsyncGenerator[str, None]:
+    """
+    Stream text chunks from generate_content_stream.
+
+    Pass a response_schema config to stream a structured response; the
+    chunks are then slices of one JSON document (see services/json_stream).
+
+    The scheduler slot is held for the whole stream, since the upstream
+    connection stays busy until the last chunk. Transient failures are
+    retried only until the first chunk has been yielded; after that the
+    caller already has partial output and the error is raised.
+    """
+    prompt_chars = _prompt_chars(contents)
+    call_started = time.monotonic()
+    attempt, delay, slept = 0, resilience.base_delay, 0.0
+    with tracer.span(f"stream_generate_content {model}", _call_attributes(model, agent, prompt_chars), kind="client") as span:
+        try:
+            while True:
+                attempt += 1
+                resilience.before_attempt(model, agent)
+                yielded = False
+                try:
+                    queued = time.monotonic()
+                    async with scheduler.slot(model, agent, prompt_chars) as slot:
+                        started = time.monotonic()
+                        note_admitted(model, started - queued)
+                        span.add_event("admitted", attempt=attempt, queue_wait_ms=round((started - queued) * 1000, 1))
+                        response = await get_client().aio.models.generate_content_stream(
+                            model=model,
+                            contents=contents,
+                            config=config,
+                        )
+                        last_chunk, response_chars = None, 0
+                        async for chunk in response:
+                            tokens = _total_tokens(chunk)
+                            if tokens:
+                                slot.actual_tokens = tokens
+                            last_chunk = chunk if getattr(chunk, "usage_metadata", None) is not None else last_chunk
+                            if chunk.text:
+                                if not yielded:
+                                    span.add_event("first_chunk", attempt=attempt)
+                                yielded = True
+                                response_chars += len(chunk.text)
+                                note_upstream(model, len(chunk.text))
+                                yield chunk.text
+                        gemini_request_seconds.observe(time.monotonic() - started, model=model, kind="stream")
+                        record_usage(agent, model, prompt_chars, last_chunk, response_chars)
+                        _set_usage_attributes(span, last_chunk)
+                        span.set_attribute("app.response_chars", response_chars)
+                except Exception as e:
+                    resilience.record_failure(model, e)
+                    next_delay = None if yielded else resilience.next_delay(model, agent, e, attempt, delay, slept)
+                    if next_delay is None:
+                        raise
+                    delay = next_delay
+                    slept += delay
+                    await asyncio.sleep(delay)
+                    continue
+                resilience.record_success(model)
+                return
+        except Exception as e:
+            agent_errors.inc(agent=agent, kind=classify_error(e).value)
+            raise
+        finally:
+            span.set_attributes({"app.attempts": attempt, "app.retry_count": max(0, attempt - 1)})
+            agent_call_seconds.observe(time.monotonic() - call_started, agent=agent, kind="stream")
+
+
+# --- Structured Generation ---
+
+T = TypeVar("T", bound=BaseModel)
+
+
+async def _structured_on(
+    model: str,
+    contents: Any,
+    schema: Type[T],
+    agent: str,
+    cache: bool,
+    cache_ttl: Optional[float],
+    coalesce: bool,
+    hedge: bool,
+    accept: Optional[Callable[[T], bool]],
+) -> Optional[T]:
+    """One structured call on one model, through the response cache and single-flight."""
+    key = make_cache_key(model, contents, schema) if (cache or coalesce) else None
+    if cache:
+        cached = await response_cache.get(key, schema, agent)
+        if cached is not None:
+            tracer.current_span().add_event("cache_hit", model=model)
+            return cached
+
+    async def _attempt() -> Optional[T]:
+        response = await _generate_content(
+            model,
+            contents,
+            agent,
+            config={
+                "response_mime_type": "application/json",
+                "response_schema": schema,
+            },
+            record_latency=True,
+        )
+        return response.parsed
+
+    async def _call() -> Optional[T]:
+        if hedge:
+            parsed = await hedger.run(agent, model, _attempt, lambda p: rejection_reason(p, accept) is None)
+        else:
+            parsed = await _attempt()
+        if cache and parsed is not None:
+            await response_cache.set(key, parsed, agent, ttl=cache_ttl)
+        return parsed
+
+    if not coalesce:
+        return await _call()
+
+    parsed, shared = await single_flight.do(key, _call)
+    if shared:
+        tracer.current_span().add_event("coalesced", model=model)
+    # Followers get their own copy so callers can't mutate each other's result
+    if shared and parsed is not None:
+        return parsed.model_copy(deep=True)
+    return parsed
+
+
+async def generate_structured(
+    contents: Any,
+    schema: Type[T],
+    *,
+    model: str,
+    agent: str,
+    cache: bool = False,
+    cache_ttl: Optional[float] = None,
+    coalesce: bool = True,
+    accept: Optional[Callable[[T], bool]] = None,
+    hedge: bool = False,
+) -> Optional[T]:
+    """
+    Run a structured generate_content call and return the parsed object.
+
+    Args:
+        contents: Prompt string or list of prompt parts
+        schema: Pydantic model passed as response_schema
+        model: Model name, used unless the call site has a model policy
+        agent: Call-site name, used for cache accounting and model policy
+        cache: Opt in to the content-addressed response cache. Only use for
+            calls that are pure functions of (model, prompt, schema).
+        cache_ttl: Override the default cache TTL in seconds
+        coalesce: Share one upstream call between concurrent identical requests
+        accept: Extra check on the parsed result; a False answer escalates
+            to the next model in the call site's policy
+        hedge: Race a duplicate request if this one is slower than the call
+            site's usual tail latency. Only for short, idempotent calls.
+    """
+    models = models_for(agent, model)
+    model_telemetry.record_call(agent)
+    started = time.monotonic()
+    with tracer.span(f"structured {agent}", {
+        "app.agent": agent,
+        "app.schema": schema.__name__,
+        "app.models": models,
+        "app.prompt_chars": _prompt_chars(contents),
+    }) as span:
+        try:
+            # Cached results are re-checked too, so a weak cached answer still escalates
+            for candidate in models[:-1]:
+                parsed = await _structured_on(candidate, contents, schema, agent, cache, cache_ttl, coalesce, hedge, accept)
+                reason = rejection_reason(parsed, accept)
+                if reason is None:
+                    return parsed
+                model_telemetry.record_escalation(agent, candidate, reason)
+                span.add_event("escalated", model=candidate, reason=reason)
+
+            # Last model in the ladder: return whatever it gives
+            return await _structured_on(models[-1], contents, schema, agent, cache, cache_ttl, coalesce, hedge, accept)
+        except Exception as e:
+            agent_errors.inc(agent=agent, kind=classify_error(e).value)
+            raise
+        finally:
+            agent_call_seconds.observe(time.monotonic() - started, agent=agent, kind="structured")
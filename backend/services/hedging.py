@@ -0,0 +1,145 @@
+"""
+Hedging - Duplicate slow short calls to cut tail latency.
+
+When a hedged call has not returned after a high percentile of its call
+site's observed latency, a second identical request is sent and the first
+valid result wins; the other is cancelled. Hedges are capped per call site
+by a retry-style budget so a slow upstream never sees more than a small
+fraction of extra load.
+"""
+
+import os
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from services.model_policy import model_telemetry
+from services.resilience import RetryBudget
+
+
+GEMINI_HEDGE_ENABLED = os.getenv("GEMINI_HEDGE_ENABLED", "1") == "1"
+# Fire the hedge once a call is slower than this percentile of recent calls
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "95"))
+# Don't hedge until the call site has this many latency samples
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+GEMINI_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("GEMINI_HEDGE_MIN_DELAY_SECONDS", "0.25"))
+# Hedges allowed as a fraction of the call site's recent calls
+GEMINI_HEDGE_BUDGET_RATIO = float(os.getenv("GEMINI_HEDGE_BUDGET_RATIO", "0.1"))
+GEMINI_HEDGE_BUDGET_WINDOW_SECONDS = float(os.getenv("GEMINI_HEDGE_BUDGET_WINDOW_SECONDS", "60"))
+
+
+class _SiteHedges:
+    def __init__(self):
+        self.budget = RetryBudget(
+            ratio=GEMINI_HEDGE_BUDGET_RATIO,
+            min_per_second=0,
+            window_seconds=GEMINI_HEDGE_BUDGET_WINDOW_SECONDS,
+        )
+        self.calls = 0
+        self.fired = 0
+        self.won = 0
+        self.budget_denied = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "fired": self.fired,
+            "won": self.won,
+            "budget_denied": self.budget_denied,
+            "fire_rate": round(self.fired / self.calls, 4) if self.calls else 0.0,
+        }
+
+
+class Hedger:
+    """Per call site hedge delays, budgets and counters."""
+
+    def __init__(
+        self,
+        enabled: bool = GEMINI_HEDGE_ENABLED,
+        percentile: float = GEMINI_HEDGE_PERCENTILE,
+        min_samples: int = GEMINI_HEDGE_MIN_SAMPLES,
+        min_delay: float = GEMINI_HEDGE_MIN_DELAY_SECONDS,
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._sites: Dict[str, _SiteHedges] = {}
+
+    def _site(self, agent: str) -> _SiteHedges:
+        if agent not in self._sites:
+            self._sites[agent] = _SiteHedges()
+        return self._sites[agent]
+
+    def delay_for(self, agent: str, model: str) -> Optional[float]:
+        """Seconds to wait before hedging, or None if there isn't enough history yet."""
+        window = model_telemetry.latency_window(agent, model)
+        if window is None or len(window.samples) < self.min_samples:
+            return None
+        return max(self.min_delay, window.percentile(self.percentile))
+
+    async def run(
+        self,
+        agent: str,
+        model: str,
+        attempt: Callable[[], Awaitable[Any]],
+        valid: Callable[[Any], bool],
+    ) -> Any:
+        """
+        Run `attempt`, racing a duplicate if it is slow.
+
+        The first result passing `valid` wins. If neither does, the first
+        completed result is returned; if both fail, the first error is raised.
+        """
+        site = self._site(agent)
+        site.calls += 1
+        site.budget.record_request()
+        delay = self.delay_for(agent, model) if self.enabled else None
+        if delay is None:
+            return await attempt()
+
+        primary = asyncio.ensure_future(attempt())
+        hedge: Optional["asyncio.Future"] = None
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                if site.budget.try_withdraw():
+                    site.fired += 1
+                    hedge = asyncio.ensure_future(attempt())
+                    tasks.add(hedge)
+                else:
+                    site.budget_denied += 1
+
+            pending = set(tasks)
+            fallback, first_error = None, None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Prefer the primary if both finished in the same tick
+                for task in sorted(done, key=lambda t: t is not primary):
+                    if task.exception() is not None:
+                        first_error = first_error or task.exception()
+                        continue
+                    result = task.result()
+                    if valid(result):
+                        if task is hedge:
+                            site.won += 1
+                        return result
+                    if fallback is None:
+                        fallback = (result,)
+            if fallback is not None:
+                return fallback[0]
+            raise first_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "call_sites": {agent: s.as_dict() for agent, s in self._sites.items()},
+        }
+
+
+hedger = Hedger()
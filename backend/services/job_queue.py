@@ -0,0 +1,371 @@
+"""
+Job Queue - Submit/poll/result API for long-running agent work.
+
+A verified plan takes a route call, a draft and up to two verify/fix
+rounds, which can outlast proxy timeouts while holding the connection open.
+Work submitted here runs on a bounded pool instead:
+
+- submit() returns a queued job at once (202 + job ID at the HTTP layer)
+- at most JOB_QUEUE_CONCURRENCY jobs run; the rest wait in FIFO order
+  and report their queue position and an estimated wait
+- queued and running jobs can be cancelled
+- finished jobs keep their result (or error) for JOB_QUEUE_TTL_SECONDS
+
+Job records are written to a JobStore on every state change:
+- memory (default): records live in this process
+- supabase: the agent_jobs table from migration 005, so results survive
+  restarts and can be polled from any instance
+
+The pool itself is per process; a job cut short by a restart keeps its
+last stored state until it expires.
+"""
+
+import os
+import math
+import time
+import uuid
+import asyncio
+import datetime
+from abc import ABC, abstractmethod
+from enum import Enum
+from collections import OrderedDict
+from pydantic import BaseModel
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from supabase import create_client, Client
+from services.metrics import metrics
+from services.tracing import trace_supabase
+
+
+JOB_QUEUE_CONCURRENCY = int(os.getenv("JOB_QUEUE_CONCURRENCY", "4"))
+JOB_QUEUE_MAX_QUEUED = int(os.getenv("JOB_QUEUE_MAX_QUEUED", "200"))
+JOB_QUEUE_TTL_SECONDS = float(os.getenv("JOB_QUEUE_TTL_SECONDS", "3600"))
+JOB_QUEUE_STORE = os.getenv("JOB_QUEUE_STORE", "memory")  # memory | supabase
+JOB_QUEUE_SWEEP_INTERVAL_SECONDS = float(os.getenv("JOB_QUEUE_SWEEP_INTERVAL_SECONDS", "600"))
+
+queued_jobs = metrics.counter(
+    "queued_jobs_total", "Queued jobs by kind and final state.", ("kind", "state"))
+job_queue_wait = metrics.histogram(
+    "job_queue_wait_seconds", "Time jobs spent queued before a worker picked them up.", ("kind",))
+
+
+class QueueFullError(Exception):
+    """Raised by submit() when JOB_QUEUE_MAX_QUEUED jobs are already waiting."""
+
+
+class JobState(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class JobRecord(BaseModel):
+    job_id: str
+    kind: str
+    state: JobState = JobState.QUEUED
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    expires_at: float
+    result: Optional[Any] = None
+    error: Optional[Dict[str, Any]] = None  # {"status_code", "detail", "headers"}
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (JobState.SUCCEEDED, JobState.FAILED, JobState.CANCELLED)
+
+
+# --- Stores ---
+
+class JobStore(ABC):
+    """Where job records are kept. Subclasses persist them somewhere else."""
+
+    name = "base"
+
+    @abstractmethod
+    async def save(self, record: JobRecord) -> None:
+        ...
+
+    @abstractmethod
+    async def load(self, job_id: str) -> Optional[JobRecord]:
+        ...
+
+    @abstractmethod
+    async def delete_expired(self) -> int:
+        ...
+
+
+class MemoryJobStore(JobStore):
+    name = "memory"
+
+    def __init__(self):
+        self._records: Dict[str, JobRecord] = {}
+
+    async def save(self, record: JobRecord) -> None:
+        self._records[record.job_id] = record.model_copy()
+
+    async def load(self, job_id: str) -> Optional[JobRecord]:
+        record = self._records.get(job_id)
+        return record if record and record.expires_at > time.time() else None
+
+    async def delete_expired(self) -> int:
+        now = time.time()
+        expired = [k for k, r in self._records.items() if r.expires_at <= now]
+        for k in expired:
+            del self._records[k]
+        return len(expired)
+
+
+def _iso(epoch: float) -> str:
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).isoformat()
+
+
+class SupabaseJobStore(JobStore):
+    """Records in the agent_jobs table (one row per job, the record as jsonb)."""
+
+    name = "supabase"
+
+    def __init__(self, client: Client):
+        self._db = client
+
+    async def save(self, record: JobRecord) -> None:
+        await asyncio.to_thread(
+            lambda: self._db.table("agent_jobs")
+            .upsert({
+                "job_id": record.job_id,
+                "kind": record.kind,
+                "state": record.state.value,
+                "record": record.model_dump(mode="json"),
+                "expires_at": _iso(record.expires_at),
+            }, on_conflict="job_id")
+            .execute()
+        )
+
+    async def load(self, job_id: str) -> Optional[JobRecord]:
+        response = await asyncio.to_thread(
+            lambda: self._db.table("agent_jobs")
+            .select("record")
+            .eq("job_id", job_id)
+            .gt("expires_at", _iso(time.time()))
+            .limit(1)
+            .execute()
+        )
+        return JobRecord.model_validate(response.data[0]["record"]) if response.data else None
+
+    async def delete_expired(self) -> int:
+        response = await asyncio.to_thread(
+            lambda: self._db.table("agent_jobs")
+            .delete()
+            .lt("expires_at", _iso(time.time()))
+            .execute()
+        )
+        return len(response.data or [])
+
+
+def make_job_store(kind: str = JOB_QUEUE_STORE) -> JobStore:
+    """The store JOB_QUEUE_STORE selects (memory when Supabase is not configured)."""
+    if kind == "supabase":
+        supabase_url = os.getenv("SUPABASE_URL")
+        supabase_key = (
+            os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+            or os.getenv("SUPABASE_KEY")
+            or os.getenv("SUPABASE_ANON_KEY")
+        )
+        if supabase_url and supabase_key:
+            return SupabaseJobStore(trace_supabase(create_client(supabase_url, supabase_key)))
+        print("⚠️ Warning: Supabase credentials missing. Job queue is memory-only.")
+    return MemoryJobStore()
+
+
+# --- Queue ---
+
+class JobQueue:
+    """FIFO queue of async jobs run by a bounded pool, with records in a JobStore."""
+
+    def __init__(
+        self,
+        store: Optional[JobStore] = None,
+        concurrency: int = JOB_QUEUE_CONCURRENCY,
+        max_queued: int = JOB_QUEUE_MAX_QUEUED,
+        ttl_seconds: float = JOB_QUEUE_TTL_SECONDS,
+    ):
+        self._store = store
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.ttl_seconds = ttl_seconds
+        self._pending: "OrderedDict[str, Callable[[], Awaitable[Any]]]" = OrderedDict()
+        self._active: Dict[str, JobRecord] = {}  # Queued and running; authoritative over the store
+        self._tasks: Dict[str, "asyncio.Task"] = {}
+        self._done: Dict[str, asyncio.Event] = {}
+        self._run_seconds: Optional[float] = None  # Moving average, for wait estimates
+        self._stats = {"submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0, "cancelled": 0, "store_errors": 0}
+
+    @property
+    def store(self) -> JobStore:
+        # Created on first use so importing the module never connects anywhere
+        if self._store is None:
+            self._store = make_job_store()
+        return self._store
+
+    async def _save(self, record: JobRecord) -> None:
+        try:
+            await self.store.save(record)
+        except Exception as e:
+            self._stats["store_errors"] += 1
+            print(f"⚠️ Failed to persist job {record.job_id}: {e}")
+
+    async def submit(self, kind: str, factory: Callable[[], Awaitable[Any]]) -> JobRecord:
+        """Queue `factory()` (which returns a JSON-serializable result) and return its record."""
+        if len(self._pending) >= self.max_queued:
+            self._stats["rejected"] += 1
+            raise QueueFullError(f"{len(self._pending)} jobs are already queued")
+        now = time.time()
+        record = JobRecord(job_id=uuid.uuid4().hex, kind=kind, created_at=now, expires_at=now + self.ttl_seconds)
+        self._active[record.job_id] = record
+        self._pending[record.job_id] = factory
+        self._done[record.job_id] = asyncio.Event()
+        self._stats["submitted"] += 1
+        await self._save(record)
+        self._dispatch()
+        return record
+
+    def _dispatch(self) -> None:
+        while self._pending and len(self._tasks) < self.concurrency:
+            job_id, factory = self._pending.popitem(last=False)
+            self._tasks[job_id] = asyncio.create_task(self._run(self._active[job_id], factory))
+
+    async def _run(self, record: JobRecord, factory: Callable[[], Awaitable[Any]]) -> None:
+        record.state = JobState.RUNNING
+        record.started_at = time.time()
+        job_queue_wait.observe(record.started_at - record.created_at, kind=record.kind)
+        try:
+            await self._save(record)
+            record.result = await factory()
+            record.state = JobState.SUCCEEDED
+        except asyncio.CancelledError:
+            record.state = JobState.CANCELLED
+        except Exception as e:
+            # HTTPException-like errors keep their status; anything else is a 500
+            record.state = JobState.FAILED
+            record.error = {
+                "status_code": getattr(e, "status_code", 500),
+                "detail": getattr(e, "detail", None) or str(e),
+                "headers": getattr(e, "headers", None),  # e.g. Retry-After on 429/503
+            }
+            print(f"⚠️ Job {record.job_id} ({record.kind}) failed: {record.error['detail']}")
+        finally:
+            del self._tasks[record.job_id]
+            elapsed = time.time() - record.started_at
+            if record.state == JobState.SUCCEEDED:
+                self._run_seconds = elapsed if self._run_seconds is None else 0.8 * self._run_seconds + 0.2 * elapsed
+            self._dispatch()
+        await self._finish(record)
+
+    async def _finish(self, record: JobRecord) -> None:
+        record.finished_at = time.time()
+        record.expires_at = record.finished_at + self.ttl_seconds
+        self._stats[record.state.value] += 1
+        queued_jobs.inc(kind=record.kind, state=record.state.value)
+        await self._save(record)
+        self._active.pop(record.job_id, None)
+        self._done.pop(record.job_id).set()
+
+    async def get(self, job_id: str) -> Optional[JobRecord]:
+        record = self._active.get(job_id)
+        if record is not None:
+            return record
+        try:
+            return await self.store.load(job_id)
+        except Exception as e:
+            self._stats["store_errors"] += 1
+            print(f"⚠️ Job lookup failed: {e}")
+            return None
+
+    async def wait(self, job_id: str) -> Optional[JobRecord]:
+        """Wait for a job to finish and return its final record."""
+        record = self._active.get(job_id)
+        if record is None:
+            return await self.get(job_id)
+        await self._done[job_id].wait()
+        return record
+
+    async def cancel(self, job_id: str) -> Optional[JobRecord]:
+        """Cancel a queued or running job (finished jobs are returned unchanged)."""
+        record = self._active.get(job_id)
+        if record is None:
+            return await self.get(job_id)
+        if self._pending.pop(job_id, None) is not None:
+            record.state = JobState.CANCELLED
+            await self._finish(record)
+        else:
+            task = self._tasks[job_id]
+            task.cancel()
+            await asyncio.wait([task])
+            if job_id in self._active:
+                # Cancelled before its first step, so _run never got to record it
+                self._tasks.pop(job_id, None)
+                record.state = JobState.CANCELLED
+                await self._finish(record)
+                self._dispatch()
+        return record
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based place in the queue of a job that has not started yet."""
+        for index, pending_id in enumerate(self._pending):
+            if pending_id == job_id:
+                return index + 1
+        return None
+
+    def describe(self, record: JobRecord) -> Dict[str, Any]:
+        """Status of a job without its result."""
+        status = record.model_dump(mode="json", exclude={"result"})
+        position = self.position(record.job_id) if record.state == JobState.QUEUED else None
+        status["queue_position"] = position
+        if position is not None and self._run_seconds is not None:
+            # Jobs ahead run `concurrency` at a time
+            status["estimated_wait_seconds"] = round(math.ceil(position / self.concurrency) * self._run_seconds, 1)
+        return status
+
+    async def sweep_expired(self) -> int:
+        try:
+            return await self.store.delete_expired()
+        except Exception as e:
+            self._stats["store_errors"] += 1
+            print(f"⚠️ Job sweep failed: {e}")
+            return 0
+
+    async def run_sweeper(self, interval_seconds: float = JOB_QUEUE_SWEEP_INTERVAL_SECONDS) -> None:
+        """Background loop that periodically removes expired job records."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            removed = await self.sweep_expired()
+            if removed:
+                print(f"🧹 Job queue sweep removed {removed} expired jobs")
+
+    async def close(self) -> None:
+        """Cancel queued and running jobs on shutdown, so waiters return and the store shows them cancelled."""
+        queued = list(self._pending)
+        self._pending.clear()
+        for job_id in queued:
+            record = self._active[job_id]
+            record.state = JobState.CANCELLED
+            await self._finish(record)
+        tasks: List["asyncio.Task"] = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "store": self.store.name,
+            "concurrency": self.concurrency,
+            "running": len(self._tasks),
+            "queued": len(self._pending),
+            "avg_run_seconds": round(self._run_seconds, 3) if self._run_seconds is not None else None,
+            **self._stats,
+        }
+
+
+job_queue = JobQueue()
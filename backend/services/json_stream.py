@@ -0,0 +1,80 @@
+"""
+JSON Stream - Pull completed array items out of a JSON document while it streams.
+
+A structured response streamed from Gemini is one JSON object arriving in
+arbitrary slices. ArrayItemStream scans the slices as they come, tracking
+strings, escapes and nesting depth, and returns each item of one top-level
+array (e.g. a plan's "schedule") as soon as its closing brace arrives. The
+caller still validates the whole document at the end; items are only an
+early view of it.
+"""
+
+import json
+from typing import Any, List, Optional
+
+
+class ArrayItemStream:
+    """Incremental scanner for the items of `key`, an array in the top-level object."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._current_key: Optional[str] = None
+        self._array_depth: Optional[int] = None  # Depth inside the target array, once it opens
+        self._item_start: Optional[int] = None
+        self.done = False  # Target array closed
+        self.items_seen = 0
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Scan another slice and return the array items it completed (parsed)."""
+        self._text += chunk
+        items = []
+        text = self._text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif c == "\\":
+                    self._escaped = True
+                elif c == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start + 1:i]
+                continue
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ":" and self._depth == 1:
+                self._current_key = self._last_string
+            elif c == "," and self._depth == 1:
+                self._current_key = None
+            elif c in "{[":
+                if c == "[" and self._depth == 1 and self._current_key == self.key and not self.done:
+                    self._array_depth = 2
+                elif c == "{" and self._array_depth is not None and self._depth == self._array_depth:
+                    self._item_start = i
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._array_depth is None:
+                    continue
+                if c == "}" and self._item_start is not None and self._depth == self._array_depth:
+                    items.append(json.loads(text[self._item_start:i + 1]))
+                    self._item_start = None
+                    self.items_seen += 1
+                elif c == "]" and self._depth == self._array_depth - 1:
+                    self._array_depth = None
+                    self.done = True
+        self._pos = len(text)
+        return items
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far."""
+        return self._text
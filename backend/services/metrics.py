@@ -0,0 +1,272 @@
+"""
+Metrics - Prometheus-style counters, gauges and histograms served at /metrics.
+
+Instruments are process-wide and cheap to update (one dict lookup and an
+add), so they sit directly on the hot paths: HTTP routes, agent calls and
+upstream Gemini requests. Services that already keep their own stats
+(caches, scheduler, autopilot sessions) are read at scrape time through
+collectors instead of being double-counted.
+
+Everything is rendered in the Prometheus text exposition format (0.0.4),
+so any Prometheus-compatible scraper works without a client library.
+"""
+
+import os
+import time
+import bisect
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Seconds; covers cache hits (ms) up to long plan generations (minutes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160)
+# Characters per prompt; a shift to higher buckets is a cost regression
+PROMPT_CHARS_BUCKETS = (256, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072, 262144)
+
+LabelValues = Tuple[str, ...]
+# (metric name, type, help, labels, value) as returned by collectors
+Sample = Tuple[str, str, str, Dict[str, Any], float]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, k)} {_format_value(v)}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, k)} {_format_value(v)}" for k, v in self._values.items()]
+
+
+class _HistogramSeries:
+    def __init__(self, buckets: int):
+        self.counts = [0] * (buckets + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, _HistogramSeries] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _HistogramSeries(len(self.buckets))
+        series.counts[bisect.bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series.counts):
+                cumulative += count
+                labels = _format_labels(self.labels + ("le",), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(round(series.sum, 6))}")
+            lines.append(f"{self.name}_count{labels} {series.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Owns every instrument plus scrape-time collectors, and renders the exposition text."""
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def _register(self, metric: _Metric) -> Any:
+        if metric.name in self._metrics:
+            return self._metrics[metric.name]
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def collector(self, fn: Callable[[], Iterable[Sample]]) -> Callable[[], Iterable[Sample]]:
+        """Register a function returning samples read from another service at scrape time."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            body = metric.render()
+            if body:
+                lines.extend(metric.header())
+                lines.extend(body)
+
+        collected: Dict[str, Tuple[str, str, List[str]]] = {}
+        for fn in self._collectors:
+            try:
+                samples = list(fn())
+            except Exception as e:
+                print(f"⚠️ Metrics collector {getattr(fn, '__name__', fn)} failed: {e}")
+                continue
+            for name, kind, help, labels, value in samples:
+                if value is None:
+                    continue
+                entry = collected.setdefault(name, (kind, help, []))
+                entry[2].append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        for name, (kind, help, body) in collected.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(body)
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+# --- Instruments ---
+
+http_requests = metrics.counter(
+    "http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status"))
+http_request_seconds = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request duration until the last body byte is sent.", ("method", "route"))
+http_requests_in_flight = metrics.gauge(
+    "http_requests_in_flight", "HTTP requests currently being served.")
+
+agent_call_seconds = metrics.histogram(
+    "agent_call_duration_seconds", "End-to-end agent model calls, including cache, retries and escalation.", ("agent", "kind"))
+agent_errors = metrics.counter(
+    "agent_errors_total", "Agent model calls that raised, by error kind.", ("agent", "kind"))
+
+gemini_request_seconds = metrics.histogram(
+    "gemini_request_duration_seconds", "Single upstream Gemini request duration (streams: until the last chunk).", ("model", "kind"))
+gemini_errors = metrics.counter(
+    "gemini_errors_total", "Failed upstream Gemini attempts by error kind.", ("model", "kind"))
+gemini_chars = metrics.counter(
+    "gemini_chars_total", "Prompt and response characters sent to and received from Gemini.", ("agent", "model", "direction"))
+gemini_tokens = metrics.counter(
+    "gemini_tokens_total", "Prompt and response tokens reported by usage_metadata.", ("agent", "model", "direction"))
+gemini_prompt_chars = metrics.histogram(
+    "gemini_prompt_chars", "Prompt size in characters per upstream request.", ("agent",), buckets=PROMPT_CHARS_BUCKETS)
+
+
+def record_usage(agent: str, model: str, prompt_chars: int, response: Any, response_chars: Optional[int] = None) -> None:
+    """Account prompt/response size for one upstream response (or the final chunk of a stream)."""
+    gemini_prompt_chars.observe(prompt_chars, agent=agent)
+    gemini_chars.inc(prompt_chars, agent=agent, model=model, direction="prompt")
+    if response_chars is None:
+        response_chars = len(getattr(response, "text", None) or "")
+    gemini_chars.inc(response_chars, agent=agent, model=model, direction="response")
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        gemini_tokens.inc(getattr(usage, "prompt_token_count", None) or 0, agent=agent, model=model, direction="prompt")
+        gemini_tokens.inc(getattr(usage, "candidates_token_count", None) or 0, agent=agent, model=model, direction="response")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests per route template.
+
+    Route templates (e.g. /api/autopilot/status/{session_id}) keep label
+    cardinality bounded; unmatched paths are grouped under "unmatched".
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or not metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        status = 500  # If the app raises before responding
+        http_requests_in_flight.inc()
+
+        async def _send(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            http_requests_in_flight.dec()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope.get("method", "")
+            http_requests.inc(method=method, route=route, status=status)
+            http_request_seconds.observe(time.monotonic() - started, method=method, route=route)
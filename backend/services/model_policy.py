@@ -0,0 +1,155 @@
+"""
+Model Policy - Picks which Gemini model each call site runs on.
+
+Call sites are grouped into task classes, and each task class has an
+ordered model list (smallest first). Cheap decisions such as routing,
+topic selection and answer grading start on Flash and only escalate to
+the larger model when the structured output fails to parse, a confidence
+field is below threshold, or the call site's own check rejects it.
+
+Call sites without a task class keep the model they pass in.
+
+Env overrides (JSON):
+- GEMINI_TASK_MODELS: {"classify": ["gemini-3-flash-preview", "gemini-3-pro-preview"]}
+- GEMINI_CALL_SITE_TASKS: {"quiz.generate_quiz": "classify"}
+"""
+
+import os
+import json
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+GEMINI_FLASH_MODEL = os.getenv("GEMINI_FLASH_MODEL", "gemini-3-flash-preview")
+# The large tier defaults to the deployment's GEMINI_MODEL
+GEMINI_PRO_MODEL = os.getenv("GEMINI_PRO_MODEL", os.getenv("GEMINI_MODEL", "gemini-3-pro-preview"))
+# Escalate when a schema's `confidence` field is below this
+GEMINI_ESCALATION_MIN_CONFIDENCE = float(os.getenv("GEMINI_ESCALATION_MIN_CONFIDENCE", "0.6"))
+# Recent latency samples kept per (call site, model)
+MODEL_LATENCY_WINDOW = int(os.getenv("MODEL_LATENCY_WINDOW", "512"))
+
+TASK_MODELS: Dict[str, List[str]] = {
+    "classify": [GEMINI_FLASH_MODEL, GEMINI_PRO_MODEL],  # Short decisions over a fixed set of options
+    "grade": [GEMINI_FLASH_MODEL, GEMINI_PRO_MODEL],     # Checking an answer or plan against known facts
+    "extract": [GEMINI_FLASH_MODEL, GEMINI_PRO_MODEL],   # Pulling structure out of supplied text
+    **json.loads(os.getenv("GEMINI_TASK_MODELS", "{}")),
+}
+
+CALL_SITE_TASKS: Dict[str, str] = {
+    "router.route_request": "classify",
+    "autopilot.select_next_topic": "classify",
+    "quiz.evaluate_answer": "grade",
+    "plan.verify_study_plan": "grade",
+    "syllabus.extract_topics": "extract",
+    **json.loads(os.getenv("GEMINI_CALL_SITE_TASKS", "{}")),
+}
+
+
+def models_for(agent: str, default_model: str) -> List[str]:
+    """Ordered models to try for a call site (smallest first)."""
+    task = CALL_SITE_TASKS.get(agent)
+    models = TASK_MODELS.get(task) if task else None
+    if not models:
+        return [default_model]
+    # Drop duplicates (e.g. GEMINI_MODEL pointing at the Flash model) but keep order
+    return list(dict.fromkeys(models))
+
+
+def rejection_reason(
+    parsed: Optional[BaseModel],
+    accept: Optional[Callable[[Any], bool]] = None,
+    min_confidence: float = GEMINI_ESCALATION_MIN_CONFIDENCE,
+) -> Optional[str]:
+    """Why a structured result should be escalated, or None if it is acceptable."""
+    if parsed is None:
+        return "parse_failed"
+    confidence = getattr(parsed, "confidence", None)
+    if isinstance(confidence, (int, float)) and confidence < min_confidence:
+        return "low_confidence"
+    if accept is not None and not accept(parsed):
+        return "rejected"
+    return None
+
+
+class LatencyWindow:
+    """Bounded window of recent latencies (seconds) with percentile lookup."""
+
+    def __init__(self, size: int = MODEL_LATENCY_WINDOW):
+        self.samples: Deque[float] = deque(maxlen=size)
+        self.count = 0
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.count += 1
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class _SiteStats:
+    def __init__(self):
+        self.calls = 0
+        self.escalations: Dict[str, int] = {}
+        self.latency: Dict[str, LatencyWindow] = {}
+
+    def as_dict(self) -> Dict[str, Any]:
+        escalated = sum(self.escalations.values())
+        models = {}
+        for model, window in self.latency.items():
+            p50, p95 = window.percentile(50), window.percentile(95)
+            models[model] = {
+                "calls": window.count,
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            }
+        return {
+            "calls": self.calls,
+            "escalations": dict(self.escalations),
+            "escalation_rate": round(escalated / self.calls, 4) if self.calls else 0.0,
+            "models": models,
+        }
+
+
+class ModelTelemetry:
+    """Per call site latency (per model) and escalation counts."""
+
+    def __init__(self):
+        self._sites: Dict[str, _SiteStats] = {}
+
+    def _site(self, agent: str) -> _SiteStats:
+        if agent not in self._sites:
+            self._sites[agent] = _SiteStats()
+        return self._sites[agent]
+
+    def record_call(self, agent: str) -> None:
+        self._site(agent).calls += 1
+
+    def record_latency(self, agent: str, model: str, seconds: float) -> None:
+        site = self._site(agent)
+        if model not in site.latency:
+            site.latency[model] = LatencyWindow()
+        site.latency[model].add(seconds)
+
+    def record_escalation(self, agent: str, from_model: str, reason: str) -> None:
+        site = self._site(agent)
+        site.escalations[reason] = site.escalations.get(reason, 0) + 1
+        print(f"⬆️ {agent}: escalating from {from_model} ({reason})")
+
+    def latency_window(self, agent: str, model: str) -> Optional[LatencyWindow]:
+        site = self._sites.get(agent)
+        return site.latency.get(model) if site else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policy": {agent: models_for(agent, "") for agent in CALL_SITE_TASKS},
+            "call_sites": {agent: s.as_dict() for agent, s in self._sites.items()},
+        }
+
+
+model_telemetry = ModelTelemetry()
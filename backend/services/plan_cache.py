@@ -0,0 +1,205 @@
+"""
+Plan Cache - Stores accepted verified plans in the plan_cache table.
+
+A verified plan costs a route call, a draft and up to two verify/fix
+rounds. Once a plan has passed verification, later requests for the same
+(exam, routed scope, days, normalized goal) are served from here instead.
+
+Two tiers:
+- Memory: small LRU in front of Supabase so hot keys skip the round-trip.
+- Supabase: the plan_cache table from migration 002 (honors expires_at).
+"""
+
+import os
+import re
+import time
+import asyncio
+import hashlib
+import datetime
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from supabase import create_client, Client
+from services.tracing import trace_supabase
+
+
+PLAN_CACHE_ENABLED = os.getenv("PLAN_CACHE_ENABLED", "1") == "1"
+PLAN_CACHE_TTL_HOURS = float(os.getenv("PLAN_CACHE_TTL_HOURS", "24"))
+PLAN_CACHE_MEMORY_ENTRIES = int(os.getenv("PLAN_CACHE_MEMORY_ENTRIES", "256"))
+PLAN_CACHE_SWEEP_INTERVAL_SECONDS = float(os.getenv("PLAN_CACHE_SWEEP_INTERVAL_SECONDS", "600"))
+
+PLAN_CACHE_KEY_VERSION = "v1"
+
+
+def normalize_goal(goal: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace so trivially different goals share a key."""
+    goal = re.sub(r"[^\w\s]", " ", goal.lower())
+    return " ".join(goal.split())
+
+
+def make_plan_cache_key(exam_type: str, scope: str, days: int, goal: str) -> str:
+    """Cache key for a verified plan: exam + routed scope + days + normalized goal."""
+    raw = "|".join([exam_type.strip().lower(), scope.strip().lower(), str(days), normalize_goal(goal)])
+    return f"plan:{PLAN_CACHE_KEY_VERSION}:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class PlanCache:
+    """Memory + Supabase cache for serialized PlanWithHistory payloads."""
+
+    def __init__(
+        self,
+        enabled: bool = PLAN_CACHE_ENABLED,
+        ttl_hours: float = PLAN_CACHE_TTL_HOURS,
+        memory_entries: int = PLAN_CACHE_MEMORY_ENTRIES,
+    ):
+        self.enabled = enabled
+        self.ttl_hours = ttl_hours
+        self.memory_entries = memory_entries
+        # key -> (payload, expires_at epoch seconds)
+        self._memory: "OrderedDict[str, tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._supabase: Optional[Client] = None
+        self._supabase_checked = False
+        self._stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "db_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "swept": 0,
+            "errors": 0,
+        }
+
+    def _db(self) -> Optional[Client]:
+        if not self._supabase_checked:
+            self._supabase_checked = True
+            supabase_url = os.getenv("SUPABASE_URL")
+            supabase_key = (
+                os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+                or os.getenv("SUPABASE_KEY")
+                or os.getenv("SUPABASE_ANON_KEY")
+            )
+            if supabase_url and supabase_key:
+                self._supabase = trace_supabase(create_client(supabase_url, supabase_key))
+            else:
+                print("⚠️ Warning: Supabase credentials missing. Plan cache is memory-only.")
+        return self._supabase
+
+    def _remember(self, key: str, payload: Dict[str, Any], expires_at: float) -> None:
+        self._memory[key] = (payload, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached payload for `key` if present and not expired."""
+        if not self.enabled:
+            return None
+
+        entry = self._memory.get(key)
+        if entry is not None:
+            payload, expires_at = entry
+            if expires_at > time.time():
+                self._memory.move_to_end(key)
+                self._stats["hits"] += 1
+                self._stats["memory_hits"] += 1
+                return payload
+            del self._memory[key]
+
+        db = self._db()
+        if db is not None:
+            try:
+                response = await asyncio.to_thread(
+                    lambda: db.table("plan_cache")
+                    .select("plan, expires_at")
+                    .eq("cache_key", key)
+                    .gt("expires_at", _utcnow().isoformat())
+                    .limit(1)
+                    .execute()
+                )
+                if response.data:
+                    row = response.data[0]
+                    expires_at = datetime.datetime.fromisoformat(row["expires_at"]).timestamp()
+                    self._remember(key, row["plan"], expires_at)
+                    self._stats["hits"] += 1
+                    self._stats["db_hits"] += 1
+                    return row["plan"]
+            except Exception as e:
+                self._stats["errors"] += 1
+                print(f"⚠️ Plan cache lookup failed: {e}")
+
+        self._stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, payload: Dict[str, Any], ttl_hours: Optional[float] = None) -> None:
+        """Store a JSON-serializable payload under `key`."""
+        if not self.enabled:
+            return
+        ttl_hours = self.ttl_hours if ttl_hours is None else ttl_hours
+        expires = _utcnow() + datetime.timedelta(hours=ttl_hours)
+        self._remember(key, payload, expires.timestamp())
+        self._stats["stores"] += 1
+
+        db = self._db()
+        if db is None:
+            return
+        try:
+            await asyncio.to_thread(
+                lambda: db.table("plan_cache")
+                .upsert(
+                    {"cache_key": key, "plan": payload, "expires_at": expires.isoformat()},
+                    on_conflict="cache_key",
+                )
+                .execute()
+            )
+        except Exception as e:
+            self._stats["errors"] += 1
+            print(f"⚠️ Failed to persist plan cache entry: {e}")
+
+    async def sweep_expired(self) -> int:
+        """Delete expired entries from both tiers. Returns how many rows were removed."""
+        now = time.time()
+        expired = [k for k, (_, expires_at) in self._memory.items() if expires_at <= now]
+        for k in expired:
+            del self._memory[k]
+        removed = len(expired)
+
+        db = self._db()
+        if db is not None:
+            try:
+                response = await asyncio.to_thread(
+                    lambda: db.table("plan_cache")
+                    .delete()
+                    .lt("expires_at", _utcnow().isoformat())
+                    .execute()
+                )
+                removed += len(response.data or [])
+            except Exception as e:
+                self._stats["errors"] += 1
+                print(f"⚠️ Plan cache sweep failed: {e}")
+
+        self._stats["swept"] += removed
+        return removed
+
+    async def run_sweeper(self, interval_seconds: float = PLAN_CACHE_SWEEP_INTERVAL_SECONDS) -> None:
+        """Background loop that periodically removes expired entries."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            removed = await self.sweep_expired()
+            if removed:
+                print(f"🧹 Plan cache sweep removed {removed} expired entries")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self._memory),
+            **self._stats,
+            "hit_ratio": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+plan_cache = PlanCache()
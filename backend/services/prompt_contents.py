@@ -0,0 +1,41 @@
+"""
+Prompt Contents - Text views of the contents passed to generate_content.
+
+Contents can be a string, a Part, a Content or a list of them. Two views
+are needed:
+
+- render_contents: a stable rendering of everything (including non-text
+  parts), for cache and cassette keys
+- prompt_text: only the text a model would read, for prompt matching and
+  recordings
+"""
+
+from typing import Any
+
+from pydantic import BaseModel
+
+
+def render_contents(contents: Any) -> str:
+    """Render prompt contents (str, Part, or a list of them) to a stable string."""
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, (list, tuple)):
+        return "\x1e".join(render_contents(c) for c in contents)
+    if isinstance(contents, BaseModel):
+        return contents.model_dump_json()
+    return repr(contents)
+
+
+def prompt_text(contents: Any) -> str:
+    """The text parts of prompt contents, joined by newlines."""
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, (list, tuple)):
+        return "\n".join(prompt_text(c) for c in contents)
+    text = getattr(contents, "text", None)
+    if isinstance(text, str):
+        return text
+    parts = getattr(contents, "parts", None)
+    if parts:
+        return prompt_text(list(parts))
+    return ""
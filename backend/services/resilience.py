@@ -0,0 +1,351 @@
+"""
+Resilience - Retry, backoff and circuit breaking for every Gemini call.
+
+Errors are classified from the google-genai exception types (status code,
+not message text). Transient failures are retried with decorrelated-jitter
+backoff, bounded by an attempt cap, a per-call deadline and a per-model
+retry budget so retries cannot multiply load during an outage. A per-model
+circuit breaker fails fast once the upstream is clearly down, and lets a
+single probe through after a cooldown.
+"""
+
+import os
+import time
+import random
+import asyncio
+from collections import deque
+from enum import Enum
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import httpx
+from google.genai import errors as genai_errors
+
+from services.metrics import gemini_errors
+
+
+GEMINI_RETRY_MAX_ATTEMPTS = int(os.getenv("GEMINI_RETRY_MAX_ATTEMPTS", "4"))
+GEMINI_RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "0.5"))
+GEMINI_RETRY_MAX_DELAY = float(os.getenv("GEMINI_RETRY_MAX_DELAY", "8"))
+# Total time a single call may spend sleeping between attempts
+GEMINI_RETRY_DEADLINE_SECONDS = float(os.getenv("GEMINI_RETRY_DEADLINE_SECONDS", "20"))
+# Retries allowed as a fraction of recent requests, plus a small floor
+GEMINI_RETRY_BUDGET_RATIO = float(os.getenv("GEMINI_RETRY_BUDGET_RATIO", "0.2"))
+GEMINI_RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("GEMINI_RETRY_BUDGET_MIN_PER_SECOND", "0.5"))
+GEMINI_RETRY_BUDGET_WINDOW_SECONDS = float(os.getenv("GEMINI_RETRY_BUDGET_WINDOW_SECONDS", "10"))
+GEMINI_BREAKER_FAILURE_THRESHOLD = int(os.getenv("GEMINI_BREAKER_FAILURE_THRESHOLD", "5"))
+GEMINI_BREAKER_COOLDOWN_SECONDS = float(os.getenv("GEMINI_BREAKER_COOLDOWN_SECONDS", "30"))
+
+
+class ErrorKind(str, Enum):
+    RATE_LIMITED = "rate_limited"   # 429
+    OVERLOADED = "overloaded"       # 503
+    SERVER = "server"               # Other 5xx
+    TIMEOUT = "timeout"             # Read/connect timeouts
+    NETWORK = "network"             # Connection resets, DNS, TLS
+    CIRCUIT_OPEN = "circuit_open"   # Short-circuited locally
+    CLIENT = "client"               # Other 4xx: our request is wrong, never retried
+    OTHER = "other"
+
+
+TRANSIENT_KINDS = {
+    ErrorKind.RATE_LIMITED,
+    ErrorKind.OVERLOADED,
+    ErrorKind.SERVER,
+    ErrorKind.TIMEOUT,
+    ErrorKind.NETWORK,
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while a model's breaker is open."""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Gemini model {model} is unavailable; retry in {retry_after:.1f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+def classify_error(exc: BaseException) -> ErrorKind:
+    """Map an exception raised by a model call to an ErrorKind."""
+    if isinstance(exc, CircuitOpenError):
+        return ErrorKind.CIRCUIT_OPEN
+    if isinstance(exc, genai_errors.APIError):
+        code = exc.code or 0
+        if code == 429:
+            return ErrorKind.RATE_LIMITED
+        if code == 503:
+            return ErrorKind.OVERLOADED
+        if code == 408 or code == 504:
+            return ErrorKind.TIMEOUT
+        if code >= 500:
+            return ErrorKind.SERVER
+        return ErrorKind.CLIENT
+    if isinstance(exc, (httpx.TimeoutException, asyncio.TimeoutError)):
+        return ErrorKind.TIMEOUT
+    if isinstance(exc, (httpx.TransportError, ConnectionError)):
+        return ErrorKind.NETWORK
+    return ErrorKind.OTHER
+
+
+def is_transient(exc: BaseException) -> bool:
+    """True if the failure is worth retrying later (including an open breaker)."""
+    kind = classify_error(exc)
+    return kind in TRANSIENT_KINDS or kind == ErrorKind.CIRCUIT_OPEN
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Server- or breaker-suggested wait before retrying, if known."""
+    if isinstance(exc, CircuitOpenError):
+        return exc.retry_after
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return None
+    try:
+        value = headers.get("retry-after")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryBudget:
+    """
+    Sliding-window retry budget.
+
+    A retry is allowed while retries in the window stay below
+    `ratio * requests + min_per_second * window`, so a healthy service can
+    always retry a little, but a failing one cannot double its own load.
+    """
+
+    def __init__(
+        self,
+        ratio: float = GEMINI_RETRY_BUDGET_RATIO,
+        min_per_second: float = GEMINI_RETRY_BUDGET_MIN_PER_SECOND,
+        window_seconds: float = GEMINI_RETRY_BUDGET_WINDOW_SECONDS,
+    ):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window_seconds = window_seconds
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - self.window_seconds
+        for q in (self._requests, self._retries):
+            while q and q[0] < cutoff:
+                q.popleft()
+
+    def _allowance(self) -> float:
+        return self.ratio * len(self._requests) + self.min_per_second * self.window_seconds
+
+    def record_request(self) -> None:
+        now = time.monotonic()
+        self._prune(now)
+        self._requests.append(now)
+
+    def try_withdraw(self) -> bool:
+        now = time.monotonic()
+        self._prune(now)
+        if len(self._retries) >= self._allowance():
+            return False
+        self._retries.append(now)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        self._prune(time.monotonic())
+        return {
+            "requests_in_window": len(self._requests),
+            "retries_in_window": len(self._retries),
+            "allowance": round(self._allowance(), 1),
+        }
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker: closed -> open -> half_open -> closed.
+
+    Only transient upstream failures count. While half-open one probe is let
+    through at a time; a probe that never reports back (e.g. cancelled)
+    releases its lease after another cooldown.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = GEMINI_BREAKER_FAILURE_THRESHOLD,
+        cooldown_seconds: float = GEMINI_BREAKER_COOLDOWN_SECONDS,
+    ):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_started_at: Optional[float] = None
+        self.times_opened = 0
+
+    def allow(self) -> Optional[float]:
+        """Return None if a call may proceed, else seconds until it might."""
+        if self.state == "closed":
+            return None
+        now = time.monotonic()
+        if self.state == "open":
+            remaining = self.opened_at + self.cooldown_seconds - now
+            if remaining > 0:
+                return remaining
+            self.state = "half_open"
+            self.probe_started_at = None
+        # half_open
+        if self.probe_started_at is None or now - self.probe_started_at > self.cooldown_seconds:
+            self.probe_started_at = now
+            return None
+        return self.cooldown_seconds - (now - self.probe_started_at)
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.probe_started_at = None
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.probe_started_at = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+        }
+
+
+T = TypeVar("T")
+
+
+class Resilience:
+    """Process-wide retry policy with per-model breakers and budgets."""
+
+    def __init__(
+        self,
+        max_attempts: int = GEMINI_RETRY_MAX_ATTEMPTS,
+        base_delay: float = GEMINI_RETRY_BASE_DELAY,
+        max_delay: float = GEMINI_RETRY_MAX_DELAY,
+        deadline_seconds: float = GEMINI_RETRY_DEADLINE_SECONDS,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline_seconds = deadline_seconds
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._budgets: Dict[str, RetryBudget] = {}
+        self._errors: Dict[str, int] = {}
+        self._retries: Dict[str, int] = {}
+        self._short_circuits: Dict[str, int] = {}
+        self._budget_denied = 0
+        self._deadline_exceeded = 0
+
+    def _breaker(self, model: str) -> CircuitBreaker:
+        if model not in self._breakers:
+            self._breakers[model] = CircuitBreaker()
+        return self._breakers[model]
+
+    def _budget(self, model: str) -> RetryBudget:
+        if model not in self._budgets:
+            self._budgets[model] = RetryBudget()
+        return self._budgets[model]
+
+    def before_attempt(self, model: str, agent: str) -> None:
+        """Fail fast if the model's breaker is open; otherwise count the attempt."""
+        wait = self._breaker(model).allow()
+        if wait is not None:
+            self._short_circuits[agent] = self._short_circuits.get(agent, 0) + 1
+            raise CircuitOpenError(model, wait)
+        self._budget(model).record_request()
+
+    def record_success(self, model: str) -> None:
+        self._breaker(model).record_success()
+
+    def record_failure(self, model: str, exc: BaseException) -> ErrorKind:
+        kind = classify_error(exc)
+        self._errors[kind.value] = self._errors.get(kind.value, 0) + 1
+        gemini_errors.inc(model=model, kind=kind.value)
+        if kind in TRANSIENT_KINDS:
+            self._breaker(model).record_failure()
+        elif kind != ErrorKind.CIRCUIT_OPEN:
+            # Upstream answered (e.g. a 400), so it is reachable
+            self._breaker(model).record_success()
+        return kind
+
+    def next_delay(
+        self,
+        model: str,
+        agent: str,
+        exc: BaseException,
+        attempt: int,
+        previous_delay: float,
+        slept: float,
+    ) -> Optional[float]:
+        """
+        Seconds to sleep before the next attempt, or None to give up.
+
+        `attempt` is the 1-based number of the attempt that just failed.
+        Delays follow decorrelated jitter: uniform(base, previous * 3),
+        capped, and never shorter than a server-sent Retry-After.
+        """
+        if classify_error(exc) not in TRANSIENT_KINDS or attempt >= self.max_attempts:
+            return None
+        if self._breaker(model).state == "open":
+            # This failure tripped the breaker; waiting here would only hit it again
+            return None
+
+        delay = min(self.max_delay, random.uniform(self.base_delay, max(self.base_delay, previous_delay * 3)))
+        hinted = retry_after_seconds(exc)
+        if hinted is not None:
+            delay = max(delay, min(hinted, self.max_delay))
+
+        if slept + delay > self.deadline_seconds:
+            self._deadline_exceeded += 1
+            return None
+        if not self._budget(model).try_withdraw():
+            self._budget_denied += 1
+            return None
+
+        self._retries[agent] = self._retries.get(agent, 0) + 1
+        print(f"🔁 {agent}: {classify_error(exc).value} from {model}, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_attempts})")
+        return delay
+
+    async def call(self, model: str, agent: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run `fn` with breaker checks and budgeted, jittered retries."""
+        attempt, delay, slept = 0, self.base_delay, 0.0
+        while True:
+            attempt += 1
+            self.before_attempt(model, agent)
+            try:
+                result = await fn()
+            except Exception as e:
+                self.record_failure(model, e)
+                next_delay = self.next_delay(model, agent, e, attempt, delay, slept)
+                if next_delay is None:
+                    raise
+                delay = next_delay
+                slept += delay
+                await asyncio.sleep(delay)
+                continue
+            self.record_success(model)
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retries": dict(self._retries),
+            "short_circuits": dict(self._short_circuits),
+            "errors": dict(self._errors),
+            "budget_denied": self._budget_denied,
+            "deadline_exceeded": self._deadline_exceeded,
+            "breakers": {model: b.stats() for model, b in self._breakers.items()},
+            "budgets": {model: b.stats() for model, b in self._budgets.items()},
+        }
+
+
+resilience = Resilience()
@@ -0,0 +1,223 @@
+"""
+Response Cache - Content-addressed cache for structured model generations.
+
+A structured generate_content call is a pure function of
+(model, rendered prompt, response_schema), so identical requests from
+different students can share one generation. Entries are keyed by a
+SHA-256 of those three inputs and stored as the JSON of the parsed
+Pydantic object.
+
+Two tiers:
+- Memory: LRU bounded by entry count and total bytes, with TTL.
+- Disk (optional): SQLite file, enabled by RESPONSE_CACHE_PATH.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Type
+
+from pydantic import BaseModel
+
+from services.prompt_contents import render_contents
+
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH")  # e.g. /var/cache/exammentor/responses.db
+RESPONSE_CACHE_DISK_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+def make_cache_key(model: str, contents: Any, schema: Type[BaseModel]) -> str:
+    """Hash of model + rendered prompt + response schema."""
+    h = hashlib.sha256()
+    h.update(model.encode())
+    h.update(b"\x00")
+    h.update(render_contents(contents).encode())
+    h.update(b"\x00")
+    h.update(json.dumps(schema.model_json_schema(), sort_keys=True).encode())
+    return h.hexdigest()
+
+
+class _DiskTier:
+    """
+    SQLite-backed second tier. All methods are blocking; callers use to_thread.
+
+    The one connection is shared by the to_thread workers, so every use of it
+    holds the lock.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                agent TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_response_cache_access ON response_cache(last_access)"
+        )
+
+    def get(self, key: str) -> "Optional[tuple[str, float]]":
+        """(value, expires_at) for a live entry, else None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at < now:
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE response_cache SET last_access = ? WHERE key = ?", (now, key))
+            return value, expires_at
+
+    def set(self, key: str, agent: str, value: str, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, agent, value, len(value), now + ttl, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        """Caller holds the lock."""
+        self._conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (now,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM response_cache ORDER BY last_access ASC"
+        ).fetchall():
+            self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + optional SQLite) cache of parsed structured responses."""
+
+    def __init__(
+        self,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        disk_path: Optional[str] = RESPONSE_CACHE_PATH,
+        disk_max_bytes: int = RESPONSE_CACHE_DISK_MAX_BYTES,
+    ):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (agent, json value, expires_at)
+        self._memory: "OrderedDict[str, tuple[str, str, float]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = _DiskTier(disk_path, disk_max_bytes) if disk_path else None
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, agent: str, field: str) -> None:
+        agent_stats = self._stats.setdefault(
+            agent, {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+        )
+        agent_stats[field] += 1
+
+    def _memory_set(self, key: str, agent: str, value: str, expires_at: float) -> None:
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key)[1])
+        self._memory[key] = (agent, value, expires_at)
+        self._memory_bytes += len(value)
+        while self._memory and (
+            len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes
+        ):
+            _, (_, evicted, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    async def get(self, key: str, schema: Type[BaseModel], agent: str) -> Optional[BaseModel]:
+        """Return the cached parsed object for `key`, or None on a miss."""
+        if not self.enabled:
+            return None
+
+        entry = self._memory.get(key)
+        if entry is not None:
+            _, value, expires_at = entry
+            if expires_at >= time.time():
+                self._memory.move_to_end(key)
+                self._count(agent, "hits")
+                self._count(agent, "memory_hits")
+                return schema.model_validate_json(value)
+            self._memory_bytes -= len(self._memory.pop(key)[1])
+
+        if self._disk is not None:
+            row = await asyncio.to_thread(self._disk.get, key)
+            if row is not None:
+                # Promoted entries keep the row's remaining lifetime, not a fresh TTL
+                value, expires_at = row
+                self._memory_set(key, agent, value, expires_at)
+                self._count(agent, "hits")
+                self._count(agent, "disk_hits")
+                return schema.model_validate_json(value)
+
+        self._count(agent, "misses")
+        return None
+
+    async def set(self, key: str, value: BaseModel, agent: str, ttl: Optional[float] = None) -> None:
+        """Store a parsed object under `key`."""
+        if not self.enabled or value is None:
+            return
+        ttl = self.ttl_seconds if ttl is None else ttl
+        payload = value.model_dump_json()
+        self._memory_set(key, agent, payload, time.time() + ttl)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.set, key, agent, payload, ttl)
+        self._count(agent, "stores")
+
+    def clear(self) -> None:
+        self._memory.clear()
+        self._memory_bytes = 0
+        if self._disk is not None:
+            self._disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        hits = sum(s["hits"] for s in self._stats.values())
+        misses = sum(s["misses"] for s in self._stats.values())
+        return {
+            "enabled": self.enabled,
+            "disk_enabled": self._disk is not None,
+            "entries": len(self._memory),
+            "bytes": self._memory_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "by_agent": self._stats,
+        }
+
+
+response_cache = ResponseCache()
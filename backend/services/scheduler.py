@@ -0,0 +1,269 @@
+"""
+Scheduler - Priority-aware admission control for every Gemini call.
+
+Each model gets a concurrency cap plus requests-per-minute and
+tokens-per-minute token buckets. Callers wait in one of four priority
+lanes; whenever capacity frees up the highest-priority waiter goes next,
+so interactive tutoring keeps flat latency while autopilot sessions and
+plan verification loops absorb the queueing.
+
+Lanes are derived from the agent call-site name, and can be overridden
+for a whole task tree with `run_in_lane` (used for autopilot sessions).
+"""
+
+import os
+import json
+import time
+import heapq
+import asyncio
+import itertools
+import contextvars
+from enum import IntEnum
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+
+class Lane(IntEnum):
+    """Priority lanes, lowest value is served first."""
+    INTERACTIVE = 0   # Tutor streams and explanations a student is watching
+    EVALUATION = 1    # Quiz generation/evaluation, misconception analysis
+    PLANNING = 2      # Routing, drafting, verification and fix loops
+    BACKGROUND = 3    # Autopilot sessions
+
+
+# Call-site prefix -> lane. Longest matching prefix wins.
+AGENT_LANES: Dict[str, Lane] = {
+    "tutor": Lane.INTERACTIVE,
+    "quiz": Lane.EVALUATION,
+    "misconception": Lane.EVALUATION,
+    "evaluator": Lane.EVALUATION,
+    "router": Lane.PLANNING,
+    "plan": Lane.PLANNING,
+    "syllabus": Lane.PLANNING,
+    "autopilot": Lane.BACKGROUND,
+}
+
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "32"))
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "0"))  # 0 = unlimited
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "0"))  # 0 = unlimited
+# Per-model overrides, e.g. {"gemini-3-pro-preview": {"concurrency": 8, "rpm": 60, "tpm": 400000}}
+GEMINI_MODEL_LIMITS: Dict[str, Dict[str, int]] = json.loads(os.getenv("GEMINI_MODEL_LIMITS", "{}"))
+# Output tokens reserved per call until usage_metadata reports the real count
+GEMINI_OUTPUT_TOKEN_RESERVE = int(os.getenv("GEMINI_OUTPUT_TOKEN_RESERVE", "1024"))
+
+_lane_override: contextvars.ContextVar[Optional[Lane]] = contextvars.ContextVar("lane_override", default=None)
+
+
+def lane_for(agent: str) -> Lane:
+    """Resolve the lane for a call site, honoring any run_in_lane override."""
+    override = _lane_override.get()
+    if override is not None:
+        return override
+    best, best_len = Lane.PLANNING, -1
+    for prefix, lane in AGENT_LANES.items():
+        if (agent == prefix or agent.startswith(prefix + ".")) and len(prefix) > best_len:
+            best, best_len = lane, len(prefix)
+    return best
+
+
+@contextmanager
+def run_in_lane(lane: Lane) -> Iterator[None]:
+    """Force every model call made in this context (and tasks it spawns) into `lane`."""
+    token = _lane_override.set(lane)
+    try:
+        yield
+    finally:
+        _lane_override.reset(token)
+
+
+def estimate_tokens(text_chars: int) -> int:
+    """Rough prompt token estimate (~4 chars/token) plus the output reserve."""
+    return text_chars // 4 + GEMINI_OUTPUT_TOKEN_RESERVE
+
+
+class TokenBucket:
+    """Continuous-refill bucket sized to one minute of budget. per_minute <= 0 means unlimited."""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.per_minute <= 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.per_minute, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (0 if available now)."""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.per_minute)  # Oversized requests wait for a full bucket, not forever
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        if not self.unlimited:
+            self.tokens -= min(amount, self.per_minute)
+
+    def adjust(self, delta: float) -> None:
+        """Charge (positive) or refund (negative) the difference between estimated and actual usage."""
+        if not self.unlimited:
+            self.tokens = min(self.per_minute, self.tokens - delta)
+
+
+class _Waiter:
+    def __init__(self, lane: Lane, tokens: int, future: "asyncio.Future"):
+        self.lane = lane
+        self.tokens = tokens
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class _LaneStats:
+    def __init__(self):
+        self.queued = 0
+        self.granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queued,
+            "granted": self.granted,
+            "avg_wait_ms": round(self.total_wait / self.granted * 1000, 1) if self.granted else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+        }
+
+
+class ModelScheduler:
+    """Admission control for a single model."""
+
+    def __init__(self, model: str, concurrency: int, rpm: int, tpm: int, lane_stats: Dict[Lane, _LaneStats]):
+        self.model = model
+        self.concurrency = concurrency
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.in_flight = 0
+        self._heap: List[Any] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lane_stats = lane_stats
+
+    async def acquire(self, lane: Lane, tokens: int) -> None:
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(lane, tokens, future)
+        heapq.heappush(self._heap, (lane, next(self._seq), waiter))
+        self._lane_stats[lane].queued += 1
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as we were cancelled: hand the slot back
+                self.release(tokens, tokens)
+            else:
+                # Still queued: _dispatch skips cancelled waiters
+                future.cancel()
+                self._lane_stats[lane].queued -= 1
+            raise
+
+    def release(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        self.in_flight -= 1
+        if actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._heap and self.in_flight < self.concurrency:
+            _, _, waiter = self._heap[0]
+            if waiter.future.done():  # Cancelled while queued
+                heapq.heappop(self._heap)
+                continue
+            delay = max(self.requests.wait_time(1), self.tokens.wait_time(waiter.tokens))
+            if delay > 0:
+                # Head of line waits for the buckets; lower lanes must not overtake it
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._heap)
+            self.requests.take(1)
+            self.tokens.take(waiter.tokens)
+            self.in_flight += 1
+
+            waited = time.monotonic() - waiter.enqueued_at
+            stats = self._lane_stats[waiter.lane]
+            stats.queued -= 1
+            stats.granted += 1
+            stats.total_wait += waited
+            stats.max_wait = max(stats.max_wait, waited)
+            waiter.future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.concurrency,
+            "queued": sum(1 for _, _, w in self._heap if not w.future.done()),
+            "rpm_available": None if self.requests.unlimited else int(self.requests.tokens),
+            "tpm_available": None if self.tokens.unlimited else int(self.tokens.tokens),
+        }
+
+
+class Slot:
+    """Handle for an admitted call; report real token usage before it is released."""
+
+    def __init__(self, estimated_tokens: int):
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens: Optional[int] = None
+
+
+class GeminiScheduler:
+    """Process-wide registry of per-model schedulers."""
+
+    def __init__(self):
+        self._models: Dict[str, ModelScheduler] = {}
+        self._lane_stats: Dict[Lane, _LaneStats] = {lane: _LaneStats() for lane in Lane}
+
+    def _for_model(self, model: str) -> ModelScheduler:
+        scheduler = self._models.get(model)
+        if scheduler is None:
+            limits = GEMINI_MODEL_LIMITS.get(model, {})
+            scheduler = ModelScheduler(
+                model,
+                concurrency=limits.get("concurrency", GEMINI_MAX_CONCURRENCY),
+                rpm=limits.get("rpm", GEMINI_RPM),
+                tpm=limits.get("tpm", GEMINI_TPM),
+                lane_stats=self._lane_stats,
+            )
+            self._models[model] = scheduler
+        return scheduler
+
+    @asynccontextmanager
+    async def slot(self, model: str, agent: str, prompt_chars: int) -> AsyncIterator[Slot]:
+        """Wait for admission on `model` in the agent's lane; hold the slot for the block."""
+        scheduler = self._for_model(model)
+        handle = Slot(estimate_tokens(prompt_chars))
+        await scheduler.acquire(lane_for(agent), handle.estimated_tokens)
+        try:
+            yield handle
+        finally:
+            scheduler.release(handle.estimated_tokens, handle.actual_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "lanes": {lane.name.lower(): s.as_dict() for lane, s in self._lane_stats.items()},
+            "models": {model: s.stats() for model, s in self._models.items()},
+        }
+
+
+scheduler = GeminiScheduler()
@@ -0,0 +1,104 @@
+"""
+Speculation - Start slow work on guessed inputs before the real inputs are known.
+
+A speculative task is started as soon as the request arrives, using the
+inputs the caller supplied. When the step that decides the real inputs
+finishes (e.g. routing), the caller either takes the result, which has been
+running all along, or discards it and starts over with the corrected inputs.
+A hit saves the head start. A miss costs whatever the task spent before it
+was discarded: cancelling it cancels its model calls too, unless another
+request is sharing them.
+
+Every Speculator counts hits, misses and skips (work that was abandoned for
+another reason, such as a cache hit), so the hit rate can be checked
+against the model spend.
+"""
+
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from services.metrics import metrics
+
+
+speculative_tasks = metrics.counter(
+    "speculative_tasks_total", "Speculative tasks by outcome (hit, miss, skipped).", ("name", "outcome"))
+speculation_saved_seconds = metrics.counter(
+    "speculation_saved_seconds_total", "Head start gained by speculative tasks that were used.", ("name",))
+speculation_wasted_seconds = metrics.counter(
+    "speculation_wasted_seconds_total", "Time speculative tasks ran before being discarded.", ("name",))
+
+
+class SpeculativeTask:
+    """Handle for one speculative task: take() (or claim()) it or discard() it, exactly once."""
+
+    def __init__(self, speculator: "Speculator", task: "asyncio.Task"):
+        self._speculator = speculator
+        self._task = task
+        self.started = time.monotonic()
+        self.settled = False
+
+    def claim(self) -> None:
+        """Mark the task as used without awaiting it (for callers that follow its progress themselves)."""
+        self.settled = True
+        self._speculator._record("hit", time.monotonic() - self.started)
+
+    async def take(self) -> Any:
+        """Use the speculative result; the time it has already run is the saving."""
+        self.claim()
+        return await self._task
+
+    def discard(self, outcome: str = "miss") -> None:
+        """
+        Cancel the task if still running, recording why it was not used.
+
+        Safe to call after take()/claim() (nothing is recorded then), so a
+        caller can always discard in a finally block.
+        """
+        if not self.settled:
+            self.settled = True
+            self._speculator._record(outcome, time.monotonic() - self.started)
+        if self._task.done():
+            if not self._task.cancelled():
+                self._task.exception()  # Retrieved so asyncio does not log it
+        else:
+            self._task.cancel()
+
+
+class Speculator:
+    """Starts speculative tasks for one call site and keeps their hit rate."""
+
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self._stats = {"started": 0, "hits": 0, "misses": 0, "skipped": 0}
+        self._saved_seconds = 0.0
+        self._wasted_seconds = 0.0
+
+    def start(self, factory: Callable[[], Awaitable[Any]]) -> Optional[SpeculativeTask]:
+        """Start `factory()` in the background, or return None when speculation is off."""
+        if not self.enabled:
+            return None
+        self._stats["started"] += 1
+        return SpeculativeTask(self, asyncio.ensure_future(factory()))
+
+    def _record(self, outcome: str, elapsed: float) -> None:
+        speculative_tasks.inc(name=self.name, outcome=outcome)
+        if outcome == "hit":
+            self._stats["hits"] += 1
+            self._saved_seconds += elapsed
+            speculation_saved_seconds.inc(elapsed, name=self.name)
+        else:
+            self._stats["misses" if outcome == "miss" else "skipped"] += 1
+            self._wasted_seconds += elapsed
+            speculation_wasted_seconds.inc(elapsed, name=self.name)
+
+    def stats(self) -> Dict[str, Any]:
+        decided = self._stats["hits"] + self._stats["misses"]
+        return {
+            "enabled": self.enabled,
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / decided, 3) if decided else None,
+            "saved_seconds": round(self._saved_seconds, 3),
+            "wasted_seconds": round(self._wasted_seconds, 3),
+        }
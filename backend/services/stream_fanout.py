@@ -0,0 +1,124 @@
+"""
+Stream Fan-out - Share one upstream text stream between many subscribers.
+
+When a class opens the same question at once, each HTTP request would
+otherwise open its own Gemini stream. The multiplexer runs one upstream
+stream per key, buffers every chunk, and lets late joiners replay the
+buffered prefix before following live chunks. Finished streams are kept
+for a short retention window so repeat requests replay instantly.
+"""
+
+import os
+import time
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from services.stream_timing import note_source
+
+
+STREAM_FANOUT_RETAIN_SECONDS = float(os.getenv("STREAM_FANOUT_RETAIN_SECONDS", "30"))
+
+
+class _Broadcast:
+    """Buffered state of one upstream stream."""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.task: Optional["asyncio.Task"] = None
+        self.finished_at: Optional[float] = None
+
+    def notify(self) -> None:
+        event, self.changed = self.changed, asyncio.Event()
+        event.set()
+
+
+class StreamMultiplexer:
+    """Runs at most one upstream stream per key and fans its chunks out to subscribers."""
+
+    def __init__(self, retain_seconds: float = STREAM_FANOUT_RETAIN_SECONDS):
+        self.retain_seconds = retain_seconds
+        self._broadcasts: Dict[str, _Broadcast] = {}
+        self._stats = {"upstream_streams": 0, "live_joins": 0, "replays": 0, "abandoned": 0}
+
+    def _purge_expired(self) -> None:
+        now = time.monotonic()
+        expired = [
+            key for key, b in self._broadcasts.items()
+            if b.done and now - b.finished_at > self.retain_seconds
+        ]
+        for key in expired:
+            del self._broadcasts[key]
+
+    async def _pump(self, key: str, broadcast: _Broadcast, factory: Callable[[], AsyncIterator[str]]) -> None:
+        try:
+            async for chunk in factory():
+                broadcast.chunks.append(chunk)
+                broadcast.notify()
+        except asyncio.CancelledError:
+            broadcast.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            broadcast.done = True
+            broadcast.finished_at = time.monotonic()
+            # Failed or abandoned streams must not be replayed
+            if broadcast.error is not None and self._broadcasts.get(key) is broadcast:
+                del self._broadcasts[key]
+            broadcast.notify()
+
+    async def subscribe(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Yield the stream for `key`, starting `factory()` upstream only if no
+        live or recently finished stream exists for it.
+        """
+        self._purge_expired()
+        broadcast = self._broadcasts.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._broadcasts[key] = broadcast
+            broadcast.task = asyncio.create_task(self._pump(key, broadcast, factory))
+            self._stats["upstream_streams"] += 1
+            note_source("upstream")
+        elif broadcast.done:
+            self._stats["replays"] += 1
+            note_source("replay")
+        else:
+            self._stats["live_joins"] += 1
+            note_source("live_join")
+
+        broadcast.subscribers += 1
+        position = 0
+        try:
+            while True:
+                if position < len(broadcast.chunks):
+                    chunk = broadcast.chunks[position]
+                    position += 1
+                    yield chunk
+                    continue
+                if broadcast.done:
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+                await broadcast.changed.wait()
+        finally:
+            broadcast.subscribers -= 1
+            # Nobody is listening any more: stop paying for the upstream stream
+            if broadcast.subscribers == 0 and not broadcast.done and broadcast.task is not None:
+                self._stats["abandoned"] += 1
+                broadcast.task.cancel()
+                if self._broadcasts.get(key) is broadcast:
+                    del self._broadcasts[key]
+
+    def stats(self) -> Dict[str, Any]:
+        live = [b for b in self._broadcasts.values() if not b.done]
+        return {
+            "live_streams": len(live),
+            "retained_streams": len(self._broadcasts) - len(live),
+            "subscribers": sum(b.subscribers for b in self._broadcasts.values()),
+            **self._stats,
+        }
@@ -0,0 +1,250 @@
+"""
+Stream Timing - Where the time goes in a streaming endpoint.
+
+Each instrumented stream gets a StreamTrace in a context variable. The
+model layer, the scheduler and the fan-out multiplexer add their events to
+it, and the endpoint records what is actually sent:
+
+- queue wait:            time spent waiting for scheduler admission
+- upstream first chunk:  first chunk (or structured response) from Gemini
+- first byte sent:       first chunk handed to the HTTP response
+- chunk gaps:            time between chunks sent to the client (and from upstream)
+- duration / bytes:      whole stream
+
+So a slow stream can be read as queueing, first-token delay or our own
+framing. Metrics are tagged by endpoint and model. Streams slower than the
+thresholds below are sampled and print their full timing trace.
+"""
+
+import os
+import time
+import random
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from services.metrics import metrics
+from services.model_policy import LatencyWindow
+
+
+# A stream is "slow" if either threshold is crossed
+STREAM_SLOW_TTFB_SECONDS = float(os.getenv("STREAM_SLOW_TTFB_SECONDS", "5"))
+STREAM_SLOW_TOTAL_SECONDS = float(os.getenv("STREAM_SLOW_TOTAL_SECONDS", "60"))
+# Fraction of slow streams whose full trace is logged
+STREAM_SLOW_SAMPLE_RATE = float(os.getenv("STREAM_SLOW_SAMPLE_RATE", "1"))
+# Events kept per trace (long streams only keep the first ones)
+STREAM_TRACE_MAX_EVENTS = int(os.getenv("STREAM_TRACE_MAX_EVENTS", "500"))
+
+# Chunk gaps are much shorter than request latencies
+GAP_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+stream_queue_wait_seconds = metrics.histogram(
+    "stream_queue_wait_seconds", "Scheduler admission wait per stream (summed over its model calls).", ("endpoint", "model"))
+stream_upstream_first_seconds = metrics.histogram(
+    "stream_upstream_first_chunk_seconds", "Stream start to first upstream chunk or response.", ("endpoint", "model"))
+stream_ttfb_seconds = metrics.histogram(
+    "stream_first_byte_seconds", "Stream start to first chunk handed to the HTTP response.", ("endpoint", "model"))
+stream_chunk_gap_seconds = metrics.histogram(
+    "stream_chunk_gap_seconds", "Gap between chunks sent to the client.", ("endpoint",), buckets=GAP_BUCKETS)
+stream_upstream_gap_seconds = metrics.histogram(
+    "stream_upstream_chunk_gap_seconds", "Gap between chunks received from Gemini.", ("endpoint", "model"), buckets=GAP_BUCKETS)
+stream_duration_seconds = metrics.histogram(
+    "stream_duration_seconds", "Whole stream duration.", ("endpoint", "model"))
+stream_bytes = metrics.histogram(
+    "stream_bytes", "Bytes sent per stream.", ("endpoint",), buckets=BYTES_BUCKETS)
+streams_total = metrics.counter(
+    "streams_total", "Streams by outcome (complete, error, disconnected).", ("endpoint", "outcome", "source"))
+
+
+class StreamTrace:
+    """Timing events for one streamed response."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.monotonic()
+        self.events: List[Tuple[float, str, Dict[str, Any]]] = []
+        self.models: Set[str] = set()
+        self.source = "upstream"  # Or live_join / replay when fan-out served it
+        self.queue_wait = 0.0
+        self.upstream_first: Optional[float] = None
+        self.first_byte: Optional[float] = None
+        self.last_upstream: Optional[float] = None
+        self.last_sent: Optional[float] = None
+        self.max_gap = 0.0
+        self.chunks = 0
+        self.bytes = 0
+
+    def _offset(self, now: float) -> float:
+        return round(now - self.started, 4)
+
+    def event(self, name: str, **detail: Any) -> None:
+        if len(self.events) < STREAM_TRACE_MAX_EVENTS:
+            self.events.append((self._offset(time.monotonic()), name, detail))
+
+    @property
+    def model(self) -> str:
+        return "+".join(sorted(self.models)) or "none"
+
+    def on_admitted(self, model: str, waited: float) -> None:
+        self.models.add(model)
+        self.queue_wait += waited
+        self.event("admitted", model=model, waited_ms=round(waited * 1000, 1))
+
+    def on_upstream(self, model: str, chars: int) -> None:
+        now = time.monotonic()
+        self.models.add(model)
+        if self.upstream_first is None:
+            self.upstream_first = now - self.started
+        elif self.last_upstream is not None:
+            stream_upstream_gap_seconds.observe(now - self.last_upstream, endpoint=self.endpoint, model=model)
+        self.last_upstream = now
+        self.event("upstream", model=model, chars=chars)
+
+    def on_sent(self, size: int) -> None:
+        now = time.monotonic()
+        if self.first_byte is None:
+            self.first_byte = now - self.started
+        elif self.last_sent is not None:
+            gap = now - self.last_sent
+            self.max_gap = max(self.max_gap, gap)
+            stream_chunk_gap_seconds.observe(gap, endpoint=self.endpoint)
+        self.last_sent = now
+        self.chunks += 1
+        self.bytes += size
+        self.event("sent", bytes=size)
+
+    def summary(self) -> Dict[str, Any]:
+        def _ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            "endpoint": self.endpoint,
+            "model": self.model,
+            "source": self.source,
+            "queue_wait_ms": _ms(self.queue_wait),
+            "upstream_first_ms": _ms(self.upstream_first),
+            "first_byte_ms": _ms(self.first_byte),
+            "max_gap_ms": _ms(self.max_gap),
+            "duration_ms": _ms(time.monotonic() - self.started),
+            "chunks": self.chunks,
+            "bytes": self.bytes,
+        }
+
+
+_current_trace: ContextVar[Optional[StreamTrace]] = ContextVar("stream_trace", default=None)
+
+
+def current_trace() -> Optional[StreamTrace]:
+    return _current_trace.get()
+
+
+def note_admitted(model: str, waited: float) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.on_admitted(model, waited)
+
+
+def note_upstream(model: str, chars: int) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.on_upstream(model, chars)
+
+
+def note_source(source: str) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.source = source
+        trace.event("fanout", source=source)
+
+
+class StreamTiming:
+    """Records finished stream traces into metrics and keeps recent windows for /api/system/stats."""
+
+    def __init__(
+        self,
+        slow_ttfb: float = STREAM_SLOW_TTFB_SECONDS,
+        slow_total: float = STREAM_SLOW_TOTAL_SECONDS,
+        sample_rate: float = STREAM_SLOW_SAMPLE_RATE,
+    ):
+        self.slow_ttfb = slow_ttfb
+        self.slow_total = slow_total
+        self.sample_rate = sample_rate
+        self._windows: Dict[str, Dict[str, LatencyWindow]] = {}
+        self._slow = 0
+
+    async def instrument(self, endpoint: str, stream: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Wrap a StreamingResponse body so every chunk sent is timed."""
+        trace = StreamTrace(endpoint)
+        # The response body runs in its own task, so this never leaks into other requests
+        _current_trace.set(trace)
+        outcome = "disconnected"
+        try:
+            async for chunk in stream:
+                trace.on_sent(len(chunk.encode()) if isinstance(chunk, str) else len(chunk))
+                yield chunk
+            outcome = "complete"
+        except Exception as e:
+            outcome = "error"
+            trace.event("error", error=type(e).__name__)
+            raise
+        finally:
+            _current_trace.set(None)
+            self._finish(trace, outcome)
+
+    def _window(self, endpoint: str, name: str) -> LatencyWindow:
+        windows = self._windows.setdefault(endpoint, {})
+        if name not in windows:
+            windows[name] = LatencyWindow()
+        return windows[name]
+
+    def _finish(self, trace: StreamTrace, outcome: str) -> None:
+        duration = time.monotonic() - trace.started
+        endpoint, model = trace.endpoint, trace.model
+        streams_total.inc(endpoint=endpoint, outcome=outcome, source=trace.source)
+        stream_duration_seconds.observe(duration, endpoint=endpoint, model=model)
+        stream_bytes.observe(trace.bytes, endpoint=endpoint)
+        stream_queue_wait_seconds.observe(trace.queue_wait, endpoint=endpoint, model=model)
+        self._window(endpoint, "duration").add(duration)
+        if trace.upstream_first is not None:
+            stream_upstream_first_seconds.observe(trace.upstream_first, endpoint=endpoint, model=model)
+            self._window(endpoint, "upstream_first").add(trace.upstream_first)
+        if trace.first_byte is not None:
+            stream_ttfb_seconds.observe(trace.first_byte, endpoint=endpoint, model=model)
+            self._window(endpoint, "first_byte").add(trace.first_byte)
+
+        slow = (trace.first_byte or duration) > self.slow_ttfb or duration > self.slow_total
+        if slow:
+            self._slow += 1
+            if random.random() < self.sample_rate:
+                self._log_trace(trace, outcome)
+
+    def _log_trace(self, trace: StreamTrace, outcome: str) -> None:
+        s = trace.summary()
+        print(
+            f"🐢 Slow stream {s['endpoint']} ({outcome}, {s['model']}, {s['source']}): "
+            f"queue {s['queue_wait_ms']}ms, upstream first {s['upstream_first_ms']}ms, "
+            f"first byte {s['first_byte_ms']}ms, max gap {s['max_gap_ms']}ms, "
+            f"total {s['duration_ms']}ms, {s['chunks']} chunks / {s['bytes']} bytes"
+        )
+        for offset, name, detail in trace.events:
+            details = " ".join(f"{k}={v}" for k, v in detail.items())
+            print(f"   +{offset * 1000:9.1f}ms {name} {details}")
+
+    def stats(self) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint, windows in self._windows.items():
+            entry = {"streams": windows["duration"].count}
+            for name, window in windows.items():
+                p50, p95 = window.percentile(50), window.percentile(95)
+                entry[f"{name}_p50_ms"] = round(p50 * 1000, 1) if p50 is not None else None
+                entry[f"{name}_p95_ms"] = round(p95 * 1000, 1) if p95 is not None else None
+            endpoints[endpoint] = entry
+        return {
+            "slow_ttfb_seconds": self.slow_ttfb,
+            "slow_total_seconds": self.slow_total,
+            "slow_streams": self._slow,
+            "endpoints": endpoints,
+        }
+
+
+stream_timing = StreamTiming()
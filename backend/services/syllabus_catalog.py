@@ -0,0 +1,224 @@
+"""
+Syllabus Catalog - Indexed view of the syllabus registry.
+
+SYLLABI_REGISTRY is a nested dict of prose chunks, which made every
+consumer re-walk it with substring matching. The catalog compiles it once at
+import into:
+
+- topics with stable IDs ("neet/chemistry/organic/hydrocarbons"), grouped by
+  scope (exam, subject, sub-subject)
+- the syllabus text of every scope, including whole subjects and exams
+- a reverse lookup from scope text to scope, for code that only has the text
+- a fuzzy index (normalized names, aliases and character trigrams) that maps
+  free-text topic names from model output back to canonical topics
+
+Lookups are dict hits, except fuzzy matching, which only scores the topics
+that share a trigram with the query.
+"""
+
+import re
+from collections import Counter
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# (exam, subject, sub_subject); subject and sub_subject are None for wider scopes
+ScopeKey = Tuple[str, Optional[str], Optional[str]]
+
+# Subject names that mean "the whole exam"
+_WHOLE_EXAM = {"", "all", "general", "full", "full syllabus", "complete syllabus", "all subjects"}
+
+
+class CatalogTopic(BaseModel):
+    id: str = Field(description="Stable path ID, e.g. 'upsc/history/ancient-india'")
+    name: str
+    exam: str
+    subject: str
+    sub_subject: Optional[str] = None
+    details: List[str] = Field(default_factory=list, description="Items listed after the topic name")
+
+    @property
+    def scope(self) -> ScopeKey:
+        return (self.exam, self.subject, self.sub_subject)
+
+
+def normalize(text: str) -> str:
+    """Lowercase words and digits only, so 'Work, Energy & Power' == 'work energy and power'."""
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower().replace("&", " and ")))
+
+
+def _slug(text: str) -> str:
+    return normalize(text).replace(" ", "-") or "topic"
+
+
+def _trigrams(normalized: str) -> Set[str]:
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _parse_line(line: str) -> Tuple[str, List[str], List[str]]:
+    """'Ancient India: Prehistoric, Vedic.' -> name, details, aliases."""
+    name, _, rest = line.partition(":")
+    details = [d.strip(" .") for d in rest.split(",") if d.strip(" .")]
+    name = name.strip(" .")
+    aliases = []
+    # "s-Block Elements (Alkali and Alkaline earth metals)" is also known by either part
+    paren = re.match(r"(.+?)\s*\((.+)\)$", name)
+    if paren:
+        aliases = [paren.group(1), paren.group(2)]
+    return name, details, aliases
+
+
+class SyllabusCatalog:
+    """Topics, scope texts and lookup indexes compiled from a syllabus registry."""
+
+    def __init__(self, registry: Dict[str, Dict[str, Any]], subject_aliases: Optional[Dict[str, List[str]]] = None):
+        self.topics: Dict[str, CatalogTopic] = {}
+        self._scope_topics: Dict[ScopeKey, List[str]] = {}
+        self._scope_text: Dict[ScopeKey, str] = {}
+        self._text_scope: Dict[str, ScopeKey] = {}
+        self._subjects: Dict[str, List[str]] = {}
+        self._sub_subjects: Dict[Tuple[str, str], List[str]] = {}
+        self._subject_names: Dict[Tuple[str, str], str] = {}
+        # Fuzzy index: entry = (normalized name or alias, topic id, is_alias)
+        self._entries: List[Tuple[str, str, bool]] = []
+        self._entry_grams: List[Set[str]] = []
+        self._exact: Dict[str, List[int]] = {}
+        self._gram_index: Dict[str, List[int]] = {}
+        self._compile(registry, subject_aliases or {})
+
+    def _compile(self, registry: Dict[str, Dict[str, Any]], subject_aliases: Dict[str, List[str]]) -> None:
+        for exam, subjects in registry.items():
+            self._subjects[exam] = list(subjects)
+            for subject, value in subjects.items():
+                for name in [subject] + subject_aliases.get(subject, []):
+                    self._subject_names.setdefault((exam, normalize(name)), subject)
+                # NEET chemistry is split into sub-subjects
+                branches = value.items() if isinstance(value, dict) else [(None, value)]
+                if isinstance(value, dict):
+                    self._sub_subjects[(exam, subject)] = list(value)
+                for sub, text in branches:
+                    self._add_scope((exam, subject, sub), text)
+                if isinstance(value, dict):
+                    self._add_scope((exam, subject, None), "\n\n".join(value.values()), children=[
+                        (exam, subject, sub) for sub in value
+                    ])
+            self._add_scope((exam, None, None), "\n\n".join(
+                self._scope_text[(exam, s, None)] for s in subjects
+            ), children=[(exam, s, None) for s in subjects])
+
+    def _add_scope(self, scope: ScopeKey, text: str, children: Optional[List[ScopeKey]] = None) -> None:
+        self._scope_text[scope] = text
+        self._text_scope.setdefault(text, scope)
+        if children is not None:
+            self._scope_topics[scope] = [t for child in children for t in self._scope_topics[child]]
+            return
+        exam, subject, sub = scope
+        ids = []
+        for line in re.findall(r"^- (.+)$", text, re.MULTILINE):
+            name, details, aliases = _parse_line(line)
+            base = "/".join(p for p in (exam, subject, sub, _slug(name)) if p)
+            topic_id, n = base, 2
+            while topic_id in self.topics:
+                topic_id, n = f"{base}-{n}", n + 1
+            self.topics[topic_id] = CatalogTopic(
+                id=topic_id, name=name, exam=exam, subject=subject, sub_subject=sub, details=details
+            )
+            ids.append(topic_id)
+            self._index(name, topic_id, False)
+            for alias in aliases + details:
+                self._index(alias, topic_id, True)
+        self._scope_topics[scope] = ids
+
+    def _index(self, text: str, topic_id: str, is_alias: bool) -> None:
+        key = normalize(text)
+        if not key:
+            return
+        position = len(self._entries)
+        self._entries.append((key, topic_id, is_alias))
+        grams = _trigrams(key)
+        self._entry_grams.append(grams)
+        self._exact.setdefault(key, []).append(position)
+        for gram in grams:
+            self._gram_index.setdefault(gram, []).append(position)
+
+    # --- Scopes ---
+
+    def subjects(self, exam: str) -> List[str]:
+        return self._subjects.get(exam, [])
+
+    def resolve_scope(self, exam: str, subject: Optional[str] = None, sub_subject: Optional[str] = None) -> Optional[ScopeKey]:
+        """
+        The registry scope closest to a (possibly free-text) exam/subject/sub-subject.
+
+        Subject names go through the alias table ("Mathematics" -> math), then
+        a containment match ("Indian Polity" -> polity). An unknown or generic
+        subject is the whole exam, and an unknown sub-subject the whole subject.
+        """
+        if exam not in self._subjects:
+            return None
+        name = normalize(subject or "")
+        if name in _WHOLE_EXAM:
+            return (exam, None, None)
+        resolved = self._subject_names.get((exam, name))
+        if resolved is None:
+            resolved = next((
+                s for (e, alias), s in self._subject_names.items()
+                if e == exam and (f" {alias} " in f" {name} " or f" {name} " in f" {alias} ")
+            ), None)
+        if resolved is None:
+            return (exam, None, None)
+        sub = normalize(sub_subject or "")
+        subs = self._sub_subjects.get((exam, resolved), [])
+        branch = next((b for b in subs if b == sub or f" {b} " in f" {sub} "), None)
+        return (exam, resolved, branch)
+
+    def scope_text(self, exam: str, subject: Optional[str] = None, sub_subject: Optional[str] = None) -> Optional[str]:
+        """Precomputed syllabus text of a registry scope (None if the scope does not exist)."""
+        return self._scope_text.get((exam, subject, sub_subject))
+
+    def scope_of(self, syllabus_text: str) -> Optional[ScopeKey]:
+        """The scope whose syllabus text this is, or None for text that is not from the registry."""
+        return self._text_scope.get(syllabus_text)
+
+    def topics_in(self, scope: ScopeKey) -> List[CatalogTopic]:
+        return [self.topics[i] for i in self._scope_topics.get(scope, [])]
+
+    # --- Fuzzy lookup ---
+
+    def match(self, name: str, scope: Optional[ScopeKey] = None, min_similarity: float = 0.55) -> Optional[CatalogTopic]:
+        """
+        The canonical topic a free-text topic name refers to, or None.
+
+        An exact name beats an exact alias (a detail item such as "Indus
+        Valley"). Otherwise candidates sharing trigrams with the name are
+        scored by Dice similarity. `scope` limits matches to that scope's topics.
+        """
+        key = normalize(name)
+        if not key:
+            return None
+        allowed = set(self._scope_topics.get(scope, [])) if scope else None
+
+        def _usable(position: int) -> bool:
+            return allowed is None or self._entries[position][1] in allowed
+
+        exact = [p for p in self._exact.get(key, []) if _usable(p)]
+        if exact:
+            best = min(exact, key=lambda p: self._entries[p][2])  # Names (False) before aliases
+            return self.topics[self._entries[best][1]]
+
+        grams = _trigrams(key)
+        shared = Counter(p for gram in grams for p in self._gram_index.get(gram, []) if _usable(p))
+        best_topic, best_score = None, min_similarity
+        for position, common in shared.items():
+            score = 2 * common / (len(grams) + len(self._entry_grams[position]))
+            if score > best_score or (score == best_score and best_topic is None):
+                best_topic, best_score = self._entries[position][1], score
+        return self.topics[best_topic] if best_topic else None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "topics": len(self.topics),
+            "scopes": len(self._scope_text),
+            "index_entries": len(self._entries),
+            "trigrams": len(self._gram_index),
+        }
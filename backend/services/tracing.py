@@ -0,0 +1,385 @@
+"""
+Tracing - Lightweight spans across routes, model calls, Supabase and autopilot.
+
+The span model follows OpenTelemetry: 128-bit trace ids, 64-bit span ids,
+parent links, attributes, events and status. Incoming W3C `traceparent`
+headers are honoured, and every response carries one back. The current
+span lives in a context variable, so it follows awaits, asyncio tasks
+(including autopilot sessions started from a request) and
+asyncio.to_thread calls.
+
+Exporters (TRACING_EXPORTER):
+- none (default): nothing is recorded; span() hands back a shared no-op
+- stdout: one OTLP/JSON line per finished span
+- file: the same lines appended to TRACING_FILE. The lines are valid OTLP/JSON
+  `resourceSpans` documents, so an OpenTelemetry collector's otlpjsonfile
+  receiver can read them directly.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import secrets
+import functools
+import threading
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, IO, List, Optional
+
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none")  # none, stdout, file
+TRACING_FILE = os.getenv("TRACING_FILE", "traces/spans.jsonl")
+# Fraction of root spans (new traces) that are recorded; children follow their root
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", "1"))
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "exammentor-ai")
+
+# OTLP SpanKind values
+SPAN_KIND = {"internal": 1, "server": 2, "client": 3}
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None]
+
+
+class Span:
+    """One timed operation. Use via `tracer.span(...)`, never construct directly."""
+
+    recording = True
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes)
+        self.events: List[Dict[str, Any]] = []
+        self.status = 0  # OTLP: 0 unset, 1 ok, 2 error
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        self.attributes.update(attributes)
+
+    def add_event(self, name: str, **attributes: Any) -> None:
+        self.events.append({"name": name, "timeUnixNano": str(time.time_ns()), "attributes": _otlp_attributes(attributes)})
+
+    def record_exception(self, exc: BaseException) -> None:
+        self.status = 2
+        self.status_message = f"{type(exc).__name__}: {exc}"[:500]
+        self.add_event("exception", **{"exception.type": type(exc).__name__, "exception.message": str(exc)[:500]})
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KIND.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": self.status, **({"message": self.status_message} if self.status_message else {})},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.events:
+            span["events"] = self.events
+        return span
+
+
+class _NoopSpan:
+    """Stands in when tracing is off or the trace is not sampled."""
+
+    recording = False
+    trace_id = ""
+    span_id = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        pass
+
+    def add_event(self, name: str, **attributes: Any) -> None:
+        pass
+
+    def record_exception(self, exc: BaseException) -> None:
+        pass
+
+    def traceparent(self) -> Optional[str]:
+        return None
+
+
+NOOP_SPAN = _NoopSpan()
+
+# None: no trace yet; NOOP_SPAN: inside an unsampled trace
+_current_span: ContextVar[Any] = ContextVar("current_span", default=None)
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[tuple]:
+    """(trace_id, parent_span_id, sampled) from a W3C traceparent header, or None if invalid."""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class _SpanScope:
+    """Context manager (sync or async code) that makes a span current and exports it on exit."""
+
+    def __init__(self, tracer: "Tracer", span: Any):
+        self.tracer = tracer
+        self.span = span
+        self._token = None
+        self._previous = None
+
+    def __enter__(self) -> Any:
+        self._previous = _current_span.get()
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None and not isinstance(exc, GeneratorExit):
+            self.span.record_exception(exc)
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Exited in another context (e.g. an async generator closed by a different task)
+            _current_span.set(self._previous)
+        if self.span.recording:
+            self.span.end_ns = time.time_ns()
+            self.tracer.export(self.span)
+
+
+class Tracer:
+    """Creates spans and hands finished ones to the configured exporter."""
+
+    def __init__(
+        self,
+        exporter: str = TRACING_EXPORTER,
+        path: str = TRACING_FILE,
+        sample_rate: float = TRACING_SAMPLE_RATE,
+        service_name: str = TRACING_SERVICE_NAME,
+    ):
+        self.exporter = exporter
+        self.enabled = exporter in ("stdout", "file")
+        self.path = path
+        self.sample_rate = sample_rate
+        self.resource = {"attributes": _otlp_attributes({"service.name": service_name})}
+        self._file: Optional[IO[str]] = None
+        self._lock = threading.Lock()  # Spans also finish inside to_thread workers
+        self._exported = 0
+
+    def current_span(self) -> Any:
+        return _current_span.get() or NOOP_SPAN
+
+    def span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = None,
+        kind: str = "internal",
+        traceparent: Optional[str] = None,
+    ) -> _SpanScope:
+        """
+        Start a child of the current span (or a new trace).
+
+        `traceparent` continues a remote trace when there is no current span.
+        """
+        if not self.enabled:
+            return _SpanScope(self, NOOP_SPAN)
+        parent = _current_span.get()
+        if parent is NOOP_SPAN:
+            return _SpanScope(self, NOOP_SPAN)
+        if parent is not None:
+            return _SpanScope(self, Span(name, parent.trace_id, parent.span_id, kind, attributes or {}))
+
+        remote = parse_traceparent(traceparent)
+        if remote is not None:
+            trace_id, parent_id, sampled = remote
+        else:
+            trace_id, parent_id = secrets.token_hex(16), None
+            sampled = random.random() < self.sample_rate
+        if not sampled:
+            return _SpanScope(self, NOOP_SPAN)
+        return _SpanScope(self, Span(name, trace_id, parent_id, kind, attributes or {}))
+
+    def export(self, span: Span) -> None:
+        line = json.dumps({
+            "resourceSpans": [{
+                "resource": self.resource,
+                "scopeSpans": [{"scope": {"name": "exammentor.tracing"}, "spans": [span.to_otlp()]}],
+            }]
+        }, separators=(",", ":"), default=str)
+        with self._lock:
+            self._exported += 1
+            if self.exporter == "stdout":
+                sys.stdout.write(line + "\n")
+                return
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "exporter": self.exporter,
+            "sample_rate": self.sample_rate,
+            "exported_spans": self._exported,
+        }
+
+
+tracer = Tracer()
+
+
+def traced(name: str, **attributes: Any) -> Callable:
+    """Decorator running an async function inside a span; the body can add attributes via tracer.current_span()."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with tracer.span(name, attributes):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# --- HTTP ---
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening a server span per request.
+
+    The span is named after the route template once routing has happened,
+    and the response carries a `traceparent` header for correlation.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        method = scope.get("method", "")
+        with tracer.span(
+            f"{method} {scope.get('path', '')}",
+            {"http.request.method": method, "url.path": scope.get("path", "")},
+            kind="server",
+            traceparent=headers.get("traceparent"),
+        ) as span:
+            async def _send(message: Dict[str, Any]) -> None:
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.response.status_code", message["status"])
+                    if message["status"] >= 500 and span.recording:
+                        span.status = 2
+                    traceparent = span.traceparent()
+                    if traceparent:
+                        message = {**message, "headers": list(message.get("headers", [])) + [
+                            (b"traceparent", traceparent.encode("latin-1"))
+                        ]}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, _send)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route and span.recording:
+                    span.name = f"{method} {route}"
+                    span.set_attribute("http.route", route)
+
+
+# --- Supabase ---
+
+_QUERY_OPERATIONS = ("select", "insert", "upsert", "update", "delete", "rpc")
+
+
+class _TracedQuery:
+    """Proxy over a postgrest request builder that wraps execute() in a client span."""
+
+    def __init__(self, query: Any, table: str, operation: Optional[str]):
+        self._query = query
+        self._table = table
+        self._operation = operation
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._query, name)
+        if not callable(attr):
+            return attr
+        if name == "execute":
+            return self._execute
+        operation = self._operation or (name if name in _QUERY_OPERATIONS else None)
+
+        def _chain(*args: Any, **kwargs: Any) -> Any:
+            result = attr(*args, **kwargs)
+            return _TracedQuery(result, self._table, operation) if hasattr(result, "execute") else result
+
+        return _chain
+
+    def _execute(self, *args: Any, **kwargs: Any) -> Any:
+        with tracer.span(
+            f"supabase {self._operation or 'query'} {self._table}",
+            {"db.system": "postgresql", "db.collection.name": self._table, "db.operation.name": self._operation},
+            kind="client",
+        ) as span:
+            result = self._query.execute(*args, **kwargs)
+            data = getattr(result, "data", None)
+            if isinstance(data, list):
+                span.set_attribute("db.response.returned_rows", len(data))
+            return result
+
+
+class TracedSupabase:
+    """Wraps a supabase Client so every table query becomes a span; everything else passes through."""
+
+    def __init__(self, client: Any):
+        self._client = client
+
+    def table(self, name: str) -> _TracedQuery:
+        return _TracedQuery(self._client.table(name), name, None)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+
+def trace_supabase(client: Any) -> Any:
+    """Wrap a Supabase client for tracing (returned unchanged when tracing is off or client is None)."""
+    if client is None or not tracer.enabled:
+        return client
+    return TracedSupabase(client)
@@ -0,0 +1,391 @@
+"""
+Agent Benchmarks - Latency of every agent entry point against the fake Gemini backend.
+
+Two phases per scenario:
+- overhead: sequential calls with zero model latency. Time not spent inside
+  the model client is our own cost (prompt building, scheduling, schema
+  handling, pydantic parsing, serialization).
+- concurrency: the same calls at each concurrency level with simulated model
+  latency, reporting p50/p95/p99 and throughput (and TTFT for streams).
+
+Results are written as JSON so runs can be compared between commits.
+
+Usage (from backend/):
+    python -m tests.bench_agents
+    python -m tests.bench_agents --concurrency 1,8,32 --latency lognormal:0.2,0.4 --output bench.json
+    python -m tests.bench_agents --scenarios quiz.generate_quiz,tutor.stream_explanation
+    python -m tests.bench_agents --baseline bench.json --tolerance 0.25   # exit 1 on regression
+    python -m tests.bench_agents --cassette cassettes/gemini.jsonl.gz --replay-speed 0.5
+
+With --cassette, model calls are served from a recording made with
+GEMINI_BACKEND=record (see services/cassette.py). This replays real
+response shapes, sizes and timing, and --latency/--chunk-latency are ignored.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import contextlib
+import subprocess
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Benchmarks never touch the network, caches or UI pacing; set before agents are imported
+os.environ["GEMINI_BACKEND"] = "fake"
+os.environ.setdefault("RESPONSE_CACHE_ENABLED", "0")
+os.environ.setdefault("PLAN_CACHE_ENABLED", "0")
+os.environ.setdefault("GEMINI_HEDGE_ENABLED", "0")
+os.environ.setdefault("AUTOPILOT_LESSON_PAUSE_SECONDS", "0")
+os.environ.setdefault("AUTOPILOT_TOPIC_PAUSE_SECONDS", "0")
+
+from services.genai_service import gemini
+from services.fake_gemini import FakeGeminiClient, FakeGeminiConfig
+from services.cassette import Cassette, ReplayClient
+from agents.plan_agent import generate_study_plan, generate_verified_plan_with_history
+from agents.tutor_agent import stream_explanation
+from agents.quiz_agent import generate_quiz, generate_quiz_from_image, evaluate_answer, Question, QuestionType, DifficultyLevel
+from agents.evaluator_agent import analyze_performance, QuizAnswer
+from agents.misconception_agent import analyze_and_bust_misconception
+from agents.autopilot_agent import AutopilotEngine, AutopilotSession
+
+
+# --- Model Timing ---
+
+class TimedModels:
+    """Wraps the fake client's models and accumulates time spent inside them."""
+
+    def __init__(self, inner: Any):
+        self.inner = inner
+        self.seconds = 0.0
+        self.calls = 0
+
+    async def generate_content(self, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return await self.inner.generate_content(**kwargs)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.calls += 1
+
+    async def generate_content_stream(self, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        stream = await self.inner.generate_content_stream(**kwargs)
+        self.seconds += time.perf_counter() - started
+        self.calls += 1
+
+        async def _timed():
+            iterator = stream.__aiter__()
+            while True:
+                chunk_started = time.perf_counter()
+                try:
+                    chunk = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    self.seconds += time.perf_counter() - chunk_started
+                yield chunk
+
+        return _timed()
+
+
+def install_fake(config: FakeGeminiConfig, cassette: Optional[Cassette] = None, replay_speed: float = 1.0) -> TimedModels:
+    """Install the fake backend, or a replay of `cassette` when one is given."""
+    client = ReplayClient(cassette, speed=replay_speed) if cassette is not None else FakeGeminiClient(config)
+    timed = TimedModels(client.aio.models)
+    client.aio.models = timed
+    gemini.install(client)
+    return timed
+
+
+# --- Scenarios ---
+
+SYLLABUS = "\n".join(f"- Unit {n}" for n in range(1, 13))
+
+
+def _question(i: int) -> Question:
+    return Question(
+        id=f"q{i}",
+        text=f"Which process results in four haploid daughter cells? ({i})",
+        question_type=QuestionType.MULTIPLE_CHOICE,
+        options=["Mitosis", "Meiosis", "Binary Fission", "Budding"],
+        correct_option_index=1,
+        explanation="Meiosis is two rounds of division resulting in four cells.",
+        difficulty=DifficultyLevel.MEDIUM,
+        concept_tested="Meiosis vs Mitosis",
+    )
+
+
+async def _stream_tutor(i: int) -> Dict[str, float]:
+    started = time.perf_counter()
+    ttft = None
+    async for _ in stream_explanation(f"Osmosis {i}", "Water moves across membranes."):
+        if ttft is None:
+            ttft = time.perf_counter() - started
+    return {"ttft": ttft or 0.0}
+
+
+class _BenchAutopilot(AutopilotEngine):
+    """Answers instantly (first answer wrong, to exercise misconception analysis) and stops after one topic."""
+
+    answered = 0
+
+    async def wait_for_answer(self, timeout_seconds: int = 60) -> int:
+        self.stop()  # The current topic still runs to completion
+        question = self.session.current_question or {}
+        correct = question.get("correct_option_index", 0)
+        options = question.get("options") or ["?"]
+        self.answered += 1
+        return (correct + 1) % len(options) if self.answered == 1 else correct
+
+
+async def _autopilot_topic(i: int) -> None:
+    plan = {"schedule": [{"day": 1, "topics": [{"name": f"Cells {i}"}, {"name": f"Genetics {i}"}]}]}
+    session = AutopilotSession(session_id=f"bench-{i}", study_plan=plan, exam_type="NEET")
+    async for _ in _BenchAutopilot(session).run_session():
+        pass
+
+
+SCENARIOS: Dict[str, Callable[[int], Awaitable[Any]]] = {
+    "plan.generate_study_plan": lambda i: generate_study_plan(SYLLABUS, "NEET", f"Score 650+ ({i})", 7),
+    "plan.generate_verified_plan_with_history": lambda i: generate_verified_plan_with_history(
+        SYLLABUS, "NEET", f"Score 650+ in biology ({i})", 7
+    ),
+    "tutor.stream_explanation": _stream_tutor,
+    "quiz.generate_quiz": lambda i: generate_quiz(f"Calvin Cycle {i}", "RuBisCO fixes CO2 in the stroma.", 5),
+    "quiz.generate_quiz_from_image": lambda i: generate_quiz_from_image(
+        f"Heart {i}", b"\x89PNG\r\n\x1a\n" + bytes(2048), "image/png", 3
+    ),
+    "quiz.evaluate_answer": lambda i: evaluate_answer(_question(i), i % 4, "Meiosis halves chromosome number."),
+    "evaluator.analyze_performance": lambda i: analyze_performance(
+        [
+            QuizAnswer(question_id=f"q{n}", question_text=f"Question {n} ({i})", concept_tested="Meiosis",
+                       student_answer="Mitosis", correct_answer="Meiosis", is_correct=n % 2 == 0)
+            for n in range(5)
+        ],
+        "Cell Division",
+        "Mitosis produces 2 diploid cells. Meiosis produces 4 haploid cells.",
+    ),
+    "misconception.analyze_and_bust_misconception": lambda i: analyze_and_bust_misconception(
+        _question(i), 0, "Mitosis produces 2 diploid cells. Meiosis produces 4 haploid cells."
+    ),
+    "autopilot.topic_cycle": _autopilot_topic,
+}
+
+
+# --- Measurement ---
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return round(value * 1000, 3) if value is not None else None
+
+
+async def measure_overhead(name: str, iterations: int, seed: int, cassette: Optional[Cassette] = None) -> Dict[str, Any]:
+    """Sequential calls with zero model latency; overhead = wall time - time inside the model client."""
+    timed = install_fake(
+        FakeGeminiConfig(seed=seed, latency="fixed:0", chunk_latency="fixed:0", model_latency={}),
+        cassette, replay_speed=0,
+    )
+    run = SCENARIOS[name]
+    await run(-1)  # Warm up imports and lazily built state
+
+    totals, overheads = [], []
+    calls_before = timed.calls
+    for i in range(iterations):
+        model_before = timed.seconds
+        started = time.perf_counter()
+        await run(i)
+        elapsed = time.perf_counter() - started
+        totals.append(elapsed)
+        overheads.append(elapsed - (timed.seconds - model_before))
+
+    return {
+        "iterations": iterations,
+        "model_calls_per_op": round((timed.calls - calls_before) / iterations, 2),
+        "e2e_p50_ms": _ms(_percentile(totals, 50)),
+        "overhead_p50_ms": _ms(_percentile(overheads, 50)),
+        "overhead_p95_ms": _ms(_percentile(overheads, 95)),
+    }
+
+
+async def measure_concurrency(
+    name: str,
+    concurrency: int,
+    operations: int,
+    latency: str,
+    chunk_latency: str,
+    seed: int,
+    cassette: Optional[Cassette] = None,
+    replay_speed: float = 1.0,
+) -> Dict[str, Any]:
+    """Run `operations` calls with at most `concurrency` in flight."""
+    install_fake(
+        FakeGeminiConfig(seed=seed, latency=latency, chunk_latency=chunk_latency, model_latency={}),
+        cassette, replay_speed,
+    )
+    run = SCENARIOS[name]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    errors = 0
+
+    async def _one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                result = await run(i)
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+            if isinstance(result, dict) and "ttft" in result:
+                ttfts.append(result["ttft"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*[_one(i) for i in range(operations)])
+    wall = time.perf_counter() - started
+
+    result = {
+        "operations": operations,
+        "errors": errors,
+        "throughput_ops_per_s": round(len(latencies) / wall, 2) if wall else None,
+        "p50_ms": _ms(_percentile(latencies, 50)),
+        "p95_ms": _ms(_percentile(latencies, 95)),
+        "p99_ms": _ms(_percentile(latencies, 99)),
+    }
+    if ttfts:
+        result["ttft_p50_ms"] = _ms(_percentile(ttfts, 50))
+        result["ttft_p95_ms"] = _ms(_percentile(ttfts, 95))
+    return result
+
+
+# --- Baseline Comparison ---
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """List regressions (overhead p50, per-level p95) of `results` against `baseline`."""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        old, new = previous.get("overhead", {}), current.get("overhead", {})
+        if old.get("overhead_p50_ms") and new.get("overhead_p50_ms", 0) > old["overhead_p50_ms"] * (1 + tolerance):
+            regressions.append(f"{name} overhead p50 {old['overhead_p50_ms']}ms -> {new['overhead_p50_ms']}ms")
+        for level, stats in current.get("concurrency", {}).items():
+            old_level = previous.get("concurrency", {}).get(level, {})
+            if old_level.get("p95_ms") and stats.get("p95_ms", 0) > old_level["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{name} c={level} p95 {old_level['p95_ms']}ms -> {stats['p95_ms']}ms")
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+# --- Runner ---
+
+def log(message: str) -> None:
+    """Progress goes to stderr so stdout can carry the JSON results."""
+    print(message, file=sys.stderr)
+
+
+async def run_benchmarks(args: argparse.Namespace) -> Dict[str, Any]:
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    levels = [int(c) for c in args.concurrency.split(",")]
+    cassette = Cassette.load(args.cassette) if args.cassette else None
+    if cassette is not None:
+        log(f"📼 Replaying {len(cassette.entries)} recorded calls from {args.cassette} at speed {args.replay_speed}")
+    results: Dict[str, Any] = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "iterations": args.iterations,
+            "concurrency": levels,
+            "latency": args.latency,
+            "chunk_latency": args.chunk_latency,
+            "seed": args.seed,
+            "cassette": args.cassette or None,
+            "replay_speed": args.replay_speed if args.cassette else None,
+        },
+        "scenarios": {},
+    }
+
+    # Agents log every step; keep that out of the timings and the JSON output
+    with open(os.devnull, "w") as devnull:
+        for name in names:
+            log(f"⏱️  {name}")
+            with contextlib.redirect_stdout(sys.stderr if args.verbose else devnull):
+                entry = {"overhead": await measure_overhead(name, args.iterations, args.seed, cassette), "concurrency": {}}
+                for level in levels:
+                    operations = max(args.iterations, level * 2)
+                    entry["concurrency"][str(level)] = await measure_concurrency(
+                        name, level, operations, args.latency, args.chunk_latency, args.seed,
+                        cassette, args.replay_speed,
+                    )
+            results["scenarios"][name] = entry
+            o = entry["overhead"]
+            log(f"   overhead p50 {o['overhead_p50_ms']}ms p95 {o['overhead_p95_ms']}ms ({o['model_calls_per_op']} model calls/op)")
+            for level, c in entry["concurrency"].items():
+                ttft = f" ttft p50 {c['ttft_p50_ms']}ms" if "ttft_p50_ms" in c else ""
+                log(f"   c={level:<3} p50 {c['p50_ms']}ms p95 {c['p95_ms']}ms p99 {c['p99_ms']}ms "
+                      f"{c['throughput_ops_per_s']} ops/s{ttft}" + (f" errors {c['errors']}" if c["errors"] else ""))
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark agent entry points against the fake Gemini backend.")
+    parser.add_argument("--iterations", type=int, default=20, help="Calls per scenario in the overhead phase")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--latency", default="lognormal:0.05,0.3", help="Simulated model latency spec")
+    parser.add_argument("--chunk-latency", default="fixed:0.005", help="Simulated inter-chunk latency for streams")
+    parser.add_argument("--scenarios", default="", help="Comma-separated scenario names (default: all)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cassette", default="", help="Replay recorded Gemini calls instead of the fake backend")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="Scale recorded timing (0 = no delays)")
+    parser.add_argument("--output", default="", help="Write JSON results to this file (default: stdout)")
+    parser.add_argument("--baseline", default="", help="Previous JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown vs baseline")
+    parser.add_argument("--verbose", action="store_true", help="Show agent logs (on stderr)")
+    args = parser.parse_args()
+
+    unknown = [n for n in args.scenarios.split(",") if n and n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)} (available: {', '.join(SCENARIOS)})")
+
+    results = asyncio.run(run_benchmarks(args))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        log(f"📄 Results written to {args.output}")
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            log(f"❌ Regression: {line}")
+        if regressions:
+            return 1
+        log("✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
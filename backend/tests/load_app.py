@@ -0,0 +1,601 @@
+"""
+Load Test - Ramp concurrent virtual users against one uvicorn worker running main.app.
+
+The worker runs in a subprocess with in-process stand-ins: the fake Gemini
+backend (services/fake_gemini.py) and an in-memory Supabase. Like the real
+Supabase client, it blocks the event loop on every call. The worker also
+samples its own event-loop lag and memory.
+
+Each virtual user loops over a weighted traffic mix:
+- plan:      POST /api/plan/generate-verified-with-history
+- tutor:     POST /api/tutor/stream (TTFB recorded)
+- quiz:      POST /api/quiz/generate, then POST /api/quiz/evaluate
+- autopilot: POST /api/autopilot/start, poll /status (answering questions), POST /stop
+
+Concurrency is ramped in stages. Each stage reports throughput, p50/p95/p99
+per endpoint, stream TTFB, worker loop lag and RSS. The run ends with an
+estimate of the single-worker saturation point.
+
+Usage (from backend/):
+    python -m tests.load_app run
+    python -m tests.load_app run --ramp 1,4,16,64 --stage-seconds 20 --latency lognormal:0.8,0.5
+    python -m tests.load_app run --mix plan=1,tutor=4,quiz=3,autopilot=1 --output load.json
+    python -m tests.load_app worker --port 8765   # just the instrumented worker
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import datetime
+import resource
+import subprocess
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+
+# --- In-memory Supabase stand-in ---
+
+class _Result:
+    def __init__(self, data: List[Dict[str, Any]]):
+        self.data = data
+
+
+class _Query:
+    """The subset of the postgrest query builder used by main.py, plan_cache and state_machine."""
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db = db
+        self.rows = db.tables.setdefault(table, [])
+        self.op = "select"
+        self.payload: Any = None
+        self.conflict: List[str] = []
+        self.filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self.order_by: Optional[tuple] = None
+        self.limit_n: Optional[int] = None
+        self.single_row = False
+
+    def select(self, columns: str = "*") -> "_Query":
+        self.op = "select"
+        return self
+
+    def insert(self, row: Any) -> "_Query":
+        self.op, self.payload = "insert", row
+        return self
+
+    def upsert(self, row: Any, on_conflict: str = "") -> "_Query":
+        self.op, self.payload = "upsert", row
+        self.conflict = [c.strip() for c in on_conflict.split(",") if c.strip()]
+        return self
+
+    def update(self, values: Dict[str, Any]) -> "_Query":
+        self.op, self.payload = "update", values
+        return self
+
+    def delete(self) -> "_Query":
+        self.op = "delete"
+        return self
+
+    def eq(self, column: str, value: Any) -> "_Query":
+        self.filters.append(lambda r: str(r.get(column)) == str(value))
+        return self
+
+    def gt(self, column: str, value: Any) -> "_Query":
+        self.filters.append(lambda r: r.get(column) is not None and r[column] > value)
+        return self
+
+    def lt(self, column: str, value: Any) -> "_Query":
+        self.filters.append(lambda r: r.get(column) is not None and r[column] < value)
+        return self
+
+    def order(self, column: str, desc: bool = False) -> "_Query":
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, n: int) -> "_Query":
+        self.limit_n = n
+        return self
+
+    def single(self) -> "_Query":
+        self.single_row = True
+        return self
+
+    def _matches(self) -> List[Dict[str, Any]]:
+        return [r for r in self.rows if all(f(r) for f in self.filters)]
+
+    def _new_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        row = dict(row)
+        row.setdefault("id", str(uuid.uuid4()))
+        row.setdefault("created_at", datetime.datetime.now(datetime.timezone.utc).isoformat())
+        return row
+
+    def execute(self) -> _Result:
+        if self.db.latency > 0:
+            time.sleep(self.db.latency)  # The real client is synchronous too
+        self.db.calls += 1
+
+        if self.op == "insert":
+            rows = self.payload if isinstance(self.payload, list) else [self.payload]
+            created = [self._new_row(r) for r in rows]
+            self.rows.extend(created)
+            return _Result(created)
+        if self.op == "upsert":
+            row = self._new_row(self.payload)
+            for existing in self.rows:
+                if self.conflict and all(str(existing.get(c)) == str(row.get(c)) for c in self.conflict):
+                    existing.update(self.payload)
+                    return _Result([existing])
+            self.rows.append(row)
+            return _Result([row])
+        if self.op == "update":
+            matched = self._matches()
+            for row in matched:
+                row.update(self.payload)
+            return _Result(matched)
+        if self.op == "delete":
+            matched = self._matches()
+            self.rows[:] = [r for r in self.rows if r not in matched]
+            return _Result(matched)
+
+        matched = self._matches()
+        if self.order_by:
+            column, desc = self.order_by
+            matched.sort(key=lambda r: str(r.get(column)), reverse=desc)
+        if self.limit_n is not None:
+            matched = matched[: self.limit_n]
+        if self.single_row:
+            return _Result(matched[0] if matched else None)
+        return _Result(matched)
+
+
+class FakeSupabase:
+    """In-memory tables with a fixed blocking latency per call."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.calls = 0
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+
+# --- Worker ---
+
+class LoopLagMonitor:
+    """Measures how late a periodic timer fires; lag means the loop was blocked or saturated."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: deque = deque(maxlen=20000)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+    def reset(self) -> None:
+        self.samples.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "samples": len(self.samples),
+            "p50_ms": _ms(_percentile(list(self.samples), 50)),
+            "p99_ms": _ms(_percentile(list(self.samples), 99)),
+            "max_ms": _ms(max(self.samples) if self.samples else None),
+        }
+
+
+def _rss_mb() -> Dict[str, Optional[float]]:
+    current = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    current = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB on Linux
+    return {"rss_mb": current, "peak_rss_mb": round(peak_kb / 1024, 1)}
+
+
+def run_worker(args: argparse.Namespace) -> None:
+    """Start main.app on one uvicorn worker with Gemini and Supabase stand-ins."""
+    os.environ["GEMINI_BACKEND"] = "fake"
+    os.environ["FAKE_GEMINI_LATENCY"] = args.latency
+    os.environ["FAKE_GEMINI_CHUNK_LATENCY"] = args.chunk_latency
+    os.environ["FAKE_GEMINI_STREAM_CHUNK_CHARS"] = str(args.chunk_chars)
+    # create_client() in main.py validates these at import; the stand-in replaces it right after
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.load-test")
+
+    import uvicorn
+    import main
+    from services.plan_cache import plan_cache
+    from agents import state_machine
+
+    db = FakeSupabase(latency=args.db_latency)
+    main.supabase = db
+    plan_cache._supabase, plan_cache._supabase_checked = db, True
+    state_machine.create_client = lambda url, key: db
+
+    monitor = LoopLagMonitor()
+
+    async def worker_stats():
+        from agents.autopilot_agent import _active_sessions
+        return {
+            "loop_lag": monitor.stats(),
+            **_rss_mb(),
+            "tasks": len(asyncio.all_tasks()),
+            "autopilot_sessions": len(_active_sessions),
+            "db_calls": db.calls,
+        }
+
+    async def worker_reset():
+        monitor.reset()
+        return {"ok": True}
+
+    main.app.add_api_route("/__load/worker", worker_stats, methods=["GET"])
+    main.app.add_api_route("/__load/reset", worker_reset, methods=["POST"])
+
+    async def _serve() -> None:
+        config = uvicorn.Config(main.app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+        lag_task = asyncio.create_task(monitor.run())
+        try:
+            await uvicorn.Server(config).serve()
+        finally:
+            lag_task.cancel()
+
+    asyncio.run(_serve())
+
+
+# --- Load Generation ---
+
+GOALS = [f"Score in the top {p}% in biology" for p in range(1, 21)]
+TOPICS = [f"Topic {n}" for n in range(1, 51)]
+SYLLABUS = "\n".join(f"- Unit {n}" for n in range(1, 13))
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return round(value * 1000, 2) if value is not None else None
+
+
+class Recorder:
+    """Latency, TTFB and error samples per endpoint for one stage."""
+
+    def __init__(self):
+        self.latency: Dict[str, List[float]] = {}
+        self.ttfb: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.statuses: Dict[str, int] = {}
+
+    def add(self, name: str, seconds: float, status: int, ttfb: Optional[float] = None) -> None:
+        self.latency.setdefault(name, []).append(seconds)
+        if ttfb is not None:
+            self.ttfb.setdefault(name, []).append(ttfb)
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        if status >= 400:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def fail(self, name: str) -> None:
+        self.errors[name] = self.errors.get(name, 0) + 1
+        self.statuses["transport_error"] = self.statuses.get("transport_error", 0) + 1
+
+    def requests(self) -> int:
+        return sum(len(v) for v in self.latency.values())
+
+    def summary(self) -> Dict[str, Any]:
+        endpoints = {}
+        for name, values in self.latency.items():
+            endpoints[name] = {
+                "count": len(values),
+                "errors": self.errors.get(name, 0),
+                "p50_ms": _ms(_percentile(values, 50)),
+                "p95_ms": _ms(_percentile(values, 95)),
+                "p99_ms": _ms(_percentile(values, 99)),
+            }
+            if name in self.ttfb:
+                endpoints[name]["ttfb_p50_ms"] = _ms(_percentile(self.ttfb[name], 50))
+                endpoints[name]["ttfb_p95_ms"] = _ms(_percentile(self.ttfb[name], 95))
+        all_latency = [v for values in self.latency.values() for v in values]
+        return {
+            "requests": self.requests(),
+            "errors": sum(self.errors.values()),
+            "statuses": dict(self.statuses),
+            "p50_ms": _ms(_percentile(all_latency, 50)),
+            "p95_ms": _ms(_percentile(all_latency, 95)),
+            "p99_ms": _ms(_percentile(all_latency, 99)),
+            "endpoints": endpoints,
+        }
+
+
+async def _call(
+    client: httpx.AsyncClient,
+    rec: Recorder,
+    name: str,
+    method: str,
+    url: str,
+    stream: bool = False,
+    **kwargs: Any,
+) -> Optional[httpx.Response]:
+    started = time.perf_counter()
+    try:
+        if stream:
+            async with client.stream(method, url, **kwargs) as response:
+                ttfb = None
+                async for _ in response.aiter_raw():
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - started
+                rec.add(name, time.perf_counter() - started, response.status_code, ttfb)
+                return response
+        response = await client.request(method, url, **kwargs)
+        rec.add(name, time.perf_counter() - started, response.status_code)
+        return response
+    except httpx.HTTPError:
+        rec.fail(name)
+        return None
+
+
+async def journey_plan(client: httpx.AsyncClient, rec: Recorder, rng: random.Random, args: argparse.Namespace) -> None:
+    await _call(client, rec, "plan.verified_with_history", "POST", "/api/plan/generate-verified-with-history", json={
+        "syllabus_text": SYLLABUS, "exam_type": "NEET", "goal": rng.choice(GOALS), "days": 7,
+    })
+
+
+async def journey_tutor(client: httpx.AsyncClient, rec: Recorder, rng: random.Random, args: argparse.Namespace) -> None:
+    await _call(client, rec, "tutor.stream", "POST", "/api/tutor/stream", stream=True, json={
+        "topic": rng.choice(TOPICS), "context": "NEET biology", "difficulty": "medium",
+    })
+
+
+async def journey_quiz(client: httpx.AsyncClient, rec: Recorder, rng: random.Random, args: argparse.Namespace) -> None:
+    topic = rng.choice(TOPICS)
+    response = await _call(client, rec, "quiz.generate", "POST", "/api/quiz/generate", json={
+        "topic": topic, "context": "NEET biology", "num_questions": 5, "difficulty": "medium",
+    })
+    if response is None or response.status_code != 200:
+        return
+    question = response.json()["questions"][0]
+    await _call(client, rec, "quiz.evaluate", "POST", "/api/quiz/evaluate", json={
+        "question_id": question["id"],
+        "question_text": question["text"],
+        "options": question["options"],
+        "correct_option_index": question["correct_option_index"],
+        "student_answer_index": rng.randrange(len(question["options"])),
+        "concept_tested": question["concept_tested"],
+        "topic_context": topic,
+    })
+
+
+async def journey_autopilot(client: httpx.AsyncClient, rec: Recorder, rng: random.Random, args: argparse.Namespace) -> None:
+    session_id = str(uuid.uuid4())
+    plan = {"schedule": [{"day": 1, "topics": [{"name": rng.choice(TOPICS)}, {"name": rng.choice(TOPICS)}]}]}
+    response = await _call(client, rec, "autopilot.start", "POST", "/api/autopilot/start",
+                           params={"session_id": session_id},
+                           json={"study_plan": plan, "exam_type": "NEET", "duration_minutes": 5})
+    if response is None or response.status_code != 200:
+        return
+    for _ in range(args.autopilot_polls):
+        await asyncio.sleep(args.poll_interval)
+        status = await _call(client, rec, "autopilot.status", "GET", f"/api/autopilot/status/{session_id}")
+        if status is not None and status.status_code == 200 and status.json().get("awaiting_input"):
+            await _call(client, rec, "autopilot.answer", "POST", f"/api/autopilot/answer/{session_id}",
+                        json={"answer_index": rng.randrange(4)})
+    await _call(client, rec, "autopilot.stop", "POST", f"/api/autopilot/stop/{session_id}")
+
+
+JOURNEYS = {
+    "plan": journey_plan,
+    "tutor": journey_tutor,
+    "quiz": journey_quiz,
+    "autopilot": journey_autopilot,
+}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in JOURNEYS:
+            raise ValueError(f"unknown journey {name!r} (available: {', '.join(JOURNEYS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+async def run_stage(base_url: str, users: int, args: argparse.Namespace, mix: Dict[str, float]) -> Dict[str, Any]:
+    rec = Recorder()
+    names, weights = list(mix), list(mix.values())
+    deadline = time.perf_counter() + args.stage_seconds
+    limits = httpx.Limits(max_connections=users * 2, max_keepalive_connections=users * 2)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        await _reset_worker(client)
+
+        async def _user(index: int) -> None:
+            rng = random.Random(args.seed * 100003 + users * 1009 + index)
+            while time.perf_counter() < deadline:
+                journey = JOURNEYS[rng.choices(names, weights)[0]]
+                await journey(client, rec, rng, args)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[_user(i) for i in range(users)])
+        wall = time.perf_counter() - started
+        worker = await _worker_stats(client)
+
+    summary = rec.summary()
+    return {
+        "users": users,
+        "seconds": round(wall, 2),
+        "throughput_rps": round(summary["requests"] / wall, 2) if wall else None,
+        **summary,
+        "worker": worker,
+    }
+
+
+async def _reset_worker(client: httpx.AsyncClient) -> None:
+    try:
+        await client.post("/__load/reset")
+    except httpx.HTTPError:
+        pass
+
+
+async def _worker_stats(client: httpx.AsyncClient) -> Optional[Dict[str, Any]]:
+    try:
+        response = await client.get("/__load/worker")
+        return response.json() if response.status_code == 200 else None
+    except httpx.HTTPError:
+        return None
+
+
+def find_saturation(stages: List[Dict[str, Any]], gain: float = 0.1) -> Optional[Dict[str, Any]]:
+    """
+    First stage after which adding users stops paying off: throughput grows
+    by less than `gain` while concurrency grows, or errors appear.
+    """
+    for previous, current in zip(stages, stages[1:]):
+        errors = current["errors"] / current["requests"] if current["requests"] else 1.0
+        if errors > 0.01 or (current["throughput_rps"] or 0) < (previous["throughput_rps"] or 0) * (1 + gain):
+            return {
+                "users": previous["users"],
+                "throughput_rps": previous["throughput_rps"],
+                "p95_ms": previous["p95_ms"],
+                "reason": "errors" if errors > 0.01 else "throughput plateau",
+            }
+    return None
+
+
+async def _wait_for_health(base_url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Worker at {base_url} did not become healthy")
+
+
+def log(message: str) -> None:
+    print(message, file=sys.stderr)
+
+
+async def run_load(args: argparse.Namespace) -> Dict[str, Any]:
+    mix = parse_mix(args.mix)
+    worker = None
+    base_url = args.target
+    if not base_url:
+        base_url = f"http://127.0.0.1:{args.port}"
+        worker = subprocess.Popen(
+            [sys.executable, "-m", "tests.load_app", "worker", "--port", str(args.port),
+             "--latency", args.latency, "--chunk-latency", args.chunk_latency,
+             "--chunk-chars", str(args.chunk_chars), "--db-latency", str(args.db_latency)],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stdout=None if args.verbose else subprocess.DEVNULL,
+        )
+    try:
+        await _wait_for_health(base_url)
+        stages = []
+        for users in [int(u) for u in args.ramp.split(",")]:
+            log(f"🚦 {users} users for {args.stage_seconds}s...")
+            stage = await run_stage(base_url, users, args, mix)
+            stages.append(stage)
+            w = stage["worker"] or {}
+            lag = w.get("loop_lag", {})
+            log(f"   {stage['throughput_rps']} req/s  p50 {stage['p50_ms']}ms  p95 {stage['p95_ms']}ms  "
+                f"p99 {stage['p99_ms']}ms  errors {stage['errors']}  "
+                f"loop lag p99 {lag.get('p99_ms')}ms  rss {w.get('rss_mb')}MB")
+            ttfb = stage["endpoints"].get("tutor.stream", {}).get("ttfb_p95_ms")
+            if ttfb is not None:
+                log(f"   tutor.stream ttfb p95 {ttfb}ms")
+    finally:
+        if worker is not None:
+            worker.terminate()
+            worker.wait(timeout=10)
+
+    saturation = find_saturation(stages)
+    if saturation:
+        log(f"📈 Saturation near {saturation['users']} users: {saturation['throughput_rps']} req/s, "
+            f"p95 {saturation['p95_ms']}ms ({saturation['reason']})")
+    else:
+        log("📈 No saturation within the ramp; extend --ramp")
+    return {
+        "meta": {
+            "target": base_url,
+            "mix": mix,
+            "latency": args.latency,
+            "chunk_latency": args.chunk_latency,
+            "db_latency": args.db_latency,
+            "stage_seconds": args.stage_seconds,
+            "seed": args.seed,
+        },
+        "stages": stages,
+        "saturation": saturation,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test main.app on a single worker.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def _stand_in_args(p: argparse.ArgumentParser) -> None:
+        p.add_argument("--port", type=int, default=8765)
+        p.add_argument("--latency", default="lognormal:0.5,0.4", help="Fake Gemini latency spec")
+        p.add_argument("--chunk-latency", default="fixed:0.03", help="Fake Gemini inter-chunk latency spec")
+        p.add_argument("--chunk-chars", type=int, default=48)
+        p.add_argument("--db-latency", type=float, default=0.01, help="Blocking seconds per Supabase call")
+
+    worker = sub.add_parser("worker", help="Run the instrumented worker only")
+    _stand_in_args(worker)
+
+    run = sub.add_parser("run", help="Spawn a worker (or use --target) and ramp load against it")
+    _stand_in_args(run)
+    run.add_argument("--target", default="", help="Existing base URL instead of spawning a worker")
+    run.add_argument("--ramp", default="1,2,4,8,16,32,64", help="Comma-separated concurrent users per stage")
+    run.add_argument("--stage-seconds", type=float, default=15)
+    run.add_argument("--mix", default="plan=1,tutor=4,quiz=3,autopilot=1")
+    run.add_argument("--autopilot-polls", type=int, default=10)
+    run.add_argument("--poll-interval", type=float, default=0.5)
+    run.add_argument("--timeout", type=float, default=60)
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--output", default="", help="Write JSON results to this file (default: stdout)")
+    run.add_argument("--verbose", action="store_true", help="Show worker logs")
+
+    args = parser.parse_args()
+    if args.command == "worker":
+        run_worker(args)
+        return 0
+
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    results = asyncio.run(run_load(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        log(f"📄 Results written to {args.output}")
+    else:
+        print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
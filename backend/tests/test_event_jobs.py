@@ -0,0 +1,162 @@
+"""
+Event job tests - replayable event logs and Last-Event-ID resumption.
+
+Usage (from backend/):
+    python -m pytest -q tests/test_event_jobs.py
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from services.event_jobs import EventJobRunner, parse_event_id
+
+
+def _pipeline(n=3, delay=0.01, fail_at=None, calls=None):
+    def factory():
+        async def gen():
+            if calls is not None:
+                calls.append(1)
+            for i in range(1, n + 1):
+                if i == fail_at:
+                    raise RuntimeError("model failed")
+                await asyncio.sleep(delay)
+                yield json.dumps({"type": "day", "day": i})
+        return gen()
+    return factory
+
+
+async def _read(runner, job, after=0):
+    return [(event_id, json.loads(line)) for event_id, line in [e async for e in runner.follow(job, after)]]
+
+
+@pytest.mark.parametrize("value, parsed", [
+    ("abc:5", ("abc", 5)),
+    ("7", (None, 7)),
+    ("abc:-3", ("abc", 0)),
+    ("abc:x", (None, 0)),
+    ("", (None, 0)),
+    (None, (None, 0)),
+])
+def test_parse_event_id(value, parsed):
+    assert parse_event_id(value) == parsed
+
+
+def test_events_carry_job_scoped_ids():
+    async def run():
+        runner = EventJobRunner("test")
+        job, started = runner.start("k", _pipeline())
+        return job, started, await _read(runner, job)
+
+    job, started, events = asyncio.run(run())
+    assert started
+    assert [event_id for event_id, _ in events] == [f"{job.id}:1", f"{job.id}:2", f"{job.id}:3"]
+    assert all(e["job_id"] == job.id and e["event_id"] == event_id for event_id, e in events)
+
+
+def test_identical_requests_share_the_running_job():
+    async def run():
+        runner = EventJobRunner("test")
+        calls = []
+        first, _ = runner.start("k", _pipeline(calls=calls))
+        second, started = runner.start("k", _pipeline(calls=calls))
+        both = await asyncio.gather(_read(runner, first), _read(runner, second))
+        return first is second, started, both, len(calls), runner.stats()
+
+    same, started, (a, b), calls, stats = asyncio.run(run())
+    assert same and not started
+    assert a == b and calls == 1
+
+
+def test_finished_job_is_replayed_only_by_id():
+    async def run():
+        runner = EventJobRunner("test")
+        calls = []
+        job, _ = runner.start("k", _pipeline(calls=calls))
+        await _read(runner, job)
+        # A new request with the same key starts over
+        fresh, fresh_started, _ = runner.attach("k", _pipeline(calls=calls))
+        await _read(runner, fresh)
+        # Naming the finished job replays the rest of its log without model calls
+        resumed, resumed_started, after = runner.attach("k", _pipeline(calls=calls), f"{job.id}:2")
+        rest = await _read(runner, resumed, after)
+        return job, fresh, fresh_started, resumed, resumed_started, rest, len(calls)
+
+    job, fresh, fresh_started, resumed, resumed_started, rest, calls = asyncio.run(run())
+    assert fresh is not job and fresh_started
+    assert resumed is job and not resumed_started
+    assert [event_id for event_id, _ in rest] == [f"{job.id}:3"]
+    assert calls == 2
+
+
+def test_last_event_id_of_another_request_is_ignored():
+    async def run():
+        runner = EventJobRunner("test")
+        other, _ = runner.start("other", _pipeline())
+        await _read(runner, other)
+        job, started, after = runner.attach("k", _pipeline(), f"{other.id}:2")
+        events = await _read(runner, job, after)
+        return other, job, started, after, events
+
+    other, job, started, after, events = asyncio.run(run())
+    assert job is not other and started and after == 0
+    assert events[0][0] == f"{job.id}:1"
+
+
+def test_resume_point_only_applies_to_the_named_job():
+    async def run():
+        runner = EventJobRunner("test")
+        job, _ = runner.start("k", _pipeline())
+        await _read(runner, job)
+        return job
+
+    job = asyncio.run(run())
+    assert EventJobRunner.resume_point(job, f"{job.id}:2") == 2
+    assert EventJobRunner.resume_point(job, "2") == 2
+    assert EventJobRunner.resume_point(job, "someotherjob:2") == 0
+    assert EventJobRunner.resume_point(job, None) == 0
+
+
+def test_failed_job_logs_an_error_and_is_not_rejoined():
+    async def run():
+        runner = EventJobRunner("test")
+        job, _ = runner.start("k", _pipeline(fail_at=2))
+        events = await _read(runner, job)
+        retry, started = runner.start("k", _pipeline())
+        await _read(runner, retry)
+        return job, events, retry, started, runner.stats()
+
+    job, events, retry, started, stats = asyncio.run(run())
+    assert job.status()["state"] == "failed"
+    assert [e["type"] for _, e in events] == ["day", "error"]
+    assert retry is not job and started
+    assert stats["failed"] == 1 and stats["completed"] == 1
+
+
+def test_reader_disconnect_does_not_cancel_the_job():
+    async def run():
+        runner = EventJobRunner("test")
+        job, _ = runner.start("k", _pipeline(n=5))
+        reader = runner.follow(job)
+        await reader.__anext__()
+        await reader.aclose()
+        await job.task
+        return job
+
+    job = asyncio.run(run())
+    assert job.done and job.error is None and len(job.events) == 5
+    assert job.subscribers == 0
+
+
+def test_expired_and_overflowing_jobs_are_purged():
+    async def run():
+        runner = EventJobRunner("test", max_retained=1)
+        first, _ = runner.start("a", _pipeline(n=1))
+        await first.task
+        second, _ = runner.start("b", _pipeline(n=1))
+        await second.task
+        return runner.get(first.id), runner.get(second.id)
+
+    first, second = asyncio.run(run())
+    assert first is None and second is not None
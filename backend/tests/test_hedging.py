@@ -0,0 +1,105 @@
+"""
+Hedging tests - racing a duplicate of slow short calls.
+
+Usage (from backend/):
+    python -m pytest -q tests/test_hedging.py
+"""
+
+import asyncio
+import itertools
+
+import pytest
+
+from services.hedging import Hedger
+from services.model_policy import model_telemetry
+
+_sites = itertools.count()
+
+
+def _site_with_history(hedger, seconds=0.02, samples=20):
+    """A fresh call site name with `samples` latencies of `seconds` and budget to hedge."""
+    agent = f"test.hedge{next(_sites)}"
+    for _ in range(samples):
+        model_telemetry.record_latency(agent, "m", seconds)
+        hedger._site(agent).budget.record_request()
+    return agent
+
+
+def _attempts(*plans):
+    """An attempt function whose n-th call sleeps, then returns or raises plans[n]."""
+    calls = iter(plans)
+
+    async def attempt():
+        delay, outcome = next(calls)
+        await asyncio.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return attempt
+
+
+def _hedger(**kwargs):
+    return Hedger(**{"enabled": True, "min_samples": 20, "min_delay": 0.01, **kwargs})
+
+
+def test_no_hedge_without_history():
+    hedger = _hedger()
+    result = asyncio.run(hedger.run("test.cold", "m", _attempts((0.05, "primary")), lambda r: True))
+    assert result == "primary"
+    assert hedger.stats()["call_sites"]["test.cold"]["fired"] == 0
+
+
+def test_slow_primary_loses_to_the_hedge():
+    hedger = _hedger()
+    agent = _site_with_history(hedger)
+    result = asyncio.run(hedger.run(agent, "m", _attempts((1.0, "primary"), (0.01, "hedge")), lambda r: True))
+    site = hedger.stats()["call_sites"][agent]
+    assert result == "hedge"
+    assert site["fired"] == 1 and site["won"] == 1
+
+
+def test_invalid_result_waits_for_a_valid_one():
+    hedger = _hedger()
+    agent = _site_with_history(hedger)
+    result = asyncio.run(hedger.run(agent, "m", _attempts((0.2, "good"), (0.01, "bad")), lambda r: r == "good"))
+    assert result == "good"
+
+
+def test_error_in_one_attempt_is_hidden_by_the_other():
+    hedger = _hedger()
+    agent = _site_with_history(hedger)
+    attempt = _attempts((0.1, "primary"), (0.01, RuntimeError("hedge")))
+    assert asyncio.run(hedger.run(agent, "m", attempt, lambda r: True)) == "primary"
+
+
+def test_both_failing_raises_the_first_error():
+    hedger = _hedger()
+    agent = _site_with_history(hedger)
+    attempt = _attempts((0.05, ValueError("primary")), (0.2, RuntimeError("hedge")))
+    with pytest.raises(ValueError):
+        asyncio.run(hedger.run(agent, "m", attempt, lambda r: True))
+
+
+def test_budget_denies_hedges():
+    hedger = _hedger()
+    agent = f"test.hedge{next(_sites)}"
+    for _ in range(20):
+        model_telemetry.record_latency(agent, "m", 0.02)
+
+    async def run():
+        # Two calls in the window allow 0.2 hedges: only the first slow call hedges
+        first = await hedger.run(agent, "m", _attempts((0.05, "primary"), (0.05, "hedge")), lambda r: True)
+        second = await hedger.run(agent, "m", _attempts((0.05, "primary")), lambda r: True)
+        return first, second
+
+    results = asyncio.run(run())
+    site = hedger.stats()["call_sites"][agent]
+    assert results == ("primary", "primary")
+    assert site["fired"] == 1 and site["budget_denied"] == 1
+
+
+def test_disabled_hedger_runs_once():
+    hedger = _hedger(enabled=False)
+    agent = _site_with_history(hedger)
+    assert asyncio.run(hedger.run(agent, "m", _attempts((0.05, "primary")), lambda r: True)) == "primary"
@@ -0,0 +1,124 @@
+"""
+Job queue tests - bounded pool, FIFO queueing, cancellation and shutdown.
+
+Usage (from backend/):
+    python -m pytest -q tests/test_job_queue.py
+"""
+
+import asyncio
+
+import pytest
+
+import main
+from services.job_queue import JobQueue, JobState, MemoryJobStore, QueueFullError
+
+
+def _queue(**kwargs):
+    return JobQueue(store=MemoryJobStore(), **{"concurrency": 1, **kwargs})
+
+
+def _job(result="done", delay=0.01, error=None):
+    async def factory():
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return result
+    return factory
+
+
+def test_jobs_run_in_order_within_the_pool_limit():
+    async def run():
+        queue = _queue(concurrency=2)
+        records = [await queue.submit("test", _job(i, delay=0.02)) for i in range(4)]
+        positions = [queue.position(r.job_id) for r in records]
+        finals = [await queue.wait(r.job_id) for r in records]
+        return positions, finals, queue.stats()
+
+    positions, finals, stats = asyncio.run(run())
+    # Two start at once; the others wait their turn
+    assert positions == [None, None, 1, 2]
+    assert [r.result for r in finals] == [0, 1, 2, 3]
+    assert all(r.state == JobState.SUCCEEDED for r in finals)
+    assert stats["succeeded"] == 4 and stats["running"] == 0
+
+
+def test_failed_job_keeps_status_and_detail():
+    class Unavailable(Exception):
+        status_code = 503
+        detail = "model overloaded"
+        headers = {"Retry-After": "5"}
+
+    async def run():
+        queue = _queue()
+        record = await queue.submit("test", _job(error=Unavailable()))
+        return await queue.wait(record.job_id)
+
+    record = asyncio.run(run())
+    assert record.state == JobState.FAILED
+    assert record.error == {"status_code": 503, "detail": "model overloaded", "headers": {"Retry-After": "5"}}
+
+
+def test_full_queue_rejects_submissions():
+    async def run():
+        queue = _queue(max_queued=1)
+        await queue.submit("test", _job(delay=1))  # Running
+        await queue.submit("test", _job())         # Queued
+        with pytest.raises(QueueFullError):
+            await queue.submit("test", _job())
+        stats = queue.stats()
+        await queue.close()
+        return stats
+
+    assert asyncio.run(run())["rejected"] == 1
+
+
+def test_cancel_queued_and_running_jobs():
+    async def run():
+        queue = _queue()
+        running = await queue.submit("test", _job(delay=10))
+        queued = await queue.submit("test", _job(delay=10))
+        await asyncio.sleep(0.01)
+        await queue.cancel(queued.job_id)
+        await queue.cancel(running.job_id)
+        stored = await queue.store.load(queued.job_id)
+        return running, queued, stored, queue.stats()
+
+    running, queued, stored, stats = asyncio.run(run())
+    assert running.state == queued.state == JobState.CANCELLED
+    assert stored.state == JobState.CANCELLED
+    assert stats["cancelled"] == 2 and stats["running"] == 0 and stats["queued"] == 0
+
+
+def test_close_finishes_queued_jobs_as_cancelled():
+    async def run():
+        queue = _queue()
+        running = await queue.submit("test", _job(delay=10))
+        queued = await queue.submit("test", _job(delay=10))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(queue.wait(queued.job_id))
+        await queue.close()
+        # A waiter on a job that never started still returns
+        final = await asyncio.wait_for(waiter, 1)
+        stored = [await queue.store.load(r.job_id) for r in (running, queued)]
+        return final, stored, queue.stats()
+
+    final, stored, stats = asyncio.run(run())
+    assert final.state == JobState.CANCELLED and final.finished_at is not None
+    assert [r.state for r in stored] == [JobState.CANCELLED, JobState.CANCELLED]
+    assert stats["cancelled"] == 2
+
+
+def test_client_disconnect_cancels_the_job(monkeypatch):
+    async def run():
+        queue = _queue()
+        monkeypatch.setattr(main, "job_queue", queue)
+        record = await queue.submit("test", _job(delay=10))
+        request = asyncio.create_task(main._wait_for_job(record))
+        await asyncio.sleep(0.01)
+        request.cancel()  # What Starlette does when the client goes away
+        await asyncio.gather(request, return_exceptions=True)
+        return await queue.get(record.job_id), queue.stats()
+
+    record, stats = asyncio.run(run())
+    assert record.state == JobState.CANCELLED
+    assert stats["running"] == 0 and stats["cancelled"] == 1
@@ -0,0 +1,66 @@
+"""
+JSON stream tests - array items pulled out of a streamed JSON document.
+
+Usage (from backend/):
+    python -m pytest -q tests/test_json_stream.py
+"""
+
+import json
+
+import pytest
+
+from services.json_stream import ArrayItemStream
+
+PLAN = {
+    "exam_name": "NEET \"UG\" {2026}",
+    "critical_topics": [{"name": "not a day"}],
+    "meta": {"schedule": [{"day": 0}]},
+    "schedule": [
+        {"day": 1, "theme": "Braces } and [ in text", "topics": [{"name": "Kinematics"}], "estimated_hours": 4},
+        {"day": 2, "theme": "Escapes \\\" \\\\ done", "topics": [], "estimated_hours": 3.5},
+        {"day": 3, "theme": "Unicode é", "topics": [{"name": "Optics", "tags": ["a", {"b": []}]}], "estimated_hours": 5},
+    ],
+    "overview": "after",
+}
+
+
+def _feed_all(text, size):
+    stream = ArrayItemStream("schedule")
+    items = []
+    for i in range(0, len(text), size):
+        items.extend(stream.feed(text[i:i + size]))
+    return stream, items
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 64, 10 ** 6])
+def test_items_match_the_final_document_for_any_slicing(size):
+    text = json.dumps(PLAN, ensure_ascii=False, indent=1)
+    stream, items = _feed_all(text, size)
+    assert items == PLAN["schedule"]
+    assert stream.done and stream.items_seen == 3
+    assert stream.text == text
+
+
+def test_items_arrive_as_soon_as_they_close():
+    text = json.dumps(PLAN)
+    first_close = text.index('"estimated_hours": 4}') + len('"estimated_hours": 4}')
+    stream = ArrayItemStream("schedule")
+    assert stream.feed(text[:first_close - 1]) == []
+    assert [d["day"] for d in stream.feed(text[first_close - 1:first_close])] == [1]
+    assert not stream.done
+    assert [d["day"] for d in stream.feed(text[first_close:])] == [2, 3]
+    assert stream.done
+
+
+def test_only_the_top_level_key_counts():
+    # "schedule" nested under "meta" and other arrays of objects are ignored
+    stream, items = _feed_all(json.dumps({"meta": {"schedule": [{"day": 0}]}, "days": [{"day": 9}]}), 5)
+    assert items == [] and not stream.done
+
+
+def test_truncated_document_yields_only_closed_items():
+    text = json.dumps(PLAN)
+    cut = text.index('{"day": 3')
+    stream, items = _feed_all(text[:cut + 20], 3)
+    assert [d["day"] for d in items] == [1, 2]
+    assert not stream.done
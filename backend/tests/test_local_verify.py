@@ -0,0 +1,112 @@
+"""
+Local plan verifier tests - mechanical checks, coverage hints and when the model auditor runs.
+
+Usage (from backend/):
+    python -m pytest -q tests/test_local_verify.py
+"""
+
+import asyncio
+
+import agents.plan_agent as plan_agent
+from agents.plan_agent import DailyPlan, PlanVerification, StudyPlan, Topic, local_verify_plan
+from router import SYLLABI_REGISTRY
+
+PHYSICS = SYLLABI_REGISTRY["neet"]["physics"]
+PHYSICS_TOPICS = [line[2:] for line in PHYSICS.splitlines() if line.startswith("- ")]
+
+
+def _plan(topic_days, hours=4.0, total_days=None):
+    schedule = [
+        DailyPlan(
+            day=i + 1,
+            theme=f"Day {i + 1}",
+            topics=[Topic(name=t, difficulty="medium", rationale="core") for t in topics],
+            estimated_hours=hours,
+        )
+        for i, topics in enumerate(topic_days)
+    ]
+    return StudyPlan(
+        exam_name="NEET", total_days=total_days or len(schedule), overview="", schedule=schedule, critical_topics=[],
+    )
+
+
+def _full_physics_plan():
+    # Four registry topics a day covers the whole syllabus in five days
+    return _plan([PHYSICS_TOPICS[i:i + 4] for i in range(0, len(PHYSICS_TOPICS), 4)])
+
+
+def test_full_plan_passes():
+    check = local_verify_plan(_full_physics_plan(), PHYSICS, 5)
+    assert check.passed
+    assert check.missing_topics == []
+    assert check.registry_topics == len(PHYSICS_TOPICS)
+
+
+def test_mechanical_failures():
+    plan = _plan([["Kinematics", "Kinematics"], ["Optics"]], hours=9, total_days=3)
+    check = local_verify_plan(plan, PHYSICS, 5)
+    assert not check.passed
+    assert len(check.schedule_issues) == 2  # Wrong length, and total_days disagrees with the schedule
+    assert check.overloaded_days == [1, 2]
+    assert check.duplicate_topics == ["Kinematics"]
+    verification = check.to_verification()
+    assert not verification.is_valid and verification.overloaded_days == [1, 2]
+    assert "scheduled twice" in verification.critique
+
+    plan.schedule[1].day = 5
+    plan.total_days = 2
+    assert local_verify_plan(plan, PHYSICS, 2).schedule_issues == ["Days are not numbered 1, 2, 3... in order."]
+
+
+def test_missing_topics_are_hints_not_failures():
+    plan = _plan([PHYSICS_TOPICS[:4]])
+    check = local_verify_plan(plan, PHYSICS, 1)
+    assert check.passed
+    assert "Optics" in check.missing_topics and "Kinematics" not in check.missing_topics
+    assert check.to_verification().missing_topics == []
+
+
+def test_catalog_matches_misspelled_and_reworded_topics():
+    plan = _plan([["Kinemtics", "Newton laws of motion"] + PHYSICS_TOPICS[3:]])
+    missing = local_verify_plan(plan, PHYSICS, 1).missing_topics
+    assert missing == ["Physical World and Measurement"]
+
+
+def test_free_text_syllabus_is_not_checked_for_coverage():
+    check = local_verify_plan(_plan([["Data structures"]]), "University CS syllabus: graphs, trees", 1)
+    assert check.passed and check.registry_topics == 0 and check.missing_topics == []
+
+
+def _run_verify(monkeypatch, plan, mode):
+    audits = []
+
+    async def fake_audit(plan, syllabus_text, exam_type, changed_days, previous, hints):
+        audits.append(hints)
+        return PlanVerification(is_valid=True, missing_topics=[], overloaded_days=[], prerequisite_issues=[], critique="ok")
+
+    monkeypatch.setattr(plan_agent, "verify_study_plan", fake_audit)
+    monkeypatch.setattr(plan_agent, "PLAN_LOCAL_VERIFY", True)
+    monkeypatch.setattr(plan_agent, "PLAN_LLM_VERIFY", mode)
+    verification, decided_by = asyncio.run(
+        plan_agent._verify_plan(plan, PHYSICS, "NEET", plan.total_days, None, None)
+    )
+    return verification, decided_by, audits
+
+
+def test_mechanical_failure_skips_the_model(monkeypatch):
+    plan = _plan([["Kinematics"]], hours=12)
+    verification, decided_by, audits = _run_verify(monkeypatch, plan, "required")
+    assert decided_by == "local" and not verification.is_valid and audits == []
+
+
+def test_coverage_gaps_go_to_the_model_as_hints(monkeypatch):
+    verification, decided_by, audits = _run_verify(monkeypatch, _plan([PHYSICS_TOPICS[:4]]), "optional")
+    assert decided_by == "model" and verification.is_valid
+    assert "Optics" in audits[0]
+
+
+def test_optional_audit_is_skipped_for_a_clean_plan(monkeypatch):
+    verification, decided_by, audits = _run_verify(monkeypatch, _full_physics_plan(), "optional")
+    assert decided_by == "local" and verification.is_valid and audits == []
+    _, decided_by, audits = _run_verify(monkeypatch, _full_physics_plan(), "required")
+    assert decided_by == "model" and audits == [[]]
@@ -0,0 +1,97 @@
+"""
+Model policy tests - task-class model ladders, escalation reasons and latency windows.
+
+Usage (from backend/):
+    python -m pytest -q tests/test_model_policy.py
+"""
+
+import asyncio
+from typing import Optional
+
+from pydantic import BaseModel
+
+import services.genai_service as genai_service
+from services.model_policy import (
+    CALL_SITE_TASKS,
+    GEMINI_FLASH_MODEL,
+    GEMINI_PRO_MODEL,
+    LatencyWindow,
+    ModelTelemetry,
+    models_for,
+    rejection_reason,
+)
+
+
+class Decision(BaseModel):
+    label: str
+    confidence: Optional[float] = None
+
+
+def test_models_for_uses_the_task_ladder():
+    assert CALL_SITE_TASKS["router.route_request"] == "classify"
+    assert models_for("router.route_request", "big") == list(dict.fromkeys([GEMINI_FLASH_MODEL, GEMINI_PRO_MODEL]))
+    # Call sites without a task class keep their own model
+    assert models_for("tutor.stream", "big") == ["big"]
+
+
+def test_rejection_reason():
+    assert rejection_reason(None) == "parse_failed"
+    assert rejection_reason(Decision(label="a", confidence=0.2), min_confidence=0.6) == "low_confidence"
+    assert rejection_reason(Decision(label="a", confidence=0.9), accept=lambda d: d.label == "b") == "rejected"
+    assert rejection_reason(Decision(label="a", confidence=0.9)) is None
+    # Schemas without a confidence field are judged on parsing and `accept` only
+    assert rejection_reason(Decision(label="a")) is None
+
+
+def test_latency_window_percentiles_and_bound():
+    window = LatencyWindow(size=5)
+    assert window.percentile(50) is None
+    for seconds in [5, 1, 2, 3, 4, 0.1]:
+        window.add(seconds)
+    assert window.count == 6 and len(window.samples) == 5
+    assert window.percentile(0) == 0.1
+    assert window.percentile(50) == 2
+    assert window.percentile(100) == 4
+
+
+def test_telemetry_reports_escalation_rate():
+    telemetry = ModelTelemetry()
+    for _ in range(4):
+        telemetry.record_call("quiz.evaluate_answer")
+    telemetry.record_escalation("quiz.evaluate_answer", "flash", "low_confidence")
+    telemetry.record_latency("quiz.evaluate_answer", "flash", 0.2)
+    site = telemetry.stats()["call_sites"]["quiz.evaluate_answer"]
+    assert site["escalations"] == {"low_confidence": 1}
+    assert site["escalation_rate"] == 0.25
+    assert site["models"]["flash"]["p50_ms"] == 200.0
+
+
+def test_generate_structured_escalates_weak_answers(monkeypatch):
+    answers = {"small": Decision(label="a", confidence=0.1), "large": Decision(label="b", confidence=0.9)}
+    tried = []
+
+    async def fake_structured_on(model, *args):
+        tried.append(model)
+        return answers[model]
+
+    monkeypatch.setattr(genai_service, "_structured_on", fake_structured_on)
+    monkeypatch.setattr(genai_service, "models_for", lambda agent, model: ["small", "large"])
+
+    result = asyncio.run(genai_service.generate_structured("prompt", Decision, model="large", agent="test.escalate"))
+    assert tried == ["small", "large"]
+    assert result.label == "b"
+
+
+def test_generate_structured_stops_at_the_first_good_answer(monkeypatch):
+    tried = []
+
+    async def fake_structured_on(model, *args):
+        tried.append(model)
+        return Decision(label="a", confidence=0.95)
+
+    monkeypatch.setattr(genai_service, "_structured_on", fake_structured_on)
+    monkeypatch.setattr(genai_service, "models_for", lambda agent, model: ["small", "large"])
+
+    result = asyncio.run(genai_service.generate_structured("prompt", Decision, model="large", agent="test.escalate"))
+    assert tried == ["small"]
+    assert result.label == "a"
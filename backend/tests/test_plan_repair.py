@@ -0,0 +1,93 @@
+"""
+Plan repair tests - picking the days a patch may edit and applying the patch.
+
+Usage (from backend/):
+    python -m pytest -q tests/test_plan_repair.py
+"""
+
+from agents.plan_agent import (
+    DailyPlan,
+    PlanPatch,
+    PlanVerification,
+    StudyPlan,
+    Topic,
+    _apply_patch,
+    _repair_targets,
+)
+
+
+def _day(n, topics, hours=4.0):
+    return DailyPlan(
+        day=n,
+        theme=f"Day {n}",
+        topics=[Topic(name=t, difficulty="medium", rationale="core") for t in topics],
+        estimated_hours=hours,
+    )
+
+
+def _plan(days):
+    return StudyPlan(exam_name="NEET", total_days=len(days), overview="", schedule=days, critical_topics=[])
+
+
+def _verification(**issues):
+    return PlanVerification(**{
+        "is_valid": False, "missing_topics": [], "overloaded_days": [], "prerequisite_issues": [], "critique": "fix",
+        **issues,
+    })
+
+
+PLAN = _plan([
+    _day(1, ["Kinematics"], 3),
+    _day(2, ["Laws of Motion"], 9),
+    _day(3, ["Gravitation"], 2),
+    _day(4, ["Optics"], 5),
+    _day(5, ["Thermodynamics"], 6),
+    _day(6, ["Electrostatics"], 4),
+])
+
+
+def test_apply_patch_replaces_only_editable_changed_days():
+    patch = PlanPatch(
+        updated_days=[
+            _day(2, ["Laws of Motion"], 6),   # Changed and editable
+            _day(3, ["Gravitation"], 2),      # Editable but identical
+            _day(4, ["Atoms and Nuclei"], 5), # Changed but not editable
+        ],
+        summary="split day 2",
+    )
+    patched, changed = _apply_patch(PLAN, patch, editable=[2, 3])
+    assert changed == [2]
+    assert patched.schedule[1].estimated_hours == 6
+    assert patched.schedule[3].topics[0].name == "Optics"
+    # The original plan is left untouched
+    assert PLAN.schedule[1].estimated_hours == 9
+
+
+def test_apply_patch_without_changes_returns_the_same_plan():
+    patch = PlanPatch(updated_days=[_day(3, ["Gravitation"], 2)], summary="no-op")
+    patched, changed = _apply_patch(PLAN, patch, editable=[3])
+    assert patched is PLAN and changed == []
+
+
+def test_repair_targets_overloaded_and_missing_topics():
+    targets = _repair_targets(PLAN, _verification(overloaded_days=[2], missing_topics=["Electronic Devices"]))
+    # Day 2 must shrink; the lightest other day takes the missing topic
+    assert targets == [2, 3]
+
+
+def test_repair_targets_prerequisite_issue_names_its_days():
+    issue = "Thermodynamics is scheduled before Kinematics"
+    assert _repair_targets(PLAN, _verification(prerequisite_issues=[issue])) == [1, 5]
+
+
+def test_repair_targets_fall_back_to_full_regeneration():
+    # Nothing structured to fix
+    assert _repair_targets(PLAN, _verification()) is None
+    # An issue that names no scheduled topic
+    assert _repair_targets(PLAN, _verification(prerequisite_issues=["Revise more"])) is None
+    # Schedule shape is wrong: patches cannot add or renumber days
+    broken = _plan(PLAN.schedule[:5])
+    broken.total_days = 6
+    assert _repair_targets(broken, _verification(overloaded_days=[2])) is None
+    # Too many days to patch (more than half the plan)
+    assert _repair_targets(PLAN, _verification(overloaded_days=[1, 2, 3, 4])) is None
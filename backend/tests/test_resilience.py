@@ -0,0 +1,164 @@
+"""
+Resilience tests - error classification, jittered backoff, retry budget and circuit breaker.
+
+Usage (from backend/):
+    python -m pytest -q tests/test_resilience.py
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+from google.genai import errors as genai_errors
+
+from services.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ErrorKind,
+    Resilience,
+    RetryBudget,
+    classify_error,
+    is_transient,
+    retry_after_seconds,
+)
+
+
+def _api_error(code, headers=None):
+    response = httpx.Response(code, headers=headers or {}, request=httpx.Request("POST", "http://gemini"))
+    cls = genai_errors.ServerError if code >= 500 else genai_errors.ClientError
+    return cls(code, {}, response)
+
+
+@pytest.mark.parametrize("exc, kind", [
+    (_api_error(429), ErrorKind.RATE_LIMITED),
+    (_api_error(503), ErrorKind.OVERLOADED),
+    (_api_error(504), ErrorKind.TIMEOUT),
+    (_api_error(500), ErrorKind.SERVER),
+    (_api_error(400), ErrorKind.CLIENT),
+    (httpx.ReadTimeout("slow"), ErrorKind.TIMEOUT),
+    (asyncio.TimeoutError(), ErrorKind.TIMEOUT),
+    (httpx.ConnectError("reset"), ErrorKind.NETWORK),
+    (ConnectionResetError(), ErrorKind.NETWORK),
+    (CircuitOpenError("m", 1.0), ErrorKind.CIRCUIT_OPEN),
+    (ValueError("bad json"), ErrorKind.OTHER),
+])
+def test_classify_error(exc, kind):
+    assert classify_error(exc) == kind
+
+
+def test_transient_errors_and_retry_after():
+    assert is_transient(_api_error(429)) and is_transient(CircuitOpenError("m", 2.0))
+    assert not is_transient(_api_error(400)) and not is_transient(ValueError())
+    assert retry_after_seconds(_api_error(429, {"retry-after": "3"})) == 3.0
+    assert retry_after_seconds(_api_error(429, {"retry-after": "soon"})) is None
+    assert retry_after_seconds(CircuitOpenError("m", 2.5)) == 2.5
+
+
+def test_next_delay_is_jittered_capped_and_honors_retry_after():
+    def policy():
+        # A fresh policy per sample so the retry budget never runs out
+        return Resilience(max_attempts=10, base_delay=0.5, max_delay=4.0, deadline_seconds=1000)
+
+    delays = [policy().next_delay("m", "a", _api_error(503), 1, 2.0, 0.0) for _ in range(50)]
+    assert all(0.5 <= d <= 4.0 for d in delays)
+    assert len(set(delays)) > 1
+    hinted = policy().next_delay("m", "a", _api_error(429, {"retry-after": "3"}), 1, 0.5, 0.0)
+    assert hinted >= 3.0
+    # Retry-After is still bounded by max_delay
+    assert policy().next_delay("m", "a", _api_error(429, {"retry-after": "60"}), 1, 0.5, 0.0) == 4.0
+
+
+def test_next_delay_gives_up():
+    policy = Resilience(max_attempts=3, base_delay=0.5, max_delay=4.0, deadline_seconds=5)
+    assert policy.next_delay("m", "a", _api_error(400), 1, 0.5, 0.0) is None
+    assert policy.next_delay("m", "a", _api_error(503), 3, 0.5, 0.0) is None
+    assert policy.next_delay("m", "a", _api_error(503), 1, 0.5, 4.9) is None
+    assert policy.stats()["deadline_exceeded"] == 1
+
+
+def test_retry_budget_caps_retries_relative_to_requests():
+    budget = RetryBudget(ratio=0.5, min_per_second=0.0, window_seconds=60)
+    for _ in range(4):
+        budget.record_request()
+    assert [budget.try_withdraw() for _ in range(3)] == [True, True, False]
+    floor = RetryBudget(ratio=0.0, min_per_second=0.1, window_seconds=10)
+    assert floor.try_withdraw() and not floor.try_withdraw()
+
+
+def test_breaker_opens_probes_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.allow() is None
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.allow() > 0
+    time.sleep(0.06)
+    assert breaker.allow() is None and breaker.state == "half_open"
+    # Only one probe at a time
+    assert breaker.allow() is not None
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.times_opened == 2
+    time.sleep(0.06)
+    assert breaker.allow() is None
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow() is None
+
+
+def test_call_retries_transient_failures_then_succeeds():
+    async def run():
+        policy = Resilience(max_attempts=4, base_delay=0.001, max_delay=0.005, deadline_seconds=1)
+        attempts = 0
+
+        async def fn():
+            nonlocal attempts
+            attempts += 1
+            if attempts < 3:
+                raise _api_error(503)
+            return "ok"
+
+        return await policy.call("m", "agent", fn), attempts, policy.stats()
+
+    result, attempts, stats = asyncio.run(run())
+    assert (result, attempts) == ("ok", 3)
+    assert stats["retries"] == {"agent": 2}
+    assert stats["breakers"]["m"]["state"] == "closed"
+
+
+def test_call_does_not_retry_client_errors():
+    async def run():
+        policy = Resilience(max_attempts=4, base_delay=0.001)
+        attempts = 0
+
+        async def fn():
+            nonlocal attempts
+            attempts += 1
+            raise _api_error(400)
+
+        with pytest.raises(genai_errors.ClientError):
+            await policy.call("m", "agent", fn)
+        return attempts
+
+    assert asyncio.run(run()) == 1
+
+
+def test_open_breaker_short_circuits_without_calling_upstream():
+    async def run():
+        policy = Resilience(max_attempts=1)
+        breaker = policy._breaker("m")
+        breaker.failure_threshold = 1
+        calls = 0
+
+        async def fn():
+            nonlocal calls
+            calls += 1
+            raise _api_error(503)
+
+        with pytest.raises(genai_errors.ServerError):
+            await policy.call("m", "agent", fn)
+        with pytest.raises(CircuitOpenError):
+            await policy.call("m", "agent", fn)
+        return calls, policy.stats()
+
+    calls, stats = asyncio.run(run())
+    assert calls == 1
+    assert stats["short_circuits"] == {"agent": 1}
@@ -0,0 +1,119 @@
+"""
+Response cache tests - cache keys, the memory LRU and the SQLite tier.
+
+Usage (from backend/):
+    python -m pytest -q tests/test_response_cache.py
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from pydantic import BaseModel
+
+from services.response_cache import ResponseCache, _DiskTier, make_cache_key
+
+
+class Answer(BaseModel):
+    text: str
+    tags: List[str] = []
+
+
+class Other(BaseModel):
+    text: str
+    score: int = 0
+
+
+def test_cache_key_covers_model_prompt_and_schema():
+    key = make_cache_key("flash", "prompt", Answer)
+    assert key == make_cache_key("flash", "prompt", Answer)
+    assert len({key, make_cache_key("pro", "prompt", Answer), make_cache_key("flash", "prompt!", Answer),
+                make_cache_key("flash", "prompt", Other)}) == 4
+
+
+def test_memory_tier_lru_and_ttl():
+    async def run():
+        cache = ResponseCache(enabled=True, max_entries=2, disk_path=None)
+        for name in ("a", "b"):
+            await cache.set(name, Answer(text=name), "agent")
+        await cache.get("a", Answer, "agent")      # "b" is now least recently used
+        await cache.set("c", Answer(text="c"), "agent")
+        kept = [await cache.get(k, Answer, "agent") for k in ("a", "b", "c")]
+        await cache.set("short", Answer(text="s"), "agent", ttl=-1)
+        return kept + [await cache.get("short", Answer, "agent")], cache.stats()
+
+    (a, b, c, short), stats = asyncio.run(run())
+    assert a.text == "a" and b is None and c.text == "c" and short is None
+    assert stats["by_agent"]["agent"]["stores"] == 4
+
+
+def test_disabled_cache_stores_nothing():
+    async def run():
+        cache = ResponseCache(enabled=False, disk_path=None)
+        await cache.set("k", Answer(text="x"), "agent")
+        return await cache.get("k", Answer, "agent")
+
+    assert asyncio.run(run()) is None
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    path = str(tmp_path / "responses.db")
+
+    async def run():
+        await ResponseCache(enabled=True, disk_path=path).set("k", Answer(text="kept", tags=["x"]), "agent")
+        restarted = ResponseCache(enabled=True, disk_path=path)
+        first = await restarted.get("k", Answer, "agent")
+        second = await restarted.get("k", Answer, "agent")
+        return first, second, restarted.stats()["by_agent"]["agent"]
+
+    first, second, stats = asyncio.run(run())
+    assert first == second == Answer(text="kept", tags=["x"])
+    # The first read comes from disk and is promoted to memory
+    assert stats["disk_hits"] == 1 and stats["memory_hits"] == 1
+
+
+def test_disk_tier_expiry_and_size_bound(tmp_path):
+    disk = _DiskTier(str(tmp_path / "responses.db"), max_bytes=250)
+    disk.set("old", "agent", "x" * 100, ttl=60)
+    disk.set("expired", "agent", "y", ttl=-1)
+    assert disk.get("expired") is None
+    time.sleep(0.01)
+    disk.get("old")  # Touch so "mid" is the least recently used
+    disk.set("mid", "agent", "m" * 100, ttl=60)
+    time.sleep(0.01)
+    disk.get("old")
+    disk.set("new", "agent", "n" * 100, ttl=60)
+    assert disk.get("mid") is None
+    assert disk.get("old") is not None and disk.get("new") is not None
+
+
+def test_disk_tier_is_safe_under_concurrent_threads(tmp_path):
+    disk = _DiskTier(str(tmp_path / "responses.db"), max_bytes=10 ** 6)
+
+    def worker(n):
+        for i in range(50):
+            key = f"k{(n * 7 + i) % 40}"
+            disk.set(key, "agent", f"value-{n}-{i}", ttl=60)
+            row = disk.get(key)
+            assert row is None or row[0].startswith("value-")
+        return n
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        assert sorted(pool.map(worker, range(16))) == list(range(16))
+    assert all(disk.get(f"k{i}") is not None for i in range(40))
+
+
+def test_concurrent_async_access_through_to_thread(tmp_path):
+    async def run():
+        cache = ResponseCache(enabled=True, disk_path=str(tmp_path / "responses.db"))
+
+        async def one(i):
+            await cache.set(f"k{i % 10}", Answer(text=str(i)), "agent")
+            cache._memory.clear()  # Force the next read to the disk tier
+            return await cache.get(f"k{i % 10}", Answer, "agent")
+
+        return await asyncio.gather(*(one(i) for i in range(100)))
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, Answer) for r in results)
@@ -0,0 +1,88 @@
+"""
+Router tests - the local scope classifier and the model router fallback.
+
+Usage (from backend/):
+    python -m pytest -q tests/test_router.py
+"""
+
+import asyncio
+
+import pytest
+
+import router
+from router import local_classifier
+
+
+@pytest.mark.parametrize("goal, context, exam, subject, sub", [
+    ("NEET biology 7 days", None, "neet", "Biology", None),
+    ("I want to score 650+ in NEET and master Organic Chemistry", "neet", "neet", "Chemistry", "Organic"),
+    ("Crack JEE Advanced in 90 days", "jee", "jee", "General", None),
+    ("UPSC prelims polity in 2 weeks", None, "upsc", "Polity", None),
+    ("cat quant revision", None, "cat", "Quant", None),
+    ("IIT JEE physics", None, "jee", "Physics", None),
+    # Topic-only goals are placed by the trained model
+    ("Help me revise kinematics and laws of motion", "neet", "neet", "Physics", None),
+    ("quiz me on genetics", "neet", "neet", "Biology", None),
+    ("Mughals and Delhi Sultanate", "upsc", "upsc", "History", None),
+    ("hydrocarbons and polymers", "neet", "neet", "Chemistry", "Organic"),
+])
+def test_confident_local_routes(goal, context, exam, subject, sub):
+    decision = local_classifier.classify(goal, context)
+    assert decision.confidence >= router.ROUTER_LOCAL_MIN_CONFIDENCE
+    assert (decision.exam.value, decision.scope.subject, decision.scope.sub_subject) == (exam, subject, sub)
+
+
+@pytest.mark.parametrize("goal, context", [
+    ("thermodynamics", "neet"),                 # Physics and physical chemistry both teach it
+    ("physics and chemistry revision", "neet"),  # Several subjects
+    ("JEE but also NEET biology", None),         # Conflicting exams
+    ("organic farming for upsc", None),          # No UPSC topic
+    ("prepare for my exam", None),
+    # Ambiguous aliases outside an exam-prep context
+    ("my cat keeps me up at night", None),
+    ("qa testing career", None),
+    ("talk to an IIT professor", None),
+])
+def test_unsure_goals_go_to_the_model(goal, context):
+    assert local_classifier.classify(goal, context).confidence < router.ROUTER_LOCAL_MIN_CONFIDENCE
+
+
+def test_probabilities_are_a_distribution_over_the_exam():
+    ranked = local_classifier.probabilities("kinematics", "neet")
+    assert abs(sum(p for p, _ in ranked) - 1.0) < 1e-9
+    assert all(label[0] == "neet" for _, label in ranked)
+    assert ranked[0][1] == ("neet", "physics", None)
+    assert local_classifier.probabilities("mughals", "neet") == []
+
+
+def test_model_router_result_is_memoized(monkeypatch):
+    calls = []
+
+    async def fake_model(prompt, schema, **kwargs):
+        calls.append(prompt)
+        return router.RouteDecision(
+            intent=router.Intent.PLAN, exam=router.ExamType.NEET,
+            scope=router.SubjectScope(subject="Physics"), confidence=0.9, needs_clarification=False,
+        )
+
+    monkeypatch.setattr(router, "generate_structured", fake_model)
+    monkeypatch.setattr(router, "_route_memo", router.OrderedDict())
+    goal = "thermodynamics deep dive"
+    assert router.route_needs_model(goal, "neet")
+    first = asyncio.run(router.route_request(goal, "neet"))
+    second = asyncio.run(router.route_request(goal, "neet"))
+    assert len(calls) == 1
+    assert first == second and first is not second
+    assert not router.route_needs_model(goal, "neet")
+
+
+def test_model_router_failure_falls_back_to_the_local_route(monkeypatch):
+    async def no_answer(prompt, schema, **kwargs):
+        return None
+
+    monkeypatch.setattr(router, "generate_structured", no_answer)
+    monkeypatch.setattr(router, "_route_memo", router.OrderedDict())
+    decision = asyncio.run(router.route_request("physics and chemistry revision", "neet"))
+    assert decision.exam.value == "neet" and decision.scope.subject == "General"
+    # Not memoized, so the next request asks the model again
+    assert router.route_needs_model("physics and chemistry revision", "neet")
@@ -0,0 +1,139 @@
+"""
+Scheduler tests - priority lanes, concurrency caps and token buckets.
+
+Usage (from backend/):
+    python -m pytest -q tests/test_scheduler.py
+"""
+
+import asyncio
+import time
+
+from services.scheduler import (
+    GEMINI_OUTPUT_TOKEN_RESERVE,
+    Lane,
+    ModelScheduler,
+    TokenBucket,
+    _LaneStats,
+    estimate_tokens,
+    lane_for,
+    run_in_lane,
+)
+
+
+def _scheduler(concurrency=1, rpm=0, tpm=0):
+    return ModelScheduler("m", concurrency, rpm, tpm, {lane: _LaneStats() for lane in Lane})
+
+
+def test_lane_for_uses_longest_prefix_and_override():
+    assert lane_for("tutor.stream") == Lane.INTERACTIVE
+    assert lane_for("quiz") == Lane.EVALUATION
+    assert lane_for("plan.verify") == Lane.PLANNING
+    # Only whole dotted segments match
+    assert lane_for("tutorial.x") == Lane.PLANNING
+    with run_in_lane(Lane.BACKGROUND):
+        assert lane_for("tutor.stream") == Lane.BACKGROUND
+    assert lane_for("tutor.stream") == Lane.INTERACTIVE
+
+
+def test_estimate_tokens_adds_output_reserve():
+    assert estimate_tokens(400) == 100 + GEMINI_OUTPUT_TOKEN_RESERVE
+
+
+def test_token_bucket_waits_refills_and_adjusts():
+    bucket = TokenBucket(60)  # One token per second
+    assert bucket.wait_time(60) == 0.0
+    bucket.take(60)
+    assert 0.9 < bucket.wait_time(1) <= 1.0
+    # Oversized requests wait for a full bucket rather than forever
+    assert bucket.wait_time(1000) <= 60.0
+    bucket.adjust(-30)  # Refund an overestimate
+    assert bucket.wait_time(30) == 0.0
+    bucket.tokens, bucket.updated = 0.0, time.monotonic() - 2
+    assert bucket.wait_time(2) == 0.0
+
+    unlimited = TokenBucket(0)
+    unlimited.take(10 ** 9)
+    assert unlimited.unlimited and unlimited.wait_time(10 ** 9) == 0.0
+
+
+def test_higher_priority_lane_is_served_first():
+    async def run():
+        scheduler = _scheduler(concurrency=1)
+        await scheduler.acquire(Lane.PLANNING, 1)  # Hold the only slot
+        order = []
+
+        async def call(lane, name):
+            await scheduler.acquire(lane, 1)
+            order.append(name)
+            scheduler.release(1, None)
+
+        tasks = [
+            asyncio.create_task(call(Lane.BACKGROUND, "autopilot")),
+            asyncio.create_task(call(Lane.PLANNING, "plan")),
+            asyncio.create_task(call(Lane.INTERACTIVE, "tutor")),
+        ]
+        await asyncio.sleep(0)
+        scheduler.release(1, None)
+        await asyncio.gather(*tasks)
+        return order, scheduler.stats()
+
+    order, stats = asyncio.run(run())
+    assert order == ["tutor", "plan", "autopilot"]
+    assert stats["in_flight"] == 0 and stats["queued"] == 0
+
+
+def test_concurrency_cap_is_respected():
+    async def run():
+        scheduler = _scheduler(concurrency=2)
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            await scheduler.acquire(Lane.PLANNING, 1)
+            peak = max(peak, scheduler.in_flight)
+            await asyncio.sleep(0.01)
+            scheduler.release(1, None)
+
+        await asyncio.gather(*(call() for _ in range(6)))
+        return peak
+
+    assert asyncio.run(run()) == 2
+
+
+def test_cancelled_waiter_does_not_hold_a_slot():
+    async def run():
+        scheduler = _scheduler(concurrency=1)
+        await scheduler.acquire(Lane.PLANNING, 1)
+        queued = asyncio.create_task(scheduler.acquire(Lane.PLANNING, 1))
+        await asyncio.sleep(0)
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        scheduler.release(1, None)
+        await asyncio.wait_for(scheduler.acquire(Lane.INTERACTIVE, 1), 1)
+        return scheduler.stats(), scheduler._lane_stats[Lane.PLANNING].queued
+
+    stats, planning_queued = asyncio.run(run())
+    assert stats["in_flight"] == 1 and stats["queued"] == 0
+    assert planning_queued == 0
+
+
+def test_request_bucket_delays_the_head_of_line():
+    async def run():
+        scheduler = _scheduler(concurrency=10, rpm=600)  # Ten per second
+        scheduler.requests.tokens = 0.0
+        start = time.monotonic()
+        await scheduler.acquire(Lane.INTERACTIVE, 1)
+        return time.monotonic() - start
+
+    waited = asyncio.run(run())
+    assert 0.05 <= waited < 0.5
+
+
+def test_token_usage_is_reconciled_on_release():
+    async def run():
+        scheduler = _scheduler(concurrency=1, tpm=1000)
+        await scheduler.acquire(Lane.PLANNING, 600)
+        scheduler.release(600, 100)  # Used far less than reserved
+        return scheduler.tokens.tokens
+
+    assert asyncio.run(run()) > 850
@@ -0,0 +1,121 @@
+"""
+SingleFlight tests - coalescing of identical in-flight calls.
+
+Usage (from backend/):
+    python -m pytest -q tests/test_single_flight.py
+"""
+
+import asyncio
+
+from services.genai_service import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    async def run():
+        flight = SingleFlight()
+        calls = 0
+
+        async def fn():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "plan"
+
+        results = await asyncio.gather(*(flight.do("k", fn) for _ in range(5)))
+        return calls, results, flight.stats()
+
+    calls, results, stats = asyncio.run(run())
+    assert calls == 1
+    assert [r for r, _ in results] == ["plan"] * 5
+    assert sorted(shared for _, shared in results) == [False] + [True] * 4
+    assert stats["upstream_calls"] == 1 and stats["coalesced_calls"] == 4
+    assert stats["in_flight"] == 0
+
+
+def test_different_keys_and_later_calls_run_separately():
+    async def run():
+        flight = SingleFlight()
+        calls = []
+
+        async def fn(key):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return key
+
+        await asyncio.gather(flight.do("a", lambda: fn("a")), flight.do("b", lambda: fn("b")))
+        # A finished call is not reused
+        await flight.do("a", lambda: fn("a"))
+        return calls
+
+    assert sorted(asyncio.run(run())) == ["a", "a", "b"]
+
+
+def test_errors_reach_every_waiter():
+    async def run():
+        flight = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        return await asyncio.gather(flight.do("k", fn), flight.do("k", fn), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_cancelled_waiter_leaves_the_call_running_for_others():
+    async def run():
+        flight = SingleFlight()
+        started = asyncio.Event()
+
+        async def fn():
+            started.set()
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        first = asyncio.create_task(flight.do("k", fn))
+        await started.wait()
+        second = asyncio.create_task(flight.do("k", fn))
+        await asyncio.sleep(0)
+        first.cancel()
+        result = await second
+        return first.cancelled(), result, flight.stats()
+
+    first_cancelled, result, stats = asyncio.run(run())
+    assert first_cancelled
+    assert result == ("ok", True)
+    assert stats["abandoned_calls"] == 0
+
+
+def test_call_is_cancelled_when_the_last_waiter_leaves():
+    async def run():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        upstream_cancelled = asyncio.Event()
+
+        async def fn():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                upstream_cancelled.set()
+                raise
+
+        waiters = [asyncio.create_task(flight.do("k", fn)) for _ in range(2)]
+        await started.wait()
+        for task in waiters:
+            task.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.wait_for(upstream_cancelled.wait(), 1)
+
+        # The next caller starts a fresh call rather than joining the abandoned one
+        async def fresh():
+            return "fresh"
+
+        return await flight.do("k", fresh), flight.stats()
+
+    result, stats = asyncio.run(run())
+    assert result == ("fresh", False)
+    assert stats["abandoned_calls"] == 1
+    assert stats["upstream_calls"] == 2
@@ -0,0 +1,107 @@
+"""
+Stream fan-out tests - one upstream stream shared by many subscribers.
+
+Usage (from backend/):
+    python -m pytest -q tests/test_stream_fanout.py
+"""
+
+import asyncio
+
+import pytest
+
+from services.stream_fanout import StreamMultiplexer
+
+
+def _upstream(chunks, delay=0.01, calls=None, fail_after=None):
+    def factory():
+        async def gen():
+            if calls is not None:
+                calls.append(1)
+            for i, chunk in enumerate(chunks):
+                if fail_after is not None and i == fail_after:
+                    raise RuntimeError("upstream broke")
+                await asyncio.sleep(delay)
+                yield chunk
+        return gen()
+    return factory
+
+
+async def _collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def test_concurrent_subscribers_share_one_upstream():
+    async def run():
+        mux = StreamMultiplexer()
+        calls = []
+        factory = _upstream(["a", "b", "c"], calls=calls)
+        results = await asyncio.gather(*(_collect(mux.subscribe("q", factory)) for _ in range(3)))
+        return calls, results, mux.stats()
+
+    calls, results, stats = asyncio.run(run())
+    assert len(calls) == 1
+    assert results == [["a", "b", "c"]] * 3
+    assert stats["upstream_streams"] == 1 and stats["live_joins"] == 2
+
+
+def test_late_joiner_replays_the_buffered_prefix():
+    async def run():
+        mux = StreamMultiplexer()
+        factory = _upstream(["a", "b", "c", "d"], delay=0.02)
+        first = mux.subscribe("q", factory)
+        head = [await first.__anext__(), await first.__anext__()]
+        late = await _collect(mux.subscribe("q", factory))
+        rest = await _collect(first)
+        return head + rest, late
+
+    full, late = asyncio.run(run())
+    assert full == late == ["a", "b", "c", "d"]
+
+
+def test_finished_stream_is_replayed_within_retention_only():
+    async def run():
+        calls = []
+        factory = _upstream(["x"], delay=0, calls=calls)
+        retained = StreamMultiplexer(retain_seconds=60)
+        await _collect(retained.subscribe("q", factory))
+        replay = await _collect(retained.subscribe("q", factory))
+        expired = StreamMultiplexer(retain_seconds=0)
+        await _collect(expired.subscribe("q", factory))
+        await asyncio.sleep(0.01)
+        await _collect(expired.subscribe("q", factory))
+        return replay, retained.stats()["replays"], len(calls)
+
+    replay, replays, calls = asyncio.run(run())
+    assert replay == ["x"]
+    assert replays == 1
+    # One upstream for the retained multiplexer, two for the one with no retention
+    assert calls == 3
+
+
+def test_failed_stream_raises_and_is_not_replayed():
+    async def run():
+        mux = StreamMultiplexer()
+        calls = []
+        failing = _upstream(["a", "b"], calls=calls, fail_after=1)
+        with pytest.raises(RuntimeError):
+            await _collect(mux.subscribe("q", failing))
+        again = await _collect(mux.subscribe("q", _upstream(["ok"], calls=calls)))
+        return again, len(calls)
+
+    again, calls = asyncio.run(run())
+    assert again == ["ok"]
+    assert calls == 2
+
+
+def test_upstream_is_cancelled_when_every_subscriber_leaves():
+    async def run():
+        mux = StreamMultiplexer()
+        stream = mux.subscribe("q", _upstream(["a"] * 100, delay=0.01))
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0.02)
+        return mux.stats()
+
+    stats = asyncio.run(run())
+    assert stats["abandoned"] == 1
+    assert stats["live_streams"] == 0 and stats["retained_streams"] == 0
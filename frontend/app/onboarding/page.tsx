@@ -119,95 +119,128 @@ export default function OnboardingPage() {
     try {
       const syllabusText = SYLLABI[examType] || SYLLABI.neet;
       
-      const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL || 'http://localhost:8000'}/api/plan/stream-verified`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          syllabus_text: syllabusText,
-          exam_type: examType,
-          goal: goal,
-          days: days,
-        }),
-      });
+      const apiBase = process.env.NEXT_PUBLIC_API_BASE_URL || 'http://localhost:8000';
+      // Generation runs as a server-side job: after a dropped connection we
+      // resume it from the last event received instead of starting over
+      let jobId: string | null = null;
+      let lastEventId = '';
+      let jobError: string | null = null;
+      let completed = false;
 
-      if (!response.ok) {
-        throw new Error(`Server error: ${response.status}`);
-      }
+      for (let attempt = 0; !completed; attempt++) {
+        try {
+          const response = jobId
+            ? await fetch(`${apiBase}/api/plan/jobs/${jobId}/events?format=ndjson`, {
+                headers: { 'Last-Event-ID': lastEventId },
+              })
+            : await fetch(`${apiBase}/api/plan/stream-verified`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                  syllabus_text: syllabusText,
+                  exam_type: examType,
+                  goal: goal,
+                  days: days,
+                }),
+              });
 
-      const reader = response.body?.getReader();
-      if (!reader) throw new Error("No reader available");
+          if (!response.ok) {
+            throw new Error(`Server error: ${response.status}`);
+          }
 
-      const decoder = new TextDecoder();
-      let buffer = "";
+          const reader = response.body?.getReader();
+          if (!reader) throw new Error("No reader available");
 
-      while (true) {
-        const { done, value } = await reader.read();
-        if (done) break;
+          const decoder = new TextDecoder();
+          let buffer = "";
 
-        buffer += decoder.decode(value, { stream: true });
-        const lines = buffer.split("\n");
-        buffer = lines.pop() || ""; // Keep incomplete line
+          while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
 
-        for (const line of lines) {
-          if (!line.trim()) continue;
-          try {
-            const data = JSON.parse(line);
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split("\n");
+            buffer = lines.pop() || ""; // Keep incomplete line
+
+            for (const line of lines) {
+              if (!line.trim()) continue;
+              try {
+                const data = JSON.parse(line);
+                if (data.event_id) lastEventId = data.event_id;
+                if (data.job_id) jobId = data.job_id;
             
-            if (data.type === 'status') {
-              setAnalyzeStatus(data.message);
-            } else if (data.type === 'draft') {
-              // Add new version entry
-              setVerificationSteps(prev => {
-                // Check if version already exists to avoid duplicates
-                if (prev.find(v => v.version === data.version)) return prev;
-                return [...prev, { version: data.version, status: 'verifying' }];
-              });
-              setCurrentPhase('verifying');
-            } else if (data.type === 'verification') {
-              // Update verification result
-              setVerificationSteps(prev => prev.map(v => {
-                if (v.version === data.version) {
-                  const isValid = data.result.is_valid;
-                  return {
-                    ...v,
-                    status: isValid ? 'passed' : 'failed',
-                    critique: data.result.critique,
-                    missingTopics: data.result.missing_topics
-                  };
-                }
-                return v;
-              }));
+                if (data.type === 'error') {
+                  jobError = data.message;
+                } else if (data.type === 'status') {
+                  setAnalyzeStatus(data.message);
+                } else if (data.type === 'day') {
+                  // Draft days stream in before the full plan is ready
+                  setAnalyzeStatus(`Drafted day ${data.day.day}: ${data.day.theme}`);
+                } else if (data.type === 'draft') {
+                  // Add new version entry
+                  setVerificationSteps(prev => {
+                    // Check if version already exists to avoid duplicates
+                    if (prev.find(v => v.version === data.version)) return prev;
+                    return [...prev, { version: data.version, status: 'verifying' }];
+                  });
+                  setCurrentPhase('verifying');
+                } else if (data.type === 'verification') {
+                  // Update verification result
+                  setVerificationSteps(prev => prev.map(v => {
+                    if (v.version === data.version) {
+                      const isValid = data.result.is_valid;
+                      return {
+                        ...v,
+                        status: isValid ? 'passed' : 'failed',
+                        critique: data.result.critique,
+                        missingTopics: data.result.missing_topics
+                      };
+                    }
+                    return v;
+                  }));
               
-              if (!data.result.is_valid) {
-                 setCurrentPhase('fixing');
-                 setAnalyzeStatus("AI is fixing the plan based on critique...");
-                 // Ensure next version placeholder is added soon by 'draft' event
-              } else {
-                 setCurrentPhase('complete');
-              }
-            } else if (data.type === 'complete') {
-              setAnalyzeStatus("Plan verified successfully!");
-              const result = data.final_result;
+                  if (!data.result.is_valid) {
+                     setCurrentPhase('fixing');
+                     setAnalyzeStatus("AI is fixing the plan based on critique...");
+                     // Ensure next version placeholder is added soon by 'draft' event
+                  } else {
+                     setCurrentPhase('complete');
+                  }
+                } else if (data.type === 'complete') {
+                  completed = true;
+                  setAnalyzeStatus("Plan verified successfully!");
+                  const result = data.final_result;
+              
+                  // Store plan
+                  if (result.final_plan) {
+                    localStorage.setItem("studyPlan", JSON.stringify(result.final_plan));
+                    localStorage.setItem("examType", examType);
+                    localStorage.setItem("goal", goal);
+                    localStorage.setItem("days", days.toString());
+                    if (result.versions) {
+                      localStorage.setItem("planVersions", JSON.stringify(result.versions));
+                    }
+                  }
               
-              // Store plan
-              if (result.final_plan) {
-                localStorage.setItem("studyPlan", JSON.stringify(result.final_plan));
-                localStorage.setItem("examType", examType);
-                localStorage.setItem("goal", goal);
-                localStorage.setItem("days", days.toString());
-                if (result.versions) {
-                  localStorage.setItem("planVersions", JSON.stringify(result.versions));
+                  // Redirect
+                  setTimeout(() => {
+                    router.push("/plan");
+                  }, 1000);
                 }
+              } catch (e) {
+                console.error("Stream parse error", e);
               }
-              
-              // Redirect
-              setTimeout(() => {
-                router.push("/plan");
-              }, 1000);
             }
-          } catch (e) {
-            console.error("Stream parse error", e);
           }
+          if (jobError) throw new Error(jobError);
+          if (!completed) throw new Error("Connection lost");
+        } catch (err) {
+          // Retry only dropped connections of a job we can resume
+          if (jobError || !jobId || attempt >= 3 || (err instanceof Error && err.message.startsWith("Server error"))) {
+            throw err;
+          }
+          setAnalyzeStatus("Connection lost, reconnecting...");
+          await new Promise(resolve => setTimeout(resolve, 1000 * (attempt + 1)));
         }
       }
 